@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark the character chunker against the token chunker
+
+Extracts the text of each PDF (or reads each .txt file) given, chunks it
+with both chunkers and reports per chunker: chunk count, tokens per chunk
+(min / mean / max), total tokens sent for embedding (overlap included),
+embedding requests and chunking time. With --embed the chunks are also
+embedded through the OpenAI API (needs OPENAI_API_KEY; this costs tokens)
+and the embedding time is reported as well.
+
+Usage:
+    python benchmark_chunking.py policies/
+    python benchmark_chunking.py a.pdf b.pdf --chunk-tokens 256 --overlap-tokens 48
+    python benchmark_chunking.py policies/ --embed
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Dict, List
+import numpy as np
+import tiktoken
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.pdf_processor import PDFProcessor
+from services.token_chunker import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, split_into_token_chunks
+from services.embedding_batcher import EmbeddingBatcher
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+def load_corpus(paths: List[str]) -> Dict[str, str]:
+    """Text of every .pdf and .txt file in paths (directories are searched recursively)"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names))
+        else:
+            files.append(path)
+
+    processor = PDFProcessor()
+    corpus = {}
+    for file in files:
+        extension = os.path.splitext(file)[1].lower()
+        if extension == ".pdf":
+            corpus[file] = processor.extract_text(file)
+        elif extension == ".txt":
+            with open(file, "r", encoding="utf-8") as f:
+                corpus[file] = f.read()
+    return corpus
+
+def benchmark(name: str, chunk, corpus: Dict[str, str], batcher: EmbeddingBatcher, embed: bool) -> dict:
+    chunk_ms = 0.0
+    texts = []
+    for text in corpus.values():
+        started = time.perf_counter()
+        chunks = chunk(text)
+        chunk_ms += (time.perf_counter() - started) * 1000
+        texts.extend(c["text"] for c in chunks)
+
+    token_counts = np.array([len(tokens) for tokens in batcher.prepare(texts)] or [0])
+    result = {
+        "name": name,
+        "chunks": len(texts),
+        "min_tokens": int(token_counts.min()),
+        "mean_tokens": float(token_counts.mean()),
+        "max_tokens": int(token_counts.max()),
+        "total_tokens": int(token_counts.sum()),
+        "requests": len(batcher.plan_batches(token_counts.tolist())) if texts else 0,
+        "chunk_ms": chunk_ms,
+        "embed_ms": None
+    }
+
+    if embed and texts:
+        started = time.perf_counter()
+        asyncio.run(batcher.embed(texts, owner="benchmark"))
+        result["embed_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the character chunker against the token chunker")
+    parser.add_argument("paths", nargs="+", help="PDF or .txt files, or directories of them")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Characters per chunk (character chunker)")
+    parser.add_argument("--overlap", type=int, default=200, help="Character overlap (character chunker)")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS)
+    parser.add_argument("--overlap-tokens", type=int, default=CHUNK_OVERLAP_TOKENS)
+    parser.add_argument("--embed", action="store_true", help="Also embed the chunks with the OpenAI API")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.paths)
+    if not corpus:
+        parser.error("no .pdf or .txt files found")
+
+    encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+    client = None
+    if args.embed:
+        from openai import OpenAI
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    batcher = EmbeddingBatcher(client, EMBEDDING_MODEL, encoding=encoding)
+
+    processor = PDFProcessor()
+    chunkers = [
+        (f"characters {args.chunk_size}/{args.overlap}", lambda text: processor.split_into_chunks(text, args.chunk_size, args.overlap)),
+        (f"tokens {args.chunk_tokens}/{args.overlap_tokens}", lambda text: split_into_token_chunks(text, encoding, args.chunk_tokens, args.overlap_tokens))
+    ]
+
+    characters = sum(len(text) for text in corpus.values())
+    print("🚀 PolicyPal AI Service - Chunking Benchmark")
+    print(f"📄 {len(corpus)} documents, {characters:,} characters")
+    print("=" * 96)
+    print(f"{'chunker':<18} {'chunks':>7} {'min tok':>8} {'mean tok':>9} {'max tok':>8} {'embed tok':>10} {'requests':>9} {'chunk ms':>9} {'embed ms':>9}")
+
+    for name, chunk in chunkers:
+        result = benchmark(name, chunk, corpus, batcher, args.embed)
+        embed_ms = f"{result['embed_ms']:>9.0f}" if result["embed_ms"] is not None else f"{'-':>9}"
+        print(
+            f"{result['name']:<18} {result['chunks']:>7} {result['min_tokens']:>8} {result['mean_tokens']:>9.1f} "
+            f"{result['max_tokens']:>8} {result['total_tokens']:>10,} {result['requests']:>9} {result['chunk_ms']:>9.1f} {embed_ms}"
+        )
+
+if __name__ == "__main__":
+    main()
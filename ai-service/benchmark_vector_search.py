@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark exact vs binary-quantized vector search
+
+Generates synthetic 1536-dimension embeddings shaped like ada-002 output
+(a shared offset direction plus topic clusters), then reports per-query
+latency of both paths and recall@k of the quantized path against exact search.
+Queries are chunks pushed away by a random direction of norm --query-noise
+(0.5 gives a best match around 0.9 cosine, 1.0 around 0.7).
+
+Usage:
+    python benchmark_vector_search.py
+    python benchmark_vector_search.py --sizes 2000 10000 50000 --queries 200
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.vector_index import build_embedding_matrix, score_top_k
+from services.quantization import quantize_matrix, score_top_k_quantized
+
+def make_embeddings(count: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    """Synthetic embeddings: common offset + one of count/50 topics + noise"""
+    topics = max(1, count // 50)
+    offset = rng.normal(size=dim).astype(np.float32) * 2.0
+    centers = rng.normal(size=(topics, dim)).astype(np.float32)
+    assignments = rng.integers(topics, size=count)
+    noise = rng.normal(size=(count, dim)).astype(np.float32) * 0.9
+    return build_embedding_matrix(offset + centers[assignments] + noise)
+
+def benchmark(count: int, dim: int, queries: int, k: int, rerank: int, noise: float, rng: np.random.Generator) -> dict:
+    matrix = make_embeddings(count, dim, rng)
+
+    started = time.perf_counter()
+    quantized = quantize_matrix(matrix)
+    quantize_ms = (time.perf_counter() - started) * 1000
+
+    # Queries are perturbed chunks, like a question paraphrasing a clause
+    picks = rng.integers(count, size=queries)
+    directions = build_embedding_matrix(rng.normal(size=(queries, dim)).astype(np.float32))
+    query_vectors = matrix[picks] + directions * noise
+
+    started = time.perf_counter()
+    exact = [score_top_k(matrix, query, k)[0] for query in query_vectors]
+    exact_ms = (time.perf_counter() - started) * 1000 / queries
+
+    started = time.perf_counter()
+    approx = [score_top_k_quantized(matrix, quantized, query, k, rerank)[0] for query in query_vectors]
+    quantized_ms = (time.perf_counter() - started) * 1000 / queries
+
+    recall = np.mean([len(set(a) & set(e)) / k for a, e in zip(approx, exact)])
+    return {
+        "count": count,
+        "exact_ms": exact_ms,
+        "quantized_ms": quantized_ms,
+        "recall": recall,
+        "quantize_ms": quantize_ms,
+        "float_mb": matrix.nbytes / 1024 / 1024,
+        "codes_mb": quantized.nbytes / 1024 / 1024
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark exact vs binary-quantized vector search")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 10000, 50000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rerank", type=int, default=200, help="Candidates re-scored exactly")
+    parser.add_argument("--query-noise", type=float, default=0.75)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    print("🚀 PolicyPal AI Service - Vector Search Benchmark")
+    print("=" * 78)
+    print(f"{'chunks':>8} {'exact ms':>10} {'binary ms':>10} {'speedup':>8} {f'recall@{args.k}':>10} {'float MB':>9} {'codes MB':>9} {'build ms':>9}")
+
+    for count in args.sizes:
+        result = benchmark(count, args.dim, args.queries, args.k, args.rerank, args.query_noise, rng)
+        print(
+            f"{result['count']:>8} {result['exact_ms']:>10.2f} {result['quantized_ms']:>10.2f} "
+            f"{result['exact_ms'] / result['quantized_ms']:>7.2f}x {result['recall']:>10.3f} "
+            f"{result['float_mb']:>9.1f} {result['codes_mb']:>9.1f} {result['quantize_ms']:>9.0f}"
+        )
+
+if __name__ == "__main__":
+    main()
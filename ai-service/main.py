@@ -3,8 +3,9 @@ import os
 import asyncio
 from datetime import datetime
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Form, Query
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from contextlib import asynccontextmanager
@@ -28,7 +29,10 @@ from services.database import DatabaseService
 from services.dlp_service import DLPService, DLPScanResult
 from services.privacy_service import PrivacyService, PrivacyImpactAssessment
 from services.cache import cache
-from models.schemas import PolicyDocument, QuestionRequest, AnswerResponse, ComplianceRequest, ComplianceResponse
+from services.ingest_jobs import IngestJobWorker
+from services.extraction_pool import PDFExtractionError, PDFExtractionTimeout, PDFPageLimitError, pdf_extraction_pool
+from services.upload_spool import PDF_MAX_SIZE_BYTES, SpooledUpload, UploadTooLargeError, spool_upload, upload_size_error
+from models.schemas import PolicyDocument, QuestionRequest, AnswerResponse, ComplianceRequest, ComplianceResponse, BatchQuestionRequest, BatchAnswerItem, IngestJobResponse
 
 # Initialize services
 pdf_processor = PDFProcessor()
@@ -36,11 +40,14 @@ ai_service = AIService()
 db_service = DatabaseService()
 dlp_service = DLPService()
 privacy_service = PrivacyService()
+ingest_worker = IngestJobWorker(db_service, ai_service, pdf_extraction_pool)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
     # Startup
+    # Worker processes are forked before the database client starts its threads
+    pdf_extraction_pool.start()
     await db_service.connect()
     print("✅ Connected to MongoDB")
     print("🚀 PolicyPal AI Service started successfully!")
@@ -48,12 +55,36 @@ async def lifespan(app: FastAPI):
     # Start cache cleanup task
     asyncio.create_task(periodic_cache_cleanup())
     
+    # Convert legacy array embeddings to the compact binary format in the background
+    if os.getenv("EMBEDDING_MIGRATION_ENABLED", "true").lower() == "true":
+        asyncio.create_task(db_service.migrate_embedding_storage())
+    
+    # Run queued ingest jobs, including ones interrupted by a previous shutdown
+    if os.getenv("INGEST_WORKER_ENABLED", "true").lower() == "true":
+        asyncio.create_task(ingest_worker.run())
+    
     yield
     
     # Shutdown
+    await ingest_worker.stop()
+    pdf_extraction_pool.shutdown()
     await db_service.close()
     print("🛑 PolicyPal AI Service shutdown complete")
 
+def pdf_extraction_http_error(error: PDFExtractionError) -> HTTPException:
+    if isinstance(error, PDFPageLimitError):
+        return HTTPException(status_code=413, detail=str(error))
+    if isinstance(error, PDFExtractionTimeout):
+        return HTTPException(status_code=504, detail=str(error))
+    return HTTPException(status_code=422, detail=str(error))
+
+async def extract_pdf_text(path: str) -> str:
+    """Extract text in the worker pool, mapping its errors to HTTP responses"""
+    try:
+        return await pdf_extraction_pool.extract_text(path)
+    except PDFExtractionError as e:
+        raise pdf_extraction_http_error(e)
+
 async def periodic_cache_cleanup():
     """Clean up expired cache entries every 5 minutes"""
     while True:
@@ -81,6 +112,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Endpoints that take a PDF upload, and the room multipart framing and form fields take next to the file
+PDF_UPLOAD_PATHS = {"/upload-policy", "/ingest-jobs", "/compliance/check-file"}
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse PDF uploads that declare a size over PDF_MAX_SIZE_MB before their body is read"""
+    if PDF_MAX_SIZE_BYTES > 0 and request.method == "POST" and request.url.path in PDF_UPLOAD_PATHS:
+        length = request.headers.get("content-length", "")
+        if length.isdigit() and int(length) > PDF_MAX_SIZE_BYTES + MULTIPART_OVERHEAD_BYTES:
+            return JSONResponse(status_code=413, content={"detail": str(upload_size_error(int(length), PDF_MAX_SIZE_BYTES))})
+    return await call_next(request)
+
+async def spool_pdf_upload(file: UploadFile) -> SpooledUpload:
+    """Copy an upload to a temporary file in blocks, enforcing PDF_MAX_SIZE_MB"""
+    try:
+        return await spool_upload(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -151,9 +202,9 @@ async def upload_policy(
     """
     Upload and process a policy PDF document
     
-    1. Extract text from PDF
-    2. Split into chunks
-    3. Generate embeddings
+    1. Extract text from PDF, a window of pages at a time
+    2. Split into chunks as pages arrive
+    3. Generate embeddings while later pages are extracted
     4. Store in vector database
     """
     
@@ -173,13 +224,29 @@ async def upload_policy(
         if not file.filename.lower().endswith('.pdf'):
             raise HTTPException(status_code=400, detail="Only PDF files are allowed")
         
-        # Read file content
-        content = await file.read()
-        print(f"🔍 File content length: {len(content)} bytes")
-        
-        # Process PDF
-        print(f"🔍 Extracting text from PDF...")
-        text = pdf_processor.extract_text_from_bytes(content)
+        # Spool the upload to a temporary file; extraction reads it by path
+        with await spool_pdf_upload(file) as spooled:
+            print(f"🔍 File content length: {spooled.size} bytes")
+            
+            # Extract, chunk, embed and store in one streaming pass
+            print(f"🔍 Extracting and processing PDF...")
+            stored = {"chunks": 0}
+            
+            async def progress(stage: str, done: int, total: int) -> None:
+                if stage == "storing":
+                    # The policy's whole chunk set; storing it either succeeds or raises
+                    stored["chunks"] = total
+            
+            try:
+                text = await ai_service.process_and_store_sections(
+                    pdf_extraction_pool.iter_page_sections(spooled.path),
+                    filename=file.filename,
+                    user_id=user_id,
+                    policy_id=policy_id,
+                    progress=progress
+                )
+            except PDFExtractionError as e:
+                raise pdf_extraction_http_error(e)
         print(f"🔍 Extracted text length: {len(text)} characters")
         
         if not text.strip():
@@ -191,21 +258,13 @@ async def upload_policy(
                 error_msg += ". This appears to be a scanned document, but OCR is not available. Please install Tesseract OCR for scanned document support."
             raise HTTPException(status_code=400, detail=error_msg)
         
-        # Store in database
-        print(f"🔍 Processing and storing document...")
-        document_id = await ai_service.process_and_store_document(
-            text=text,
-            filename=file.filename,
-            user_id=user_id,
-            policy_id=policy_id
-        )
-        print(f"🔍 Document stored with ID: {document_id}")
+        print(f"🔍 Document stored with ID: {policy_id}")
         
         return {
-            "document_id": document_id,
+            "document_id": policy_id,
             "message": "Policy uploaded and processed successfully",
             "text_length": len(text),
-            "chunks_created": len(text) // 1000 + 1,  # Approximate chunk count
+            "chunks_created": stored["chunks"],
             "extracted_text": text  # Return the extracted text for backend storage
         }
         
@@ -215,6 +274,82 @@ async def upload_policy(
         print(f"❌ Error processing PDF: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
 
+def _ingest_job_response(job: dict) -> IngestJobResponse:
+    return IngestJobResponse(
+        job_id=str(job["_id"]),
+        status=job["status"],
+        stage=job["stage"],
+        percent=job["percent"],
+        policy_id=job["policy_id"],
+        user_id=job["user_id"],
+        filename=job["filename"],
+        attempts=job["attempts"],
+        error=job.get("error"),
+        document_id=job.get("document_id"),
+        text_length=job.get("text_length"),
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        finished_at=job.get("finished_at")
+    )
+
+@app.post("/ingest-jobs", response_model=IngestJobResponse, status_code=202)
+async def create_ingest_job(
+    file: UploadFile = File(...),
+    user_id: str = Form(None),
+    policy_id: str = Form(None)
+):
+    """
+    Queue a policy PDF for background processing
+    
+    Returns immediately; poll GET /ingest-jobs/{job_id} for progress.
+    """
+    if not user_id:
+        raise HTTPException(status_code=400, detail="user_id is required")
+    
+    if not policy_id:
+        raise HTTPException(status_code=400, detail="policy_id is required")
+    
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    
+    # Two jobs for one policy would race while syncing its chunks
+    active_job = await db_service.get_active_ingest_job(policy_id)
+    if active_job:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Ingest job {active_job['_id']} for this policy is already {active_job['status']}"
+        )
+    
+    with await spool_pdf_upload(file) as spooled:
+        try:
+            job_id = await db_service.create_ingest_job(user_id, policy_id, file.filename, spooled.path, spooled.size)
+        except Exception as e:
+            print(f"❌ Error queueing ingest job: {e}")
+            raise HTTPException(status_code=500, detail=f"Error queueing ingest job: {str(e)}")
+    
+    ingest_worker.notify()
+    return _ingest_job_response(await db_service.get_ingest_job(job_id))
+
+@app.get("/ingest-jobs/{job_id}", response_model=IngestJobResponse)
+async def get_ingest_job(job_id: str, user_id: str = None):
+    """Stage and percent complete of an ingest job"""
+    job = await db_service.get_ingest_job(job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return _ingest_job_response(job)
+
+@app.post("/ingest-jobs/{job_id}/retry", response_model=IngestJobResponse)
+async def retry_ingest_job(job_id: str, user_id: str = None):
+    """Queue a failed job again; it resumes from its checkpoints"""
+    job = await db_service.get_ingest_job(job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    if not await db_service.retry_ingest_job(job_id, user_id):
+        raise HTTPException(status_code=409, detail=f"Only failed jobs can be retried (job is {job['status']})")
+    
+    ingest_worker.notify()
+    return _ingest_job_response(await db_service.get_ingest_job(job_id))
+
 @app.post("/ask-question", response_model=AnswerResponse)
 async def ask_question(request: QuestionRequest):
     """
@@ -308,6 +443,44 @@ async def ask_question(request: QuestionRequest):
         print(f"Error generating answer: {e}")
         raise HTTPException(status_code=500, detail=f"Error generating answer: {str(e)}")
 
+@app.post("/ask-questions/batch")
+async def ask_questions_batch(request: BatchQuestionRequest):
+    """
+    Answer a questionnaire about one policy
+    
+    1. Embed every question in one API call
+    2. Score all questions against the policy in one matrix product
+    3. Run the chat completions with bounded concurrency
+    
+    Streams newline-delimited JSON, one BatchAnswerItem per question in the
+    order the answers complete (use "index" to match them to questions).
+    """
+    
+    try:
+        print(f"🔍 Batch Questions: {len(request.questions)} questions for policy {request.policy_id}, user {request.user_id}")
+        
+        # Retrieval happens before streaming starts so failures still get a proper status code
+        contexts = await ai_service.find_relevant_context_batch(
+            questions=request.questions,
+            user_id=request.user_id,
+            policy_id=request.policy_id,
+            limit=5
+        )
+    except Exception as e:
+        print(f"Error retrieving batch context: {e}")
+        raise HTTPException(status_code=500, detail=f"Error generating answers: {str(e)}")
+    
+    async def stream_answers():
+        async for result in ai_service.answer_questions_batch(
+            questions=request.questions,
+            contexts=contexts,
+            policy_id=request.policy_id,
+            user_id=request.user_id
+        ):
+            yield BatchAnswerItem(**result).model_dump_json() + "\n"
+    
+    return StreamingResponse(stream_answers(), media_type="application/x-ndjson")
+
 @app.post("/summarize-policy")
 async def summarize_policy(request: dict):
     """
@@ -500,11 +673,9 @@ async def check_compliance_from_file(
         if not file.filename.lower().endswith('.pdf'):
             raise HTTPException(status_code=400, detail="Only PDF files are supported")
         
-        # Read file content
-        file_content = await file.read()
-        
-        # Extract text using PDF processor
-        extracted_text = pdf_processor.extract_text_from_bytes(file_content)
+        # Spool the upload to a temporary file and extract its text
+        with await spool_pdf_upload(file) as spooled:
+            extracted_text = await extract_pdf_text(spooled.path)
         if not extracted_text:
             raise HTTPException(status_code=400, detail="Could not extract text from PDF file")
         
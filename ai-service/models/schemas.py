@@ -17,7 +17,7 @@ class AnswerResponse(BaseModel):
     answer: str
     sources: List['SourceInfo']
     confidence: float = Field(ge=0.0, le=1.0, description="AI confidence score from 0.0 to 1.0")
-    policy_id: str
+    policy_id: Optional[str] = None  # None when the question searched the user's whole library
     user_id: str
 
 class SourceInfo(BaseModel):
@@ -25,6 +25,8 @@ class SourceInfo(BaseModel):
     chunk_id: str
     text: str
     relevance_score: float
+    policy_id: Optional[str] = None
+    policy_title: Optional[str] = None
 
 class SummaryResponse(BaseModel):
     """Response model for policy summaries"""
@@ -49,12 +51,41 @@ class HealthResponse(BaseModel):
 class QuestionRequest(BaseModel):
     """Request model for asking questions"""
     question: str
-    policy_id: str
+    policy_id: Optional[str] = None  # Omit to search across all of the user's policies
     user_id: str
     session_id: Optional[str] = None
     history: Optional[List[Dict[str, Any]]] = None
     images: Optional[List[str]] = None  # Base64 encoded images for context
 
+class BatchQuestionRequest(BaseModel):
+    """Request model for answering a questionnaire about one policy"""
+    questions: List[str] = Field(min_length=1, max_length=50)
+    policy_id: str
+    user_id: str
+
+class BatchAnswerItem(BaseModel):
+    """One line of the batch answer stream"""
+    index: int  # Position of the question in the request
+    question: str
+    answer: AnswerResponse
+
+class IngestJobResponse(BaseModel):
+    """Status of a background ingestion job"""
+    job_id: str
+    status: str  # queued, running, completed or failed
+    stage: str  # queued, extracting, embedding, storing or completed
+    percent: int = Field(ge=0, le=100)
+    policy_id: str
+    user_id: str
+    filename: str
+    attempts: int
+    error: Optional[str] = None  # Last failure; a queued job with an error is waiting to be retried
+    document_id: Optional[str] = None
+    text_length: Optional[int] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
 class StatsResponse(BaseModel):
     """Database statistics response"""
     policies: int
@@ -1,18 +1,31 @@
 # AI Service for Policy Q&A
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Awaitable, Callable
 import openai
 from openai import OpenAI
 import tiktoken
 from datetime import datetime
 import asyncio
 import re
+import numpy as np
 
 from services.database import DatabaseService
-from services.pdf_processor import PDFProcessor
+from services.pdf_processor import PAGE_SEPARATOR, IncrementalChunker, PDFProcessor
 from services.compliance_service import ComplianceService
+from services.lexical_index import build_lexical_index, reciprocal_rank_fusion
+from services.context_builder import assemble_context
+from services.embedding_cache import query_embedding_cache
+from services.embedding_batcher import BatchCallback, EmbeddingBatcher
+from services.embedding_scheduler import embedding_scheduler
+from services.embedding_store import chunk_text_hash, content_key, embedding_store_stats
+from services.chunk_sync import ChunkMatcher
+from services.token_chunker import TokenChunker
+from services.ingest_jobs import IngestProgress
 from models.schemas import AnswerResponse, ComplianceReport, ComplianceRequest
 
+class ChunkStorageError(Exception):
+    """A policy's chunks could not be written, so it must not be marked as AI processed"""
+
 class AIService:
     """
     AI-powered policy question answering service
@@ -29,10 +42,33 @@ class AIService:
         
         # Model configurations
         self.embedding_model = "text-embedding-ada-002"
+        # Rate limits are enforced by the shared scheduler, so the client must not retry 429s on its own
+        self.embedding_batcher = EmbeddingBatcher(
+            self.client.with_options(max_retries=0),
+            self.embedding_model,
+            scheduler=embedding_scheduler
+        )
         self.chat_model = os.getenv("CHAT_MODEL", "gpt-3.5-turbo")  # Use environment variable with fallback
         self.max_tokens = 800  # Response length limit
         self.max_context_tokens = 12000  # Context window limit
         
+        # Questions fall back to lexical search when the embedding call takes longer than this
+        self.embedding_timeout = float(os.getenv("EMBEDDING_TIMEOUT_SECONDS", "5"))
+        
+        # Prompt tokens spent on retrieved policy text, and relevance vs diversity when picking it
+        self.context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+        self.context_mmr_lambda = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+        
+        # New chunks are embedded in groups while later pages are extracted; at most this many groups wait
+        self.stream_embed_group_chunks = int(os.getenv("STREAM_EMBED_GROUP_CHUNKS", "64"))
+        self.stream_embed_queue_groups = int(os.getenv("STREAM_EMBED_QUEUE_GROUPS", "8"))
+        
+        # Chunks are sized in embedding tokens, or in characters with CHUNKER=characters
+        self.chunker = os.getenv("CHUNKER", "tokens")
+        
+        # Chat completions in flight at once for one batch of questions
+        self.batch_chat_concurrency = int(os.getenv("BATCH_CHAT_CONCURRENCY", "4"))
+        
         # Initialize tokenizer for token counting - use the same model as chat_model
         self.tokenizer = tiktoken.encoding_for_model(self.chat_model)
         
@@ -46,58 +82,190 @@ class AIService:
         text: str, 
         filename: str, 
         user_id: str, 
-        policy_id: Optional[str] = None
+        policy_id: Optional[str] = None,
+        progress: Optional[IngestProgress] = None
     ) -> str:
         """
         Process document: split into chunks, generate embeddings, store in DB
         
+        Re-uploading a policy only embeds chunks whose text is not already
+        stored for it; unchanged chunks are kept and vanished ones deleted.
+        progress, when given, is awaited with (stage, done, total) as the
+        embedding and storing stages advance.
+        
         Returns:
             document_id: Unique identifier for the stored document
         """
         
+        async def single_section() -> AsyncIterator[str]:
+            yield text
+        
+        await self.process_and_store_sections(single_section(), filename, user_id, policy_id, progress)
+        return policy_id
+    
+    def _new_chunker(self):
+        if self.chunker == "characters":
+            return IncrementalChunker()
+        # Same encoding the embedding requests are counted with
+        return TokenChunker(self.embedding_batcher.encoding)
+    
+    async def process_and_store_sections(
+        self,
+        sections: AsyncIterator[str],
+        filename: str,
+        user_id: str,
+        policy_id: Optional[str] = None,
+        progress: Optional[IngestProgress] = None,
+        on_text: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> str:
+        """
+        Chunk, embed and store a document whose text arrives in sections
+        (pages from PDFExtractionPool.iter_page_sections)
+        
+        Chunks are cut as sections arrive and new ones are embedded while
+        later sections are still being extracted, so extraction, OCR and
+        embedding overlap. A bounded queue between chunking and embedding
+        slows extraction down when embedding falls behind. The chunk set is
+        written once at the end, in one bulk write, as for a whole text.
+        on_text is awaited with the full text once extraction is done.
+        
+        Returns:
+            The extracted text ("" if there was none; nothing is stored then)
+        """
+        if not policy_id:
+            raise ValueError("policy_id is required for storing document chunks")
+        
         print(f"🔍 AI Service: Processing document {filename} for user {user_id}")
-        print(f"🔍 Text length: {len(text)} characters")
-        
-        # Split text into chunks
-        print(f"🔍 Splitting text into chunks...")
-        chunks = self.pdf_processor.split_into_chunks(text)
-        print(f"🔍 Created {len(chunks)} chunks")
-        
-        # Generate embeddings for each chunk and add them to the chunks
-        print(f"🔍 Generating embeddings for chunks...")
-        for i, chunk in enumerate(chunks):
-            print(f"🔍 Generating embedding for chunk {i+1}/{len(chunks)}")
-            embedding = await self._generate_embedding(chunk["text"])
-            chunk["embedding"] = embedding
-            chunk["created_at"] = datetime.now()
-        print(f"🔍 Generated {len(chunks)} embeddings")
+        owner = f"ingest:{policy_id}"
+        
+        # Only chunks not already stored for this policy need embeddings
+        stored_chunks = await self.db_service.get_document_chunk_hashes(policy_id, user_id)
+        matcher = ChunkMatcher(stored_chunks)
+        chunker = self._new_chunker()
+        chunks: List[Dict[str, Any]] = []
+        text_parts: List[str] = []
+        
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.stream_embed_queue_groups)
+        pending: List[Dict[str, Any]] = []
+        counts = {"queued": 0, "embedded": 0}
+        extraction_done = False
+        
+        async def embed_into(group: List[Dict[str, Any]]) -> None:
+            embeddings = await self._embed_chunks([chunk["text"] for chunk in group], owner=owner)
+            for chunk, embedding in zip(group, embeddings):
+                # Compact float32 until the chunks are written
+                chunk["embedding"] = np.asarray(embedding, dtype=np.float32)
+                chunk["created_at"] = datetime.now()
+        
+        async def embed_groups() -> None:
+            while True:
+                group = await queue.get()
+                if group is None:
+                    return
+                # Take whatever else is already waiting, for fewer and fuller requests
+                finished = False
+                while not queue.empty():
+                    more = queue.get_nowait()
+                    if more is None:
+                        finished = True
+                        break
+                    group = group + more
+                
+                await embed_into(group)
+                counts["embedded"] += len(group)
+                if progress and extraction_done:
+                    await progress("embedding", counts["embedded"], counts["queued"])
+                if finished:
+                    return
+        
+        embed_task = asyncio.create_task(embed_groups())
+        
+        async def enqueue(group: Optional[List[Dict[str, Any]]]) -> None:
+            if not queue.full():
+                queue.put_nowait(group)
+                return
+            put_task = asyncio.ensure_future(queue.put(group))
+            done, _ = await asyncio.wait({put_task, embed_task}, return_when=asyncio.FIRST_COMPLETED)
+            if put_task not in done:
+                put_task.cancel()
+                embed_task.result()
+                raise RuntimeError("Embedding stopped before all chunks were queued")
+        
+        async def add_chunks(new_chunks: List[Dict[str, Any]]) -> None:
+            nonlocal pending
+            for chunk in new_chunks:
+                chunk["content_hash"] = chunk_text_hash(chunk["text"])
+                chunks.append(chunk)
+                if matcher.match(chunk["content_hash"]) is None:
+                    pending.append(chunk)
+            if len(pending) >= self.stream_embed_group_chunks:
+                counts["queued"] += len(pending)
+                group, pending = pending, []
+                await enqueue(group)
+        
+        try:
+            async for section in sections:
+                piece = section if not text_parts else PAGE_SEPARATOR + section
+                text_parts.append(piece)
+                await add_chunks(chunker.feed(piece))
+            await add_chunks(chunker.finish())
+            
+            text = "".join(text_parts)
+            text_parts = []
+            print(f"🔍 Text length: {len(text)} characters, {len(chunks)} chunks")
+            if not chunks:
+                return text
+            if on_text:
+                await on_text(text)
+            
+            extraction_done = True
+            if pending:
+                counts["queued"] += len(pending)
+                await enqueue(pending)
+            await enqueue(None)
+            print(f"🔍 {len(chunks) - counts['queued']} chunks unchanged since the last upload, {counts['queued']} to embed")
+            if progress:
+                await progress("embedding", counts["embedded"], counts["queued"])
+            await embed_task
+        finally:
+            if not embed_task.done():
+                embed_task.cancel()
+        print(f"🔍 Generated {counts['queued']} embeddings")
+        
+        # Exact-term index for hybrid search, stored alongside the chunks
+        lexical_index = build_lexical_index([chunk["text"] for chunk in chunks])
+        print(f"🔍 Built lexical index with {len(lexical_index.terms)} terms")
         
         # Store in database
         print(f"🔍 Storing chunks in database...")
         print(f"🔍 Chunks to store: {len(chunks)}")
         print(f"🔍 Policy ID: {policy_id}, User ID: {user_id}")
-        
-        if not policy_id:
-            raise ValueError("policy_id is required for storing document chunks")
+        if progress:
+            await progress("storing", 0, len(chunks))
         
         success = await self.db_service.store_document_chunks(
             chunks=chunks,
             document_id=policy_id,
-            user_id=user_id
+            user_id=user_id,
+            lexical_index=lexical_index,
+            # Chunks another upload of this policy removed after the stored hashes were read
+            embed_missing=embed_into
         )
         print(f"🔍 Chunk storage success: {success}")
+        if not success:
+            # Fails the upload (or the ingest job, which is retried) instead of leaving the policy unsearchable
+            raise ChunkStorageError(f"Could not store the chunks of policy {policy_id}")
         print(f"🔍 Stored document with ID: {policy_id}")
         
         # Update the main policy status to mark as AI processed and store PDF text
-        if policy_id:
-            print(f"🔍 Updating policy AI status...")
-            await self._update_policy_ai_status(policy_id, True)
-            
-            # Store the extracted text in the policy document
-            print(f"🔍 Storing PDF text in policy document...")
-            await self._update_policy_pdf_text(policy_id, text)
+        print(f"🔍 Updating policy AI status...")
+        await self._update_policy_ai_status(policy_id, True)
         
-        return policy_id
+        # Store the extracted text in the policy document
+        print(f"🔍 Storing PDF text in policy document...")
+        await self._update_policy_pdf_text(policy_id, text)
+        
+        return text
     
     async def _update_policy_ai_status(self, policy_id: str, ai_processed: bool):
         """Update the main policy's AI processing status"""
@@ -123,25 +291,147 @@ class AIService:
         limit: int = 5
     ) -> List[Dict[str, Any]]:
         """
-        Find relevant document chunks using vector similarity search
+        Find relevant document chunks using hybrid lexical + vector search
+        
+        BM25 and vector results are merged with reciprocal rank fusion. If the
+        embedding API fails or is slower than EMBEDDING_TIMEOUT_SECONDS, the
+        lexical results are returned on their own.
+        Without a policy_id the search covers every policy the user has uploaded.
         
         Returns:
             List of relevant chunks with similarity scores
         """
         
-        # Generate embedding for the question
-        question_embedding = await self._generate_embedding(question)
+        # Each retriever contributes a deeper candidate list than the final limit
+        candidates = max(limit * 4, 20)
         
-        # Search for similar chunks in database
-        relevant_chunks = await self.db_service.vector_search(
-            query_embedding=question_embedding,
+        # Generate embedding for the question while the lexical search runs
+        embedding_task = asyncio.create_task(self._generate_embedding(question))
+        lexical_chunks = await self.db_service.lexical_search(
+            query=question,
             user_id=user_id,
             document_id=policy_id,
-            limit=limit
+            limit=candidates
         )
         
+        try:
+            question_embedding = await asyncio.wait_for(embedding_task, timeout=self.embedding_timeout)
+        except Exception as e:
+            if not lexical_chunks:
+                raise
+            reason = "timed out" if isinstance(e, asyncio.TimeoutError) else f"failed: {e}"
+            print(f"⚠️ Question embedding {reason}, answering from lexical search only")
+            return lexical_chunks[:limit]
+        
+        if not policy_id:
+            vector_chunks = await self.db_service.library_search(
+                query_embedding=question_embedding,
+                user_id=user_id,
+                limit=candidates
+            )
+        else:
+            # Search for similar chunks in database
+            vector_chunks = await self.db_service.vector_search(
+                query_embedding=question_embedding,
+                user_id=user_id,
+                document_id=policy_id,
+                limit=candidates
+            )
+        
+        # Vector results first so chunks found by both keep their cosine score
+        relevant_chunks = reciprocal_rank_fusion([vector_chunks, lexical_chunks], limit=limit)
+        print(f"🔍 Hybrid Search: {len(vector_chunks)} vector + {len(lexical_chunks)} lexical candidates -> {len(relevant_chunks)} chunks")
+        
         return relevant_chunks
     
+    async def find_relevant_context_batch(
+        self,
+        questions: List[str],
+        user_id: str,
+        policy_id: str,
+        limit: int = 5
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Hybrid search for a questionnaire against one policy
+        
+        All questions are embedded in one API call and scored in one pass over
+        the policy's embedding matrix, then fused with their lexical results.
+        
+        Returns:
+            One list of relevant chunks per question, in question order
+        """
+        candidates = max(limit * 4, 20)
+        
+        embedding_task = asyncio.create_task(self._generate_embeddings(questions))
+        lexical_results = await asyncio.gather(*[
+            self.db_service.lexical_search(query=question, user_id=user_id, document_id=policy_id, limit=candidates)
+            for question in questions
+        ])
+        
+        try:
+            question_embeddings = await asyncio.wait_for(embedding_task, timeout=self.embedding_timeout)
+        except Exception as e:
+            if not any(lexical_results):
+                raise
+            reason = "timed out" if isinstance(e, asyncio.TimeoutError) else f"failed: {e}"
+            print(f"⚠️ Batch question embedding {reason}, answering from lexical search only")
+            return [lexical_chunks[:limit] for lexical_chunks in lexical_results]
+        
+        vector_results = await self.db_service.vector_search_batch(
+            query_embeddings=question_embeddings,
+            user_id=user_id,
+            document_id=policy_id,
+            limit=candidates
+        )
+        
+        return [
+            reciprocal_rank_fusion([vector_chunks, lexical_chunks], limit=limit)
+            for vector_chunks, lexical_chunks in zip(vector_results, lexical_results)
+        ]
+    
+    async def answer_questions_batch(
+        self,
+        questions: List[str],
+        contexts: List[List[Dict[str, Any]]],
+        policy_id: str,
+        user_id: str
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Answer a batch of questions with at most batch_chat_concurrency chat
+        calls in flight, yielding each result as soon as it is ready
+        
+        Yields:
+            {"index": position in questions, "question": ..., "answer": AnswerResponse}
+        """
+        semaphore = asyncio.Semaphore(self.batch_chat_concurrency)
+        
+        async def answer(index: int):
+            if not contexts[index]:
+                return index, AnswerResponse(
+                    answer="I couldn't find any relevant information in your policy documents to answer this question.",
+                    sources=[],
+                    confidence=0.2,  # Low confidence - no relevant information found
+                    policy_id=policy_id,
+                    user_id=user_id
+                )
+            async with semaphore:
+                return index, await self.generate_answer(
+                    question=questions[index],
+                    context_chunks=contexts[index],
+                    policy_id=policy_id,
+                    user_id=user_id
+                )
+        
+        tasks = [asyncio.create_task(answer(index)) for index in range(len(questions))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, response = await next_done
+                yield {"index": index, "question": questions[index], "answer": response}
+        finally:
+            # The client may stop reading early; don't keep paying for its answers
+            for task in tasks:
+                task.cancel()
+    
     async def analyze_images_with_vision(
         self,
         images: List[str],
@@ -216,7 +506,7 @@ Be specific and helpful in your analysis."""
         self, 
         question: str, 
         context_chunks: List[Dict[str, Any]],
-        policy_id: str,
+        policy_id: Optional[str],
         user_id: str,
         history: Optional[List[Dict[str, Any]]] = None,
         images: Optional[List[str]] = None
@@ -262,14 +552,103 @@ Be specific and helpful in your analysis."""
             )
     
     async def _generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding vector for text"""
+        """Generate embedding vector for text (short texts go through the query embedding cache)"""
+        return (await self._generate_embeddings([text]))[0]
+    
+    async def _generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate embedding vectors for several texts
+        
+        Short texts are looked up in the process cache, then in the shared
+        query_embeddings collection. Only the remaining texts go to the API,
+        in one call.
+        """
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        pending: Dict[str, List[int]] = {}
+        
+        for i, text in enumerate(texts):
+            if not query_embedding_cache.cacheable(text):
+                continue
+            key = query_embedding_cache.key(text, self.embedding_model)
+            cached = query_embedding_cache.get(key)
+            if cached is not None:
+                embeddings[i] = cached
+            else:
+                pending.setdefault(key, []).append(i)
+        
+        if pending:
+            stored = await self.db_service.get_cached_query_embeddings(list(pending))
+            query_embedding_cache.record_persistent_hits(len(stored))
+            for key, embedding in stored.items():
+                query_embedding_cache.put(key, embedding)
+                for i in pending.pop(key):
+                    embeddings[i] = embedding
+        
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            return embeddings
+        
+        fresh = await self._embed_texts([texts[i] for i in missing])
+        new_entries: Dict[str, List[float]] = {}
+        for i, embedding in zip(missing, fresh):
+            embeddings[i] = embedding
+            if query_embedding_cache.cacheable(texts[i]):
+                key = query_embedding_cache.key(texts[i], self.embedding_model)
+                query_embedding_cache.put(key, embedding)
+                new_entries[key] = embedding
+        
+        if new_entries:
+            query_embedding_cache.record_misses(len(new_entries))
+            await self.db_service.store_query_embeddings(new_entries, self.embedding_model)
+        
+        return embeddings
+    
+    async def _embed_chunks(self, texts: List[str], owner: str) -> List[List[float]]:
+        """
+        Embed chunk texts through the content-addressed embedding store
+        
+        One $in lookup covers every chunk; only texts not seen before (each
+        once, even if repeated within the document) are sent to the API.
+        Each completed request is written to the store right away, so a
+        retried upload resumes from the embeddings that already succeeded.
+        """
+        if not texts:
+            return []
+        
+        keys = [content_key(text, self.embedding_model) for text in texts]
+        stored = await self.db_service.get_stored_embeddings(list(set(keys)))
+        
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in stored:
+                missing.setdefault(key, text)
+        
+        if missing:
+            missing_keys = list(missing.keys())
+            
+            async def checkpoint(positions: List[int], embeddings: List[List[float]]) -> None:
+                new_entries = {missing_keys[i]: embedding for i, embedding in zip(positions, embeddings)}
+                await self.db_service.put_stored_embeddings(new_entries, self.embedding_model)
+                stored.update(new_entries)
+            
+            await self._embed_texts(list(missing.values()), owner=owner, on_batch=checkpoint)
+        
+        reused = sum(1 for key in keys if key not in missing)
+        embedding_store_stats.reused += reused
+        embedding_store_stats.embedded += len(missing)
+        print(f"🔍 Embedding store: Reused {reused} of {len(texts)} chunk embeddings, embedded {len(missing)} new texts")
+        
+        return [stored[key] for key in keys]
+    
+    async def _embed_texts(
+        self,
+        texts: List[str],
+        owner: str = "questions",
+        on_batch: Optional[BatchCallback] = None
+    ) -> List[List[float]]:
+        """Generate embedding vectors for texts in as few token-bounded API calls as possible"""
         try:
-            response = await asyncio.to_thread(
-                self.client.embeddings.create,
-                model=self.embedding_model,
-                input=text.replace("\n", " ")
-            )
-            return response.data[0].embedding
+            return await self.embedding_batcher.embed(texts, owner=owner, on_batch=on_batch)
         except Exception as e:
             print(f"Embedding generation error: {e}")
             raise
@@ -398,14 +777,31 @@ Remember:
 Now please answer the user's question based on their policy information."""
     
     def _build_context(self, chunks: List[Dict[str, Any]]) -> str:
-        """Build context string from relevant chunks"""
+        """
+        Build context string from relevant chunks
+        
+        Overlapping chunks are merged so shared text is sent once, then
+        passages are picked by MMR until the context token budget is used.
+        """
         if not chunks:
             return "No relevant policy information found."
         
+        passages = assemble_context(
+            chunks,
+            token_budget=self.context_token_budget,
+            count_tokens=lambda text: len(self.tokenizer.encode(text)),
+            mmr_lambda=self.context_mmr_lambda
+        )
+        
         context_parts = []
-        for i, chunk in enumerate(chunks, 1):
-            context_parts.append(f"[Section {i}]\n{chunk['text']}\n")
+        for i, passage in enumerate(passages, 1):
+            # Library-wide searches mix policies, so say which one each section is from
+            if passage.policy_title:
+                context_parts.append(f"[Section {i} - Policy: {passage.policy_title}]\n{passage.text}\n")
+            else:
+                context_parts.append(f"[Section {i}]\n{passage.text}\n")
         
+        print(f"🔍 Context: {len(chunks)} chunks -> {len(passages)} passages")
         return "\n".join(context_parts)
     
     def _truncate_to_token_limit(self, prompt: str) -> str:
@@ -424,7 +820,7 @@ Now please answer the user's question based on their policy information."""
         response: str, 
         context_chunks: List[Dict[str, Any]],
         question: str,
-        policy_id: str,
+        policy_id: Optional[str],
         user_id: str
     ) -> AnswerResponse:
         """Parse AI response and calculate confidence score"""
@@ -437,7 +833,9 @@ Now please answer the user's question based on their policy information."""
             {
                 "chunk_id": str(chunk.get("_id", "")),  # Convert ObjectId to string
                 "text": chunk.get("text", ""),
-                "relevance_score": chunk.get("similarity_score", 0.0)
+                "relevance_score": chunk.get("similarity_score", 0.0),
+                "policy_id": chunk.get("document_id"),
+                "policy_title": chunk.get("policy_title")
             }
             for chunk in context_chunks[:3]  # Top 3 sources
         ]
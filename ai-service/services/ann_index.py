@@ -0,0 +1,288 @@
+"""
+User-scoped approximate nearest neighbour index over all of a user's chunks.
+
+An inverted-file (IVF) index built with NumPy only:
+- Spherical k-means on a sample of the user's embeddings gives nlist centroids
+- Every chunk vector lives in the list of its nearest centroid
+- A search scores the centroids, then only the vectors of the nprobe best lists
+
+Small libraries (below min_train_size vectors) are searched exhaustively.
+The index is updated incrementally as policies are stored or deleted and
+retrained once it has grown to twice the size it was trained at. Changes
+made by other worker processes are not seen, so indexes expire after a TTL
+and are rebuilt on the next library-wide question.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, AsyncContextManager, Dict, List, Optional, Tuple
+import numpy as np
+
+from services.keyed_locks import KeyedLocks
+from services.vector_index import build_embedding_matrix, normalize_vector, top_k_indices
+
+
+class _InvertedList:
+    """Vectors assigned to one centroid, with pending appends merged lazily"""
+
+    def __init__(self, dim: int):
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.chunk_ids: List[Any] = []
+        self.document_ids: List[str] = []
+        self._pending: List[np.ndarray] = []
+
+    def append(self, vectors: np.ndarray, chunk_ids: List[Any], document_ids: List[str]) -> None:
+        self._pending.append(vectors)
+        self.chunk_ids.extend(chunk_ids)
+        self.document_ids.extend(document_ids)
+
+    def consolidate(self) -> np.ndarray:
+        if self._pending:
+            self.vectors = np.ascontiguousarray(np.vstack([self.vectors] + self._pending))
+            self._pending = []
+        return self.vectors
+
+    def remove_document(self, document_id: str) -> int:
+        return self._remove([i for i, doc in enumerate(self.document_ids) if doc != document_id])
+
+    def remove_chunks(self, chunk_ids: set) -> int:
+        return self._remove([i for i, chunk_id in enumerate(self.chunk_ids) if chunk_id not in chunk_ids])
+
+    def _remove(self, keep: List[int]) -> int:
+        vectors = self.consolidate()
+        removed = len(self.document_ids) - len(keep)
+        if removed:
+            self.vectors = np.ascontiguousarray(vectors[keep])
+            self.chunk_ids = [self.chunk_ids[i] for i in keep]
+            self.document_ids = [self.document_ids[i] for i in keep]
+        return removed
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+
+class IVFIndex:
+    def __init__(self, dim: int, nprobe: int = 32, min_train_size: int = 2048, kmeans_iterations: int = 10, seed: int = 0):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+        self.centroids = np.zeros((1, dim), dtype=np.float32)
+        self.lists = [_InvertedList(dim)]
+        self.trained_size = 0
+        self.size = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.trained_size > 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.size * (self.dim * 4 + 64) + int(self.centroids.nbytes)
+
+    def add(self, vectors: np.ndarray, chunk_ids: List[Any], document_ids: List[str]) -> None:
+        """Add normalized vectors, retraining when the library has doubled since the last training"""
+        if len(chunk_ids) == 0:
+            return
+
+        self.size += len(chunk_ids)
+        needs_training = (
+            self.size >= self.min_train_size
+            and (not self.is_trained or self.size >= 2 * self.trained_size)
+        )
+        if needs_training:
+            all_vectors, all_chunk_ids, all_document_ids = self._all_entries()
+            self._train(
+                np.vstack([all_vectors, vectors]) if len(all_vectors) else vectors,
+                all_chunk_ids + list(chunk_ids),
+                all_document_ids + list(document_ids)
+            )
+            return
+
+        self._assign(vectors, list(chunk_ids), list(document_ids))
+
+    def remove_document(self, document_id: str) -> int:
+        removed = sum(inverted_list.remove_document(document_id) for inverted_list in self.lists)
+        self.size -= removed
+        return removed
+
+    def remove_chunks(self, chunk_ids: List[Any]) -> int:
+        removed_ids = set(chunk_ids)
+        removed = sum(inverted_list.remove_chunks(removed_ids) for inverted_list in self.lists)
+        self.size -= removed
+        return removed
+
+    def search(self, query_embedding: List[float], k: int) -> List[Tuple[Any, str, float]]:
+        """Return up to k (chunk_id, document_id, score) tuples, best first"""
+        if self.size == 0:
+            return []
+
+        query = normalize_vector(query_embedding)
+        probe_count = min(self.nprobe, len(self.lists)) if self.is_trained else 1
+        probes = top_k_indices(self.centroids @ query, probe_count)
+
+        candidates: List[Tuple[Any, str, float]] = []
+        for probe in probes:
+            inverted_list = self.lists[probe]
+            if len(inverted_list) == 0:
+                continue
+            vectors = inverted_list.consolidate()
+            scores = vectors @ query
+            for i in top_k_indices(scores, k):
+                candidates.append((inverted_list.chunk_ids[i], inverted_list.document_ids[i], float(scores[i])))
+
+        candidates.sort(key=lambda candidate: candidate[2], reverse=True)
+        return candidates[:k]
+
+    def _all_entries(self) -> Tuple[np.ndarray, List[Any], List[str]]:
+        vectors = [inverted_list.consolidate() for inverted_list in self.lists if len(inverted_list)]
+        chunk_ids = [chunk_id for inverted_list in self.lists for chunk_id in inverted_list.chunk_ids]
+        document_ids = [doc for inverted_list in self.lists for doc in inverted_list.document_ids]
+        if not vectors:
+            return np.empty((0, self.dim), dtype=np.float32), [], []
+        return np.vstack(vectors), chunk_ids, document_ids
+
+    def _train(self, vectors: np.ndarray, chunk_ids: List[Any], document_ids: List[str]) -> None:
+        """Spherical k-means on a sample, then reassign every vector"""
+        count = vectors.shape[0]
+        nlist = int(min(1024, max(1, np.sqrt(count))))
+        rng = np.random.default_rng(self.seed)
+
+        sample_size = min(count, 32 * nlist)
+        sample = vectors[rng.choice(count, size=sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assignments == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+                else:
+                    # Re-seed empty clusters so every list stays useful
+                    centroids[c] = sample[rng.integers(sample_size)]
+            centroids = build_embedding_matrix(centroids)
+
+        self.centroids = centroids
+        self.lists = [_InvertedList(self.dim) for _ in range(nlist)]
+        self.trained_size = count
+        self._assign(vectors, chunk_ids, document_ids)
+
+    def _assign(self, vectors: np.ndarray, chunk_ids: List[Any], document_ids: List[str]) -> None:
+        assignments = np.argmax(vectors @ self.centroids.T, axis=1)
+        for c in np.unique(assignments):
+            members = np.flatnonzero(assignments == c)
+            self.lists[c].append(
+                vectors[members],
+                [chunk_ids[i] for i in members],
+                [document_ids[i] for i in members]
+            )
+
+
+class LibraryIndexRegistry:
+    """Process-local, byte-bounded LRU of per-user IVF indexes"""
+
+    def __init__(self, max_bytes: int, nprobe: int, ttl: Optional[int] = None):
+        self.indexes: "OrderedDict[str, IVFIndex]" = OrderedDict()
+        self.max_bytes = max_bytes
+        self.nprobe = nprobe
+        self.ttl = ttl
+        self.built_at: Dict[str, float] = {}
+        self.locks = KeyedLocks()
+        # Bumped on every change to a user's chunks (all users' for a change without a user),
+        # whether or not their index is loaded, so a build can tell it missed one
+        self.generations: Dict[str, int] = {}
+        self.global_generation = 0
+
+    def get(self, user_id: str) -> Optional[IVFIndex]:
+        index = self.indexes.get(user_id)
+        if index is None:
+            return None
+        # Indexes expire so workers that missed another worker's changes eventually rebuild
+        if self.ttl and time.time() - self.built_at.get(user_id, 0) > self.ttl:
+            self.invalidate(user_id)
+            return None
+        self.indexes.move_to_end(user_id)
+        return index
+
+    def lock(self, user_id: str) -> AsyncContextManager[None]:
+        """Held while a user's index is built; dropped from self.locks once unused"""
+        return self.locks.hold(user_id)
+
+    def generation(self, user_id: str) -> Tuple[int, int]:
+        return self.global_generation, self.generations.get(user_id, 0)
+
+    def _changed(self, user_id: Optional[str]) -> None:
+        if user_id:
+            self.generations[user_id] = self.generations.get(user_id, 0) + 1
+        else:
+            self.global_generation += 1
+
+    def put(self, user_id: str, index: IVFIndex, generation: Optional[Tuple[int, int]] = None) -> bool:
+        """
+        Cache a built index. With the generation taken before its chunks
+        were read, an index that missed a change made during the build is
+        not cached (returns False); the next search rebuilds it.
+        """
+        if generation is not None and generation != self.generation(user_id):
+            return False
+        self.indexes[user_id] = index
+        self.indexes.move_to_end(user_id)
+        self.built_at[user_id] = time.time()
+        self._evict()
+        return True
+
+    def build(self, vectors: np.ndarray, chunk_ids: List[Any], document_ids: List[str]) -> IVFIndex:
+        started = time.time()
+        index = IVFIndex(dim=vectors.shape[1], nprobe=self.nprobe)
+        index.add(vectors, chunk_ids, document_ids)
+        print(f"🔍 Library Index: Built index over {index.size} chunks in {(time.time() - started) * 1000:.0f}ms")
+        return index
+
+    def add_document(self, user_id: str, vectors: np.ndarray, chunk_ids: List[Any], document_id: str) -> None:
+        """Incrementally add a stored policy to an already loaded index"""
+        self._changed(user_id)
+        index = self.indexes.get(user_id)
+        if index is None or vectors.shape[0] == 0:
+            return
+        if vectors.shape[1] != index.dim:
+            self.invalidate(user_id)
+            return
+        index.add(vectors, chunk_ids, [document_id] * len(chunk_ids))
+        self._evict()
+
+    def remove_document(self, document_id: str, user_id: Optional[str] = None) -> None:
+        self._changed(user_id)
+        user_ids = [user_id] if user_id else list(self.indexes)
+        for uid in user_ids:
+            index = self.indexes.get(uid)
+            if index is not None:
+                index.remove_document(document_id)
+
+    def remove_chunks(self, user_id: str, chunk_ids: List[Any]) -> None:
+        """Drop individual chunks (e.g. replaced by a re-upload) from a loaded index"""
+        if chunk_ids:
+            self._changed(user_id)
+        index = self.indexes.get(user_id)
+        if index is not None and chunk_ids:
+            index.remove_chunks(chunk_ids)
+
+    def invalidate(self, user_id: str) -> None:
+        self._changed(user_id)
+        self.indexes.pop(user_id, None)
+        self.built_at.pop(user_id, None)
+
+    def _evict(self) -> None:
+        while len(self.indexes) > 1 and sum(index.nbytes for index in self.indexes.values()) > self.max_bytes:
+            user_id, _ = self.indexes.popitem(last=False)
+            self.built_at.pop(user_id, None)
+
+
+# Global registry shared by every DatabaseService in this process
+library_indexes = LibraryIndexRegistry(
+    max_bytes=int(float(os.getenv("LIBRARY_INDEX_MAX_MB", "512")) * 1024 * 1024),
+    nprobe=int(os.getenv("LIBRARY_SEARCH_NPROBE", "32")),
+    ttl=int(os.getenv("LIBRARY_INDEX_TTL_SECONDS", os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "3600")))
+)
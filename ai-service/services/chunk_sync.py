@@ -0,0 +1,68 @@
+"""
+Diffing a policy's new chunk set against its stored chunks.
+
+Chunks are matched by content_hash (see chunk_text_hash), as a multiset: a
+paragraph that appears twice needs two stored chunks. Matched chunks are
+kept (only their position is updated), unmatched new chunks are inserted
+and stored chunks that were not matched are deleted, so re-uploading an
+edited policy only embeds the chunks whose text actually changed.
+"""
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+
+@dataclass
+class ChunkSyncPlan:
+    keep: Dict[int, Dict[str, Any]] = field(default_factory=dict)  # new position -> stored chunk it reuses
+    insert: List[int] = field(default_factory=list)  # new positions that need a new chunk document
+    delete: List[Any] = field(default_factory=list)  # _ids of stored chunks no longer present
+
+    @property
+    def unchanged(self) -> bool:
+        return not self.insert and not self.delete
+
+
+class ChunkMatcher:
+    """
+    Incremental form of plan_chunk_sync: match new chunk hashes one at a
+    time, in chunk order, as a streaming ingest produces them. Gives the
+    same keep/insert split as plan_chunk_sync over the full hash list.
+    """
+
+    def __init__(self, stored_chunks: List[Dict[str, Any]]):
+        self.stored_chunks = stored_chunks
+        self.available: Dict[str, Deque[Dict[str, Any]]] = {}
+        for chunk in sorted(stored_chunks, key=lambda c: c.get("chunk_index", 0)):
+            if chunk.get("content_hash"):
+                self.available.setdefault(chunk["content_hash"], deque()).append(chunk)
+        self.plan = ChunkSyncPlan()
+        self.position = 0
+
+    def match(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """The stored chunk the next new chunk reuses, or None if it must be inserted"""
+        matches = self.available.get(content_hash)
+        stored = matches.popleft() if matches else None
+        if stored is not None:
+            self.plan.keep[self.position] = stored
+        else:
+            self.plan.insert.append(self.position)
+        self.position += 1
+        return stored
+
+    def finish(self) -> ChunkSyncPlan:
+        kept_ids = {id(chunk) for chunk in self.plan.keep.values()}
+        self.plan.delete = [chunk["_id"] for chunk in self.stored_chunks if id(chunk) not in kept_ids]
+        return self.plan
+
+
+def plan_chunk_sync(new_hashes: List[str], stored_chunks: List[Dict[str, Any]]) -> ChunkSyncPlan:
+    """
+    Match new chunk hashes against stored chunks ({_id, content_hash, chunk_index, ...}).
+    Stored chunks without a content_hash (ingested before hashes were recorded) never match.
+    """
+    matcher = ChunkMatcher(stored_chunks)
+    for content_hash in new_hashes:
+        matcher.match(content_hash)
+    return matcher.finish()
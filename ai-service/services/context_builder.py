@@ -0,0 +1,149 @@
+"""
+Prompt context assembly from retrieved chunks
+- Merges chunks of the same policy whose start_char/end_char ranges overlap,
+  so the 200-character chunk overlap is only paid for once
+- Picks passages in maximal-marginal-relevance order (relevance minus
+  similarity to what is already selected) to avoid near-duplicate sections
+- Stops adding passages once the token budget is used up
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from services.lexical_index import tokenize
+
+
+@dataclass
+class ContextPassage:
+    """Contiguous span of one policy's text, made of one or more merged chunks"""
+    text: str
+    document_id: Optional[str]
+    start_char: Optional[int]
+    end_char: Optional[int]
+    score: float
+    policy_title: Optional[str] = None
+    chunk_ids: List[Any] = field(default_factory=list)
+
+
+def _relevance(chunk: Dict[str, Any]) -> float:
+    # Fused rank score when hybrid retrieval produced one, cosine otherwise
+    return float(chunk.get("fusion_score", chunk.get("similarity_score", 0.0)) or 0.0)
+
+
+def _has_offsets(chunk: Dict[str, Any]) -> bool:
+    return isinstance(chunk.get("start_char"), int) and isinstance(chunk.get("end_char"), int)
+
+
+def merge_overlapping_chunks(chunks: List[Dict[str, Any]]) -> List[ContextPassage]:
+    """
+    Merge chunks of the same policy whose character ranges overlap or touch.
+
+    A merged passage keeps the best score of its chunks. Chunks stored
+    without offsets (ingested before they were recorded) are only
+    deduplicated by exact text.
+    """
+    passages: List[ContextPassage] = []
+    by_document: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    seen_texts: Set[str] = set()
+
+    for chunk in chunks:
+        if _has_offsets(chunk):
+            by_document.setdefault(chunk.get("document_id"), []).append(chunk)
+        elif chunk.get("text") and chunk["text"] not in seen_texts:
+            seen_texts.add(chunk["text"])
+            passages.append(ContextPassage(
+                text=chunk["text"],
+                document_id=chunk.get("document_id"),
+                start_char=None,
+                end_char=None,
+                score=_relevance(chunk),
+                policy_title=chunk.get("policy_title"),
+                chunk_ids=[chunk.get("_id")]
+            ))
+
+    for document_id, document_chunks in by_document.items():
+        current: Optional[ContextPassage] = None
+        for chunk in sorted(document_chunks, key=lambda c: (c["start_char"], c["end_char"])):
+            if current is not None and chunk["start_char"] <= current.end_char:
+                # Append only the part of the chunk beyond what the passage already covers
+                if chunk["end_char"] > current.end_char:
+                    current.text += chunk["text"][current.end_char - chunk["start_char"]:]
+                    current.end_char = chunk["end_char"]
+                current.score = max(current.score, _relevance(chunk))
+                current.chunk_ids.append(chunk.get("_id"))
+                continue
+
+            current = ContextPassage(
+                text=chunk.get("text", ""),
+                document_id=document_id,
+                start_char=chunk["start_char"],
+                end_char=chunk["end_char"],
+                score=_relevance(chunk),
+                policy_title=chunk.get("policy_title"),
+                chunk_ids=[chunk.get("_id")]
+            )
+            passages.append(current)
+
+    return passages
+
+
+def _overlap(a: Set[str], b: Set[str]) -> float:
+    """Jaccard similarity of two term sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def select_passages(
+    passages: List[ContextPassage],
+    token_budget: int,
+    count_tokens: Callable[[str], int],
+    mmr_lambda: float = 0.7
+) -> List[ContextPassage]:
+    """
+    Greedy MMR selection under a token budget.
+
+    Each step takes the passage with the best
+    mmr_lambda * relevance - (1 - mmr_lambda) * max similarity to the selection,
+    skipping passages that no longer fit. Relevance is scaled to [0, 1] and
+    similarity is term-set Jaccard overlap. Returns passages in selection order.
+    """
+    if not passages:
+        return []
+
+    top_score = max(passage.score for passage in passages) or 1.0
+    remaining = [
+        (passage, passage.score / top_score, set(tokenize(passage.text)), count_tokens(passage.text))
+        for passage in passages
+    ]
+    selected: List[ContextPassage] = []
+    selected_terms: List[Set[str]] = []
+    used_tokens = 0
+
+    while remaining:
+        best_position, best_value = 0, None
+        for position, (_, relevance, terms, _) in enumerate(remaining):
+            redundancy = max((_overlap(terms, chosen) for chosen in selected_terms), default=0.0)
+            value = mmr_lambda * relevance - (1.0 - mmr_lambda) * redundancy
+            if best_value is None or value > best_value:
+                best_position, best_value = position, value
+
+        passage, _, terms, tokens = remaining.pop(best_position)
+        # The best passage is always kept, so an oversized one still yields context
+        if selected and used_tokens + tokens > token_budget:
+            continue
+        selected.append(passage)
+        selected_terms.append(terms)
+        used_tokens += tokens
+
+    return selected
+
+
+def assemble_context(
+    chunks: List[Dict[str, Any]],
+    token_budget: int,
+    count_tokens: Callable[[str], int],
+    mmr_lambda: float = 0.7
+) -> List[ContextPassage]:
+    """Merge overlapping chunks, then pick diverse passages that fit the token budget"""
+    return select_passages(merge_overlapping_chunks(chunks), token_budget, count_tokens, mmr_lambda)
@@ -6,13 +6,33 @@ Database service for AI operations
 
 import os
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
-from typing import List, Dict, Any, Optional
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from typing import List, Dict, Any, Awaitable, Callable, Optional, Set, Tuple
 import time
+from datetime import datetime, timedelta
 from functools import wraps
 from bson import ObjectId
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from services.vector_index import build_embedding_matrix, score_top_k_batch, valid_embedding_rows
+from services.quantization import QUANTIZED_SEARCH_MIN_ROWS, quantize_matrix, score_embeddings
+from services.matrix_cache import EmbeddingMatrix, embedding_matrix_cache
+from services.ann_index import library_indexes
+from services.vector_store import vector_store
+from services.embedding_codec import EMBEDDING_FORMAT_BINARY, decode_embedding, encode_embedding
+from services.lexical_index import LEXICAL_SCORE_WEIGHT, LexicalIndex, build_lexical_index, lexical_index_cache
+from services.embedding_cache import query_embedding_cache
+from services.embedding_scheduler import embedding_scheduler
+from services.extraction_pool import pdf_extraction_pool
+from services.embedding_store import (
+    EMBEDDING_STORE_EVICTION_TARGET,
+    EMBEDDING_STORE_MAX_BYTES,
+    ENTRY_OVERHEAD_BYTES,
+    chunk_text_hash,
+    embedding_store_stats
+)
+from services.chunk_sync import ChunkSyncPlan, plan_chunk_sync
+from services.keyed_locks import KeyedLocks
+from pymongo import DeleteMany, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import ConfigurationError, OperationFailure
 
 def retry_on_dns_error(max_retries=3, delay=1):
     """Decorator to retry operations on DNS timeout errors"""
@@ -36,6 +56,25 @@ def retry_on_dns_error(max_retries=3, delay=1):
         return wrapper
     return decorator
 
+# What chunk diffing needs of each stored chunk
+CHUNK_HASH_PROJECTION = {"_id": 1, "content_hash": 1, "chunk_index": 1, "start_char": 1, "end_char": 1}
+
+# Times a chunk write is planned again after a concurrent upload changed the stored chunks
+CHUNK_SYNC_ATTEMPTS = 3
+
+# Chunk writes of one policy from this process, one at a time (the transaction
+# serializes them across processes; this also covers servers without transactions)
+_chunk_sync_locks = KeyedLocks()
+
+
+class ChunksNeedEmbedding(Exception):
+    """The chunk diff planned in the write's transaction inserts chunks that have no embedding"""
+    
+    def __init__(self, positions: List[int]):
+        super().__init__(f"{len(positions)} new chunks have no embedding")
+        self.positions = positions
+
+
 class DatabaseService:
     def __init__(self):
         # MongoDB connection - connect to main backend database
@@ -70,6 +109,16 @@ class DatabaseService:
         # Collections - use main backend collections
         self.policies_collection = self.db.policies  # Main policies collection
         self.chunks_collection = self.db.policy_chunks  # AI chunks for vector search
+        self.lexical_indexes_collection = self.db.policy_lexical_indexes  # BM25 postings per policy
+        self.query_embeddings_collection = self.db.query_embeddings  # Cached question embeddings (TTL)
+        self.embedding_store_collection = self.db.embedding_store  # Chunk embeddings by content hash
+        self.chunk_sync_collection = self.db.chunk_sync_versions  # Serializes concurrent chunk writes per policy
+        self.ingest_jobs_collection = self.db.ingest_jobs  # Background PDF ingestion jobs
+        self.ingest_files = AsyncIOMotorGridFSBucket(self.db, bucket_name="ingest_uploads")  # Job PDFs and extracted text
+        
+        # Lexical indexes being built in the background for library-wide questions
+        self._lexical_builds: Set[asyncio.Task] = set()
+        self._lexical_building: Set[Tuple[str, str]] = set()
         
         # Show which database we're connecting to
         print(f"🔍 Connecting to database: {self.db.name}")
@@ -90,6 +139,8 @@ class DatabaseService:
             chunk_count = await self.chunks_collection.count_documents({})
             print(f"🔍 Found {chunk_count} total chunks in {self.chunks_collection.name}")
             
+            await self.ensure_indexes()
+            
         except Exception as e:
             print(f"❌ Failed to connect to MongoDB: {e}")
             raise
@@ -134,8 +185,31 @@ class DatabaseService:
             return None
 
     @retry_on_dns_error(max_retries=3, delay=1)
-    async def store_document_chunks(self, chunks: List[Dict[str, Any]], document_id: str, user_id: str) -> bool:
-        """Store document chunks in the database"""
+    async def store_document_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        document_id: str,
+        user_id: str,
+        lexical_index: Optional[LexicalIndex] = None,
+        embed_missing: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None
+    ) -> bool:
+        """
+        Store a policy's chunks, replacing its previously stored chunk set
+        
+        The new chunks are diffed against the stored ones by content hash:
+        unchanged chunks are kept (only their position is updated), new ones
+        inserted and vanished ones deleted, in one bulk_write. Only chunks
+        that get inserted need an "embedding". The policy's lexical index is
+        stored too if given.
+        
+        The stored hashes are read and the diff planned inside the write's
+        transaction, which also bumps the policy's chunk_sync version, so
+        concurrent uploads of one policy are applied one after the other and
+        never both insert. If a concurrent upload changed the stored chunks
+        so that a chunk without an embedding now has to be inserted,
+        embed_missing is awaited with those chunks (it must set their
+        "embedding") and the write is planned again.
+        """
         print(f"🔍 Storing chunks in database...")
         
         if not user_id:
@@ -146,86 +220,593 @@ class DatabaseService:
             # Use the provided policy_id as document_id for consistency
             document_id_to_use = document_id
             
-            # Prepare chunks for storage
-            chunks_to_store = []
-            for i, chunk in enumerate(chunks):
-                chunk_doc = {
-                    "document_id": document_id_to_use,  # Use policy_id as document_id
-                    "user_id": user_id,
-                    "chunk_index": i,
-                    "text": chunk["text"],
-                    "embedding": chunk["embedding"],
-                    "created_at": chunk.get("created_at")
-                }
-                chunks_to_store.append(chunk_doc)
-                print(f"🔍 Chunk {i}: document_id={document_id_to_use}, user_id={user_id}, text_length={len(chunk['text'])}")
-            
-            # Store chunks in database
-            if chunks_to_store:
-                result = await self.chunks_collection.insert_many(chunks_to_store)
-                print(f"🔍 Stored {len(result.inserted_ids)} chunks with document_id: {document_id_to_use}, user_id: {user_id}")
-                
-                # Verify chunks were stored
-                verify_query = {"document_id": document_id_to_use, "user_id": user_id}
-                stored_chunks = await self.chunks_collection.find(verify_query).to_list(length=None)
-                print(f"🔍 Verification: Found {len(stored_chunks)} chunks in database after storage")
-                
-                return True
-            else:
+            if not chunks:
                 print("❌ No chunks to store")
                 return False
+            
+            content_hashes = [chunk.get("content_hash") or chunk_text_hash(chunk["text"]) for chunk in chunks]
+            
+            for attempt in range(CHUNK_SYNC_ATTEMPTS):
+                try:
+                    async with _chunk_sync_locks.hold((user_id, document_id_to_use)):
+                        plan, chunk_ids, inserted_docs = await self._run_atomic(
+                            lambda session: self._sync_chunks(chunks, content_hashes, document_id_to_use, user_id, session)
+                        )
+                    break
+                except ChunksNeedEmbedding as e:
+                    if embed_missing is None or attempt == CHUNK_SYNC_ATTEMPTS - 1:
+                        print(f"❌ {len(e.positions)} new chunks have no embedding (chunk {e.positions[0]} first)")
+                        return False
+                    print(f"🔄 Stored chunks changed during ingest, embedding {len(e.positions)} more chunks")
+                    await embed_missing([chunks[i] for i in e.positions])
+            
+            if not plan.unchanged:
+                # The policy's chunk set changed, so any cached matrix is out of date
+                embedding_matrix_cache.invalidate(user_id, document_id_to_use)
+                if vector_store is not None:
+                    vector_store.delete_document(user_id, document_id_to_use)
+                try:
+                    library_indexes.remove_chunks(user_id, plan.delete)
+                    if inserted_docs:
+                        library_indexes.add_document(
+                            user_id,
+                            build_embedding_matrix([decode_embedding(chunk["embedding"]) for chunk in inserted_docs]),
+                            [chunk["_id"] for chunk in inserted_docs],
+                            document_id_to_use
+                        )
+                except Exception as e:
+                    print(f"⚠️ Could not update library index, rebuilding on next search: {e}")
+                    library_indexes.invalidate(user_id)
+            
+            if lexical_index is not None:
+                # Index rows follow chunk order, so they line up with the final chunk ids
+                lexical_index.chunk_ids = chunk_ids
+                await self.store_lexical_index(document_id_to_use, user_id, lexical_index)
+            elif not plan.unchanged:
+                await self.lexical_indexes_collection.delete_many({"document_id": document_id_to_use, "user_id": user_id})
+                lexical_index_cache.invalidate(user_id, document_id_to_use)
+            
+            # Verify chunks were stored
+            verify_query = {"document_id": document_id_to_use, "user_id": user_id}
+            stored_count = await self.chunks_collection.count_documents(verify_query)
+            print(f"🔍 Verification: Found {stored_count} chunks in database after storage")
+            
+            return True
                 
         except Exception as e:
             print(f"❌ Error storing chunks: {e}")
             return False
 
+    @retry_on_dns_error(max_retries=3, delay=1)
+    async def get_document_chunk_hashes(self, document_id: str, user_id: str) -> List[Dict[str, Any]]:
+        """Stored chunks of a policy with just what chunk diffing needs"""
+        return await self.chunks_collection.find(
+            {"document_id": document_id, "user_id": user_id},
+            CHUNK_HASH_PROJECTION
+        ).to_list(length=None)
+
+    async def _sync_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        content_hashes: List[str],
+        document_id: str,
+        user_id: str,
+        session: Any
+    ) -> Tuple[ChunkSyncPlan, List[Any], List[Dict[str, Any]]]:
+        """Plan and apply a policy's chunk diff; run inside _run_atomic"""
+        # Written first, so a concurrent sync of this policy conflicts here and is retried after this one commits
+        await self.chunk_sync_collection.update_one(
+            {"_id": f"{user_id}:{document_id}"},
+            {"$inc": {"version": 1}, "$set": {"user_id": user_id, "document_id": document_id, "updated_at": datetime.utcnow()}},
+            upsert=True,
+            session=session
+        )
+        # With the text, so a kept chunk whose text differs (hashes ignore whitespace) is rewritten
+        stored_chunks = await self.chunks_collection.find(
+            {"document_id": document_id, "user_id": user_id},
+            {**CHUNK_HASH_PROJECTION, "text": 1},
+            session=session
+        ).to_list(length=None)
+        plan = plan_chunk_sync(content_hashes, stored_chunks)
+        
+        missing = [i for i in plan.insert if chunks[i].get("embedding") is None]
+        if missing:
+            raise ChunksNeedEmbedding(missing)
+        
+        operations = []
+        chunk_ids: List[Any] = [None] * len(chunks)
+        inserted_docs = []
+        
+        for i, stored in plan.keep.items():
+            chunk_ids[i] = stored["_id"]
+            # The offsets describe the new text, so the text moves with them
+            position = {
+                "chunk_index": i,
+                "start_char": chunks[i].get("start_char"),
+                "end_char": chunks[i].get("end_char"),
+                "text": chunks[i]["text"]
+            }
+            if any(stored.get(name) != value for name, value in position.items()):
+                operations.append(UpdateOne({"_id": stored["_id"]}, {"$set": position}))
+        
+        for i in plan.insert:
+            chunk = chunks[i]
+            chunk_doc = {
+                "_id": ObjectId(),
+                "document_id": document_id,  # Use policy_id as document_id
+                "user_id": user_id,
+                "chunk_index": i,
+                "text": chunk["text"],
+                "content_hash": content_hashes[i],
+                "start_char": chunk.get("start_char"),
+                "end_char": chunk.get("end_char"),
+                "embedding": encode_embedding(chunk["embedding"]),
+                "embedding_format": EMBEDDING_FORMAT_BINARY,
+                "created_at": chunk.get("created_at")
+            }
+            chunk_ids[i] = chunk_doc["_id"]
+            inserted_docs.append(chunk_doc)
+            operations.append(InsertOne(chunk_doc))
+        
+        if plan.delete:
+            operations.append(DeleteMany({"_id": {"$in": plan.delete}}))
+        
+        print(f"🔍 Chunk sync for policy {document_id}: {len(plan.keep)} kept, {len(plan.insert)} inserted, {len(plan.delete)} deleted")
+        
+        if operations:
+            await self.chunks_collection.bulk_write(operations, ordered=True, session=session)
+        return plan, chunk_ids, inserted_docs
+
+    async def _run_atomic(self, work: Callable[[Any], Awaitable[Any]]) -> Any:
+        """
+        Run work(session) in a transaction, so readers see the whole change
+        or none of it; transient conflicts (e.g. with a concurrent writer)
+        retry the whole of work. Servers without transaction support
+        (standalone mongod) run work(None) without one; any other failure,
+        including an aborted transaction, is raised.
+        """
+        try:
+            async with await self.client.start_session() as session:
+                return await session.with_transaction(work)
+        except (OperationFailure, ConfigurationError, NotImplementedError) as e:
+            # 20 (IllegalOperation): "Transaction numbers are only allowed on a replica set member or mongos"
+            if isinstance(e, OperationFailure) and e.code != 20:
+                raise
+            print(f"⚠️ Transactions not supported ({e}), applying bulk write without one")
+            return await work(None)
+
     async def vector_search(self, query_embedding: List[float], user_id: str, document_id: str, limit: int = 5) -> List[Dict[str, Any]]:
-        """Perform vector search to find relevant chunks"""
+        """
+        Perform vector search to find relevant chunks
+        
+        Two phases: score against the policy's embedding matrix (cached, or
+        loaded with only ids and embeddings projected), then fetch the full
+        documents for just the top-k chunk ids.
+        """
         print(f"🔍 Vector Search: Looking for chunks with query: {{'user_id': '{user_id}', 'document_id': '{document_id}'}}")
         print(f"🔍 Vector Search: User ID: {user_id}, Policy ID: {document_id}")
         
         try:
-            # Find chunks for this user and document
-            query = {
-                "user_id": user_id,
-                "document_id": document_id
-            }
+            for attempt in range(2):
+                embeddings = await self.get_embedding_matrix(user_id, document_id)
+                if embeddings is None:
+                    print(f"🔍 Vector Search: No chunks found for user {user_id}, policy {document_id}")
+                    return []
+                
+                # Phase 1: score every chunk with one matrix-vector product
+                indices, scores = score_embeddings(embeddings, query_embedding, limit)
+                winner_ids = [embeddings.chunk_ids[i] for i in indices]
+                
+                # Phase 2: fetch text and metadata for the winners only
+                chunks_by_id = await self._get_chunks_by_ids(winner_ids)
+                
+                top_chunks = []
+                for chunk_id, score in zip(winner_ids, scores):
+                    chunk = chunks_by_id.get(chunk_id)
+                    if chunk is None:
+                        continue
+                    chunk["similarity_score"] = float(score)
+                    top_chunks.append(chunk)
+                
+                if len(top_chunks) == len(winner_ids):
+                    break
+                
+                # A winner vanished underneath us - the cached matrix is stale
+                print(f"🔍 Vector Search: Cached matrix is stale for policy {document_id}, reloading")
+                embedding_matrix_cache.invalidate(user_id, document_id)
+                if vector_store is not None:
+                    vector_store.delete_document(user_id, document_id)
             
-            chunks = await self.chunks_collection.find(query).to_list(length=None)
-            print(f"🔍 Vector Search: Found {len(chunks)} chunks")
+            print(f"🔍 Vector Search: Returning {len(top_chunks)} most relevant chunks")
+            return top_chunks
             
-            if not chunks:
-                print(f"🔍 Vector Search: No chunks found for user {user_id}, policy {document_id}")
+        except Exception as e:
+            print(f"❌ Error in vector search: {e}")
+            return []
+
+    async def vector_search_batch(
+        self,
+        query_embeddings: List[List[float]],
+        user_id: str,
+        document_id: str,
+        limit: int = 5
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Vector search for several questions against one policy
+        
+        The policy's matrix is loaded once and all questions are scored with a
+        single matrix-matrix product (the exact product beats the per-query
+        quantized pass once its cost is shared by many questions). The winners'
+        text is then fetched in one query.
+        
+        Returns:
+            One list of chunks per question, in question order
+        """
+        print(f"🔍 Vector Search: Scoring {len(query_embeddings)} questions against policy {document_id}")
+        
+        try:
+            for attempt in range(2):
+                embeddings = await self.get_embedding_matrix(user_id, document_id)
+                if embeddings is None:
+                    print(f"🔍 Vector Search: No chunks found for user {user_id}, policy {document_id}")
+                    return [[] for _ in query_embeddings]
+                
+                indices, scores = score_top_k_batch(embeddings.matrix, query_embeddings, limit)
+                winner_ids = {embeddings.chunk_ids[i] for i in indices.ravel()}
+                chunks_by_id = await self._get_chunks_by_ids(list(winner_ids))
+                
+                results = []
+                for row_indices, row_scores in zip(indices, scores):
+                    top_chunks = []
+                    for i, score in zip(row_indices, row_scores):
+                        chunk = chunks_by_id.get(embeddings.chunk_ids[i])
+                        if chunk is not None:
+                            # Copies, since the same chunk can score differently per question
+                            top_chunks.append({**chunk, "similarity_score": float(score)})
+                    results.append(top_chunks)
+                
+                if len(chunks_by_id) == len(winner_ids):
+                    break
+                
+                print(f"🔍 Vector Search: Cached matrix is stale for policy {document_id}, reloading")
+                embedding_matrix_cache.invalidate(user_id, document_id)
+                if vector_store is not None:
+                    vector_store.delete_document(user_id, document_id)
+            
+            return results
+            
+        except Exception as e:
+            print(f"❌ Error in batch vector search: {e}")
+            return [[] for _ in query_embeddings]
+
+    async def get_chunk_sync_version(self, user_id: str, document_id: str) -> int:
+        """Number of times a policy's chunks were written or deleted (0 before the first sync)"""
+        version_doc = await self.chunk_sync_collection.find_one({"_id": f"{user_id}:{document_id}"}, {"version": 1})
+        return version_doc.get("version", 0) if version_doc else 0
+
+    @retry_on_dns_error(max_retries=3, delay=1)
+    async def get_embedding_matrix(self, user_id: str, document_id: str) -> Optional[EmbeddingMatrix]:
+        """
+        Get a policy's normalized embedding matrix, from the process cache if
+        possible, otherwise by projecting only _id, chunk_index and embedding
+        
+        Shared segments carry the chunk sync version their rows were read at:
+        older ones are ignored, and a build that overlapped a chunk write is
+        returned but not written, so no worker keeps serving stale rows.
+        """
+        version = 0
+        if vector_store is not None:
+            # Read before the chunks, so a write that lands during the build is noticed below
+            version = await self.get_chunk_sync_version(user_id, document_id)
+            cached = vector_store.load_document(user_id, document_id, version)
+        else:
+            cached = embedding_matrix_cache.get(user_id, document_id)
+        if cached is not None:
+            print(f"🚀 Vector Search: Embedding matrix cache hit ({len(cached.chunk_ids)} chunks)")
+            return cached
+        
+        query = {
+            "user_id": user_id,
+            "document_id": document_id
+        }
+        projection = {"_id": 1, "chunk_index": 1, "embedding": 1}
+        
+        chunks = await self.chunks_collection.find(query, projection).sort("chunk_index", 1).to_list(length=None)
+        print(f"🔍 Vector Search: Loaded {len(chunks)} chunk embeddings")
+        
+        rows = valid_embedding_rows(chunks)
+        if not rows:
+            return None
+        
+        matrix = build_embedding_matrix([decode_embedding(chunks[i]["embedding"]) for i in rows])
+        embeddings = EmbeddingMatrix(
+            matrix=matrix,
+            chunk_ids=[chunks[i]["_id"] for i in rows],
+            # Large policies get sign-bit codes for a cheap first scoring pass
+            quantized=quantize_matrix(matrix) if len(rows) >= QUANTIZED_SEARCH_MIN_ROWS else None
+        )
+        if vector_store is not None:
+            if await self.get_chunk_sync_version(user_id, document_id) != version:
+                print(f"⚠️ Vector Store: Chunks of policy {document_id} changed while its matrix was built, not writing the segment")
+                return embeddings
+            # Shared segment files replace the per-process copy
+            await asyncio.to_thread(
+                vector_store.write_document,
+                user_id,
+                document_id,
+                embeddings.matrix,
+                embeddings.chunk_ids,
+                embeddings.quantized,
+                version
+            )
+        else:
+            embedding_matrix_cache.put(user_id, document_id, embeddings)
+        return embeddings
+
+    async def lexical_search(
+        self,
+        query: str,
+        user_id: str,
+        document_id: Optional[str] = None,
+        limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """
+        BM25 search over one policy, or over every policy of the user when
+        document_id is None. Needs no embedding, so it also serves as the
+        fallback when the embedding API is unavailable.
+        """
+        try:
+            if document_id:
+                document_ids = [document_id]
+                index = await self.get_lexical_index(user_id, document_id)
+                indexes = {document_id: index} if index is not None else {}
+            else:
+                document_ids = await self.chunks_collection.distinct("document_id", {"user_id": user_id})
+                indexes = await self.get_library_lexical_indexes(user_id, document_ids)
+            
+            started = time.time()
+            hits: List[Tuple[Any, str, float]] = []
+            for doc_id, index in indexes.items():
+                rows, scores = index.search(query, limit)
+                hits.extend((index.chunk_ids[row], doc_id, float(score)) for row, score in zip(rows, scores))
+            
+            hits.sort(key=lambda hit: hit[2], reverse=True)
+            hits = hits[:limit]
+            print(f"🔍 Lexical Search: {len(hits)} matches in {len(document_ids)} policies in {(time.time() - started) * 1000:.1f}ms")
+            if not hits:
                 return []
             
-            # Show details of first chunk
-            if chunks:
-                first_chunk = chunks[0]
-                print(f"🔍 Vector Search: First chunk keys: {list(first_chunk.keys())}")
-                print(f"🔍 Vector Search: First chunk document_id: {first_chunk.get('document_id')}")
-                print(f"🔍 Vector Search: First chunk user_id: {first_chunk.get('user_id')}")
+            chunks_by_id = await self._get_chunks_by_ids([chunk_id for chunk_id, _, _ in hits])
+            titles = await self._get_policy_titles(list({doc_id for _, doc_id, _ in hits})) if not document_id else {}
             
-            # Calculate similarities
-            similarities = []
-            query_embedding_array = np.array(query_embedding).reshape(1, -1)
+            top_score = hits[0][2]
+            top_chunks = []
+            for chunk_id, doc_id, score in hits:
+                chunk = chunks_by_id.get(chunk_id)
+                if chunk is None:
+                    continue
+                chunk["lexical_score"] = score
+                chunk["similarity_score"] = LEXICAL_SCORE_WEIGHT * score / top_score
+                if titles.get(doc_id):
+                    chunk["policy_title"] = titles[doc_id]
+                top_chunks.append(chunk)
+            return top_chunks
             
-            for chunk in chunks:
-                if "embedding" in chunk and chunk["embedding"]:
-                    chunk_embedding = np.array(chunk["embedding"]).reshape(1, -1)
-                    similarity = cosine_similarity(query_embedding_array, chunk_embedding)[0][0]
-                    similarities.append((similarity, chunk))
+        except Exception as e:
+            print(f"❌ Error in lexical search: {e}")
+            return []
+
+    async def get_lexical_index(self, user_id: str, document_id: str) -> Optional[LexicalIndex]:
+        """
+        Get a policy's lexical index from the process cache or policy_lexical_indexes,
+        building it from the stored chunk texts for policies ingested before it existed
+        """
+        cached = lexical_index_cache.get(user_id, document_id)
+        if cached is not None:
+            return cached
+        
+        stored = await self.lexical_indexes_collection.find_one({"user_id": user_id, "document_id": document_id})
+        index = LexicalIndex.from_document(stored) if stored else None
+        
+        if index is None:
+            chunks = await self.chunks_collection.find(
+                {"user_id": user_id, "document_id": document_id},
+                {"_id": 1, "text": 1}
+            ).sort("chunk_index", 1).to_list(length=None)
+            if not chunks:
+                return None
             
-            # Sort by similarity and return top results
-            similarities.sort(key=lambda x: x[0], reverse=True)
-            top_chunks = [chunk for _, chunk in similarities[:limit]]
+            index = build_lexical_index([chunk.get("text", "") for chunk in chunks], [chunk["_id"] for chunk in chunks])
+            print(f"🔍 Lexical Search: Built index for policy {document_id} ({index.size} chunks, {len(index.terms)} terms)")
+            await self.store_lexical_index(document_id, user_id, index)
+        
+        lexical_index_cache.put(user_id, document_id, index)
+        return index
+
+    async def get_library_lexical_indexes(self, user_id: str, document_ids: List[str]) -> Dict[str, LexicalIndex]:
+        """
+        Lexical indexes of many policies for a library-wide question: cached
+        ones, then every stored one in a single $in query. Policies without a
+        stored index are left out of this question and built in the
+        background, so the request never builds indexes from chunk text.
+        """
+        indexes: Dict[str, LexicalIndex] = {}
+        missing: List[str] = []
+        for doc_id in document_ids:
+            cached = lexical_index_cache.get(user_id, doc_id)
+            if cached is not None:
+                indexes[doc_id] = cached
+            else:
+                missing.append(doc_id)
+        if not missing:
+            return indexes
+        
+        stored = await self.lexical_indexes_collection.find(
+            {"user_id": user_id, "document_id": {"$in": missing}}
+        ).to_list(length=None)
+        for document in stored:
+            index = LexicalIndex.from_document(document)
+            if index is not None:
+                lexical_index_cache.put(user_id, document["document_id"], index)
+                indexes[document["document_id"]] = index
+        
+        unbuilt = [doc_id for doc_id in missing if doc_id not in indexes]
+        if unbuilt:
+            print(f"🔍 Lexical Search: {len(unbuilt)} policies have no lexical index yet, building them in the background")
+            task = asyncio.create_task(self._build_lexical_indexes(user_id, unbuilt))
+            self._lexical_builds.add(task)
+            task.add_done_callback(self._lexical_builds.discard)
+        return indexes
+
+    async def _build_lexical_indexes(self, user_id: str, document_ids: List[str]) -> None:
+        for doc_id in document_ids:
+            key = (user_id, doc_id)
+            if key in self._lexical_building:
+                continue
+            self._lexical_building.add(key)
+            try:
+                await self.get_lexical_index(user_id, doc_id)
+            except Exception as e:
+                print(f"⚠️ Could not build lexical index for policy {doc_id}: {e}")
+            finally:
+                self._lexical_building.discard(key)
+
+    @retry_on_dns_error(max_retries=3, delay=1)
+    async def store_lexical_index(self, document_id: str, user_id: str, index: LexicalIndex) -> bool:
+        """Persist a policy's lexical index, replacing any previous one"""
+        try:
+            document = index.to_document()
+            document.update({"document_id": document_id, "user_id": user_id})
+            await self.lexical_indexes_collection.replace_one(
+                {"document_id": document_id, "user_id": user_id},
+                document,
+                upsert=True
+            )
+            lexical_index_cache.put(user_id, document_id, index)
+            return True
+        except Exception as e:
+            # Search rebuilds the index from chunk texts when it is missing
+            print(f"⚠️ Could not store lexical index for policy {document_id}: {e}")
+            lexical_index_cache.invalidate(user_id, document_id)
+            return False
+
+    async def library_search(self, query_embedding: List[float], user_id: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Search across every policy a user has uploaded using their library ANN index"""
+        print(f"🔍 Library Search: Searching all policies for user {user_id}")
+        
+        try:
+            index = await self.get_library_index(user_id)
+            if index is None:
+                print(f"🔍 Library Search: No chunks found for user {user_id}")
+                return []
             
-            print(f"🔍 Vector Search: Returning {len(top_chunks)} most relevant chunks")
+            started = time.time()
+            results = index.search(query_embedding, limit)
+            print(f"🔍 Library Search: Scored {index.size} chunks in {(time.time() - started) * 1000:.1f}ms")
+            
+            chunks_by_id = await self._get_chunks_by_ids([chunk_id for chunk_id, _, _ in results])
+            titles = await self._get_policy_titles(list({document_id for _, document_id, _ in results}))
+            
+            top_chunks = []
+            for chunk_id, document_id, score in results:
+                chunk = chunks_by_id.get(chunk_id)
+                if chunk is None:
+                    continue
+                chunk["similarity_score"] = score
+                chunk["policy_title"] = titles.get(document_id)
+                top_chunks.append(chunk)
+            
+            print(f"🔍 Library Search: Returning {len(top_chunks)} chunks from {len({c['document_id'] for c in top_chunks})} policies")
             return top_chunks
             
         except Exception as e:
-            print(f"❌ Error in vector search: {e}")
+            print(f"❌ Error in library search: {e}")
             return []
 
+    async def get_library_index(self, user_id: str):
+        """Get the user's library index, building it from policy_chunks on first use"""
+        index = library_indexes.get(user_id)
+        if index is not None:
+            return index
+        
+        async with library_indexes.lock(user_id):
+            index = library_indexes.get(user_id)
+            if index is not None:
+                return index
+            
+            # Chunks stored or deleted while the index builds would be missing from it
+            generation = library_indexes.generation(user_id)
+            projection = {"_id": 1, "document_id": 1, "embedding": 1}
+            chunks = await self.chunks_collection.find({"user_id": user_id}, projection).to_list(length=None)
+            rows = valid_embedding_rows(chunks)
+            if not rows:
+                return None
+            
+            vectors = build_embedding_matrix([decode_embedding(chunks[i]["embedding"]) for i in rows])
+            index = await asyncio.to_thread(
+                library_indexes.build,
+                vectors,
+                [chunks[i]["_id"] for i in rows],
+                [chunks[i]["document_id"] for i in rows]
+            )
+            if not library_indexes.put(user_id, index, generation):
+                print(f"🔍 Library Index: Chunks changed during the build, not caching the index for user {user_id}")
+            return index
+
+    async def _get_policy_titles(self, policy_ids: List[str]) -> Dict[str, str]:
+        """Look up policy titles for a set of policy ids in one query"""
+        object_ids = [ObjectId(policy_id) for policy_id in policy_ids if ObjectId.is_valid(policy_id)]
+        if not object_ids:
+            return {}
+        try:
+            policies = await self.policies_collection.find({"_id": {"$in": object_ids}}, {"title": 1}).to_list(length=None)
+            return {str(policy["_id"]): policy.get("title") for policy in policies}
+        except Exception as e:
+            print(f"❌ Error getting policy titles: {e}")
+            return {}
+
+    @retry_on_dns_error(max_retries=3, delay=1)
+    async def _get_chunks_by_ids(self, chunk_ids: List[Any]) -> Dict[Any, Dict[str, Any]]:
+        """Fetch chunk documents (without embeddings) for a set of ids in one query"""
+        if not chunk_ids:
+            return {}
+        cursor = self.chunks_collection.find({"_id": {"$in": chunk_ids}}, {"embedding": 0})
+        chunks = await cursor.to_list(length=None)
+        return {chunk["_id"]: chunk for chunk in chunks}
+
+    @retry_on_dns_error(max_retries=3, delay=1)
+    async def delete_policy_document(self, document_id: str, user_id: Optional[str] = None) -> bool:
+        """Delete all AI chunks stored for a policy"""
+        try:
+            query = {"document_id": document_id}
+            if user_id:
+                query["user_id"] = user_id
+            
+            result = await self.chunks_collection.delete_many(query)
+            await self.lexical_indexes_collection.delete_many(query)
+            # Segments built from chunks read before the delete are stale now
+            await self.chunk_sync_collection.update_many(query, {"$inc": {"version": 1}})
+            
+            if user_id:
+                embedding_matrix_cache.invalidate(user_id, document_id)
+                lexical_index_cache.invalidate(user_id, document_id)
+            else:
+                embedding_matrix_cache.invalidate_document(document_id)
+                lexical_index_cache.invalidate_document(document_id)
+            if vector_store is not None:
+                if user_id:
+                    vector_store.delete_document(user_id, document_id)
+                else:
+                    vector_store.delete_document_for_all_users(document_id)
+            library_indexes.remove_document(document_id, user_id)
+            
+            print(f"🗑️ Deleted {result.deleted_count} chunks for policy {document_id}")
+            return result.deleted_count > 0
+            
+        except Exception as e:
+            print(f"❌ Error deleting policy chunks: {e}")
+            return False
+
     @retry_on_dns_error(max_retries=3, delay=1)
     async def update_policy_ai_status(self, policy_id: str, ai_processed: bool = True) -> bool:
         """Update the AI processing status of a policy"""
@@ -267,16 +848,17 @@ class DatabaseService:
             return False
 
     @retry_on_dns_error(max_retries=3, delay=1)
-    async def get_document_chunks(self, document_id: str, user_id: str) -> List[Dict[str, Any]]:
-        """Get all chunks for a document"""
+    async def get_document_chunks(self, document_id: str, user_id: str, include_embeddings: bool = False) -> List[Dict[str, Any]]:
+        """Get all chunks for a document, in chunk order (embeddings only on request)"""
         try:
             query = {
                 "document_id": document_id,
                 "user_id": user_id
             }
+            projection = None if include_embeddings else {"embedding": 0}
             
             print(f"🔍 Vector Search: Query: {query}")
-            chunks = await self.chunks_collection.find(query).to_list(length=None)
+            chunks = await self.chunks_collection.find(query, projection).sort("chunk_index", 1).to_list(length=None)
             print(f"🔍 Vector Search: Found {len(chunks)} chunks for document {document_id}")
             
             # Debug: Check if there are any chunks at all
@@ -289,16 +871,370 @@ class DatabaseService:
             print(f"❌ Error getting document chunks: {e}")
             return []
 
-    async def get_stats(self) -> Dict[str, Any]:
+    async def migrate_embedding_storage(self, batch_size: int = 200, pause_seconds: float = 0.5) -> int:
+        """
+        Background migration of legacy array embeddings to the binary format.
+        Safe to run from several workers at once: each update only matches
+        documents that still hold an array.
+        
+        The collection is paged through in _id order, resuming after the
+        last _id seen, so every document is scanned once rather than once
+        per batch (nothing indexes embeddings by type).
+        """
+        migrated = 0
+        print("🔄 Embedding migration: converting legacy array embeddings to binary format...")
+        
+        # Empty legacy arrays have nothing to convert
+        legacy = {"embedding": {"$type": "array"}, "embedding.0": {"$exists": True}}
+        last_id = None
+        
+        try:
+            while True:
+                page = legacy if last_id is None else {"_id": {"$gt": last_id}, **legacy}
+                legacy_chunks = await self.chunks_collection.find(
+                    page,
+                    {"embedding": 1}
+                ).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+                
+                if not legacy_chunks:
+                    break
+                last_id = legacy_chunks[-1]["_id"]
+                
+                operations = [
+                    UpdateOne(
+                        {"_id": chunk["_id"], **legacy},
+                        {"$set": {
+                            "embedding": encode_embedding(chunk["embedding"]),
+                            "embedding_format": EMBEDDING_FORMAT_BINARY
+                        }}
+                    )
+                    for chunk in legacy_chunks
+                ]
+                
+                result = await self.chunks_collection.bulk_write(operations, ordered=False)
+                migrated += result.modified_count
+                print(f"🔄 Embedding migration: {migrated} chunks converted so far")
+                
+                # Yield to request traffic between batches
+                await asyncio.sleep(pause_seconds)
+            
+            print(f"✅ Embedding migration complete: {migrated} chunks converted")
+        except Exception as e:
+            print(f"❌ Embedding migration stopped after {migrated} chunks: {e}")
+        
+        return migrated
+
+    async def ensure_indexes(self):
+        """Create the indexes the embedding caches and ingest jobs rely on"""
+        try:
+            await self.query_embeddings_collection.create_index(
+                "created_at",
+                expireAfterSeconds=query_embedding_cache.ttl,
+                name="created_at_ttl"
+            )
+        except Exception as e:
+            # An existing index with another TTL keeps working; drop it to apply a new TTL
+            print(f"⚠️ Could not create query embedding TTL index: {e}")
+        
+        try:
+            # Least recently used entries are evicted first
+            await self.embedding_store_collection.create_index("last_used_at")
+        except Exception as e:
+            print(f"⚠️ Could not create embedding store index: {e}")
+        
+        try:
+            # Workers look for queued jobs that are due and running jobs with an expired lease
+            await self.ingest_jobs_collection.create_index([("status", 1), ("available_at", 1)])
+            await self.ingest_jobs_collection.create_index([("status", 1), ("lease_expires_at", 1)])
+            await self.ingest_jobs_collection.create_index([("policy_id", 1), ("status", 1)])
+        except Exception as e:
+            print(f"⚠️ Could not create ingest job indexes: {e}")
+
+    async def get_cached_query_embeddings(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Look up cached question embeddings by cache key in one query"""
+        if not keys:
+            return {}
+        try:
+            cursor = self.query_embeddings_collection.find({"_id": {"$in": keys}}, {"embedding": 1})
+            documents = await cursor.to_list(length=None)
+            return {document["_id"]: decode_embedding(document["embedding"]).tolist() for document in documents}
+        except Exception as e:
+            print(f"❌ Error reading query embedding cache: {e}")
+            return {}
+
+    async def store_query_embeddings(self, embeddings: Dict[str, List[float]], model: str) -> bool:
+        """Upsert question embeddings by cache key, restarting their TTL"""
+        if not embeddings:
+            return True
+        try:
+            now = datetime.utcnow()
+            operations = [
+                UpdateOne(
+                    {"_id": key},
+                    {"$set": {"embedding": encode_embedding(embedding), "model": model, "created_at": now}},
+                    upsert=True
+                )
+                for key, embedding in embeddings.items()
+            ]
+            await self.query_embeddings_collection.bulk_write(operations, ordered=False)
+            return True
+        except Exception as e:
+            print(f"❌ Error writing query embedding cache: {e}")
+            return False
+
+    async def get_stored_embeddings(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Look up chunk embeddings by content key with one $in query, marking hits as recently used"""
+        if not keys:
+            return {}
+        try:
+            documents = await self.embedding_store_collection.find(
+                {"_id": {"$in": keys}},
+                {"embedding": 1}
+            ).to_list(length=None)
+            
+            found = {document["_id"]: decode_embedding(document["embedding"]).tolist() for document in documents}
+            if found:
+                await self.embedding_store_collection.update_many(
+                    {"_id": {"$in": list(found)}},
+                    {"$set": {"last_used_at": datetime.utcnow()}}
+                )
+            return found
+        except Exception as e:
+            print(f"❌ Error reading embedding store: {e}")
+            return {}
+
+    async def put_stored_embeddings(self, embeddings: Dict[str, List[float]], model: str) -> bool:
+        """Add chunk embeddings to the content-addressed store, then evict if it is over its size limit"""
+        if not embeddings:
+            return True
+        try:
+            now = datetime.utcnow()
+            encoded = {key: encode_embedding(embedding) for key, embedding in embeddings.items()}
+            operations = [
+                UpdateOne(
+                    {"_id": key},
+                    {
+                        "$set": {"embedding": value, "model": model, "last_used_at": now},
+                        "$setOnInsert": {"created_at": now}
+                    },
+                    upsert=True
+                )
+                for key, value in encoded.items()
+            ]
+            await self.embedding_store_collection.bulk_write(operations, ordered=False)
+            
+            entry_bytes = len(next(iter(encoded.values()))) + ENTRY_OVERHEAD_BYTES
+            await self.evict_embedding_store(entry_bytes)
+            return True
+        except Exception as e:
+            print(f"❌ Error writing embedding store: {e}")
+            return False
+
+    async def evict_embedding_store(self, entry_bytes: int) -> int:
+        """Delete least recently used entries once the store exceeds EMBEDDING_STORE_MAX_MB"""
+        max_entries = max(1, EMBEDDING_STORE_MAX_BYTES // entry_bytes)
+        count = await self.embedding_store_collection.estimated_document_count()
+        if count <= max_entries:
+            return 0
+        
+        excess = count - int(max_entries * EMBEDDING_STORE_EVICTION_TARGET)
+        oldest = await self.embedding_store_collection.find({}, {"_id": 1}).sort("last_used_at", 1).limit(excess).to_list(length=excess)
+        result = await self.embedding_store_collection.delete_many({"_id": {"$in": [entry["_id"] for entry in oldest]}})
+        embedding_store_stats.evicted += result.deleted_count
+        print(f"🗑️ Embedding store: Evicted {result.deleted_count} least recently used embeddings")
+        return result.deleted_count
+
+    async def create_ingest_job(self, user_id: str, policy_id: str, filename: str, path: str, file_size: int) -> str:
+        """Stream the spooled PDF at path into GridFS and queue a job for it"""
+        job_id = ObjectId()
+        with open(path, "rb") as source:
+            file_id = await self.ingest_files.upload_from_stream(
+                filename,
+                source,
+                metadata={"job_id": job_id, "kind": "pdf"}
+            )
+        now = datetime.utcnow()
+        await self.ingest_jobs_collection.insert_one({
+            "_id": job_id,
+            "user_id": user_id,
+            "policy_id": policy_id,
+            "filename": filename,
+            "file_size": file_size,
+            "file_id": file_id,
+            "text_file_id": None,
+            "status": "queued",
+            "stage": "queued",
+            "percent": 0,
+            "attempts": 0,
+            "error": None,
+            "worker_id": None,
+            "lease_expires_at": None,
+            "available_at": now,
+            "created_at": now,
+            "updated_at": now
+        })
+        print(f"🔍 Queued ingest job {job_id} for policy {policy_id} ({file_size} bytes)")
+        return str(job_id)
+    
+    async def get_ingest_job(self, job_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        try:
+            query: Dict[str, Any] = {"_id": ObjectId(job_id)}
+        except Exception:
+            return None
+        if user_id:
+            query["user_id"] = user_id
+        return await self.ingest_jobs_collection.find_one(query)
+    
+    async def get_active_ingest_job(self, policy_id: str) -> Optional[Dict[str, Any]]:
+        """The queued or running job of a policy, if any"""
+        return await self.ingest_jobs_collection.find_one(
+            {"policy_id": policy_id, "status": {"$in": ["queued", "running"]}}
+        )
+    
+    async def claim_ingest_job(self, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """
+        Atomically take the oldest due job: a queued one, or a running one
+        whose worker stopped renewing its lease (e.g. the process died)
+        """
+        now = datetime.utcnow()
+        return await self.ingest_jobs_collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "available_at": {"$lte": now}},
+                {"status": "running", "lease_expires_at": {"$lt": now}}
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "worker_id": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    
+    async def _update_owned_ingest_job(self, job_id: Any, worker_id: str, update: Dict[str, Any]) -> bool:
+        """Apply an update only while worker_id still holds the job's lease"""
+        update.setdefault("$set", {})["updated_at"] = datetime.utcnow()
+        result = await self.ingest_jobs_collection.update_one(
+            {"_id": job_id, "status": "running", "worker_id": worker_id},
+            update
+        )
+        return result.matched_count > 0
+    
+    async def renew_ingest_job_lease(self, job_id: Any, worker_id: str, lease_seconds: float) -> bool:
+        return await self._update_owned_ingest_job(job_id, worker_id, {
+            "$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=lease_seconds)}
+        })
+    
+    async def update_ingest_job_progress(self, job_id: Any, worker_id: str, stage: str, percent: int) -> bool:
+        return await self._update_owned_ingest_job(job_id, worker_id, {"$set": {"stage": stage, "percent": percent}})
+    
+    async def store_ingest_text(self, job_id: Any, worker_id: str, filename: str, text: str) -> bool:
+        """Checkpoint the extracted text so a retry skips extraction and OCR"""
+        text_file_id = await self.ingest_files.upload_from_stream(
+            f"{filename}.txt",
+            text.encode("utf-8"),
+            metadata={"job_id": job_id, "kind": "text"}
+        )
+        stored = await self._update_owned_ingest_job(job_id, worker_id, {
+            "$set": {"text_file_id": text_file_id, "text_length": len(text)}
+        })
+        if not stored:
+            await self._delete_ingest_files([text_file_id])
+        return stored
+    
+    async def read_ingest_file(self, file_id: Any) -> bytes:
+        stream = await self.ingest_files.open_download_stream(file_id)
+        return await stream.read()
+    
+    async def download_ingest_file(self, file_id: Any, path: str) -> None:
+        """Write a stored file to path a GridFS chunk at a time"""
+        with open(path, "wb") as destination:
+            await self.ingest_files.download_to_stream(file_id, destination)
+    
+    async def complete_ingest_job(self, job_id: Any, worker_id: str, document_id: str, text_length: int) -> bool:
+        """Mark a job done and drop its stored PDF and text"""
+        job = await self.ingest_jobs_collection.find_one({"_id": job_id}, {"file_id": 1, "text_file_id": 1})
+        completed = await self._update_owned_ingest_job(job_id, worker_id, {"$set": {
+            "status": "completed",
+            "stage": "completed",
+            "percent": 100,
+            "document_id": document_id,
+            "text_length": text_length,
+            "error": None,
+            "lease_expires_at": None,
+            "finished_at": datetime.utcnow()
+        }})
+        if completed and job:
+            await self._delete_ingest_files([job.get("file_id"), job.get("text_file_id")])
+        return completed
+    
+    async def fail_ingest_job(
+        self,
+        job_id: Any,
+        worker_id: str,
+        error: str,
+        retry_in_seconds: Optional[float] = None
+    ) -> bool:
+        """Record a failure; the job is queued again after retry_in_seconds, or marked failed without it"""
+        fields: Dict[str, Any] = {"error": error, "worker_id": None, "lease_expires_at": None}
+        if retry_in_seconds is None:
+            fields.update({"status": "failed", "finished_at": datetime.utcnow()})
+        else:
+            fields.update({"status": "queued", "available_at": datetime.utcnow() + timedelta(seconds=retry_in_seconds)})
+        return await self._update_owned_ingest_job(job_id, worker_id, {"$set": fields})
+    
+    async def release_ingest_job(self, job_id: Any, worker_id: str) -> bool:
+        """Hand an interrupted job back to the queue without counting the attempt"""
+        return await self._update_owned_ingest_job(job_id, worker_id, {
+            "$set": {"status": "queued", "worker_id": None, "lease_expires_at": None, "available_at": datetime.utcnow()},
+            "$inc": {"attempts": -1}
+        })
+    
+    async def retry_ingest_job(self, job_id: str, user_id: Optional[str] = None) -> bool:
+        """Queue a failed job again with a fresh set of attempts"""
+        query: Dict[str, Any] = {"_id": ObjectId(job_id), "status": "failed"}
+        if user_id:
+            query["user_id"] = user_id
+        now = datetime.utcnow()
+        result = await self.ingest_jobs_collection.update_one(query, {"$set": {
+            "status": "queued",
+            "attempts": 0,
+            "available_at": now,
+            "updated_at": now,
+            "finished_at": None
+        }})
+        return result.modified_count > 0
+    
+    async def _delete_ingest_files(self, file_ids: List[Any]) -> None:
+        for file_id in file_ids:
+            if file_id is None:
+                continue
+            try:
+                await self.ingest_files.delete(file_id)
+            except Exception as e:
+                print(f"⚠️ Could not delete ingest file {file_id}: {e}")
+
+    async def get_stats(self, user_id: Optional[str] = None) -> Dict[str, Any]:
         """Get database statistics"""
         try:
             policy_count = await self.policies_collection.count_documents({})
-            chunk_count = await self.chunks_collection.count_documents({})
+            chunk_query = {"user_id": user_id} if user_id else {}
+            chunk_count = await self.chunks_collection.count_documents(chunk_query)
             
             return {
                 "policies": policy_count,
                 "chunks": chunk_count,
-                "database": self.db.name
+                "database": self.db.name,
+                "embedding_cache": vector_store.stats() if vector_store is not None else embedding_matrix_cache.stats(),
+                "lexical_index_cache": lexical_index_cache.stats(),
+                "query_embedding_cache": query_embedding_cache.stats(),
+                "embedding_scheduler": embedding_scheduler.stats(),
+                "embedding_store": embedding_store_stats.stats(),
+                "pdf_extraction": pdf_extraction_pool.stats()
             }
         except Exception as e:
             print(f"❌ Error getting stats: {e}")
@@ -0,0 +1,159 @@
+"""
+Token-aware batching of embedding requests
+- Groups texts into requests bounded by input count and total tokens
+  (counted with the embedding model's tiktoken encoding)
+- Maps returned vectors back to their texts by the response index
+- Retries only the sub-batches that failed; a rejected multi-text batch is
+  split in half so one bad input cannot fail the whole document
+- Sends sub-batches concurrently through the shared EmbeddingScheduler,
+  which enforces the concurrency and rate limits
+- Optionally hands each completed sub-batch to a callback, so callers can
+  checkpoint finished embeddings before the whole set is done
+"""
+
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional
+import openai
+import tiktoken
+
+from services.embedding_scheduler import EmbeddingScheduler
+
+# Per-input limit of the OpenAI embedding models
+MAX_INPUT_TOKENS = 8191
+
+# Errors worth retrying unchanged; anything else is a problem with the request itself
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError
+)
+
+
+class EmbeddingBatchError(Exception):
+    """An embedding sub-batch still failed after all retries"""
+
+
+# Called with the text positions of a completed sub-batch and their embeddings
+BatchCallback = Callable[[List[int], List[List[float]]], Awaitable[None]]
+
+
+class EmbeddingBatcher:
+    def __init__(
+        self,
+        client: Any,
+        model: str,
+        max_inputs: int = int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", "2048")),
+        max_tokens: int = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "200000")),
+        max_retries: int = int(os.getenv("EMBEDDING_BATCH_MAX_RETRIES", "3")),
+        retry_delay: float = 1.0,
+        encoding: Optional[Any] = None,
+        scheduler: Optional[EmbeddingScheduler] = None
+    ):
+        self.client = client
+        self.scheduler = scheduler
+        self.model = model
+        self.max_inputs = max_inputs
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._encoding = encoding
+
+    @property
+    def encoding(self):
+        # Loaded on first use so constructing the service stays cheap
+        if self._encoding is None:
+            self._encoding = tiktoken.encoding_for_model(self.model)
+        return self._encoding
+
+    def prepare(self, texts: List[str]) -> List[List[int]]:
+        """Token ids per text (newlines flattened, over-long texts truncated to the model limit)"""
+        token_lists = self.encoding.encode_batch([text.replace("\n", " ") for text in texts])
+        return [tokens[:MAX_INPUT_TOKENS] for tokens in token_lists]
+
+    def plan_batches(self, token_counts: List[int]) -> List[List[int]]:
+        """Greedy, order-preserving grouping of text positions into requests within both limits"""
+        batches: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+
+        for i, count in enumerate(token_counts):
+            if current and (len(current) >= self.max_inputs or current_tokens + count > self.max_tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += count
+
+        if current:
+            batches.append(current)
+        return batches
+
+    async def embed(
+        self,
+        texts: List[str],
+        owner: str = "default",
+        on_batch: Optional[BatchCallback] = None
+    ) -> List[List[float]]:
+        """
+        Embed texts with as few requests as the limits allow; results are in input order.
+        owner groups requests for fair scheduling (e.g. one owner per upload).
+        on_batch is awaited after each sub-batch succeeds.
+        """
+        if not texts:
+            return []
+
+        token_lists = self.prepare(texts)
+        batches = self.plan_batches([len(tokens) for tokens in token_lists])
+        print(f"🔍 Embedding Batcher: {len(texts)} texts in {len(batches)} requests")
+
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        await asyncio.gather(*[self._embed_batch(batch, token_lists, embeddings, owner, on_batch) for batch in batches])
+        return embeddings
+
+    async def _embed_batch(
+        self,
+        batch: List[int],
+        token_lists: List[List[int]],
+        embeddings: List[Optional[List[float]]],
+        owner: str,
+        on_batch: Optional[BatchCallback] = None
+    ) -> None:
+        """Embed one sub-batch into embeddings, retrying or splitting it on failure"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._request([token_lists[i] for i in batch], owner)
+                for item in response.data:
+                    embeddings[batch[item.index]] = item.embedding
+                if any(embeddings[i] is None for i in batch):
+                    raise EmbeddingBatchError(f"Embedding response is missing vectors for {len(batch)} inputs")
+                break
+            except openai.BadRequestError as e:
+                if len(batch) == 1:
+                    raise EmbeddingBatchError(f"Embedding request rejected for text {batch[0]}: {e}") from e
+                # Isolate the offending input instead of failing its neighbours
+                middle = len(batch) // 2
+                print(f"⚠️ Embedding Batcher: Request of {len(batch)} texts rejected, splitting: {e}")
+                await asyncio.gather(
+                    self._embed_batch(batch[:middle], token_lists, embeddings, owner, on_batch),
+                    self._embed_batch(batch[middle:], token_lists, embeddings, owner, on_batch)
+                )
+                return
+            except (*_RETRYABLE_ERRORS, EmbeddingBatchError) as e:
+                if attempt == self.max_retries:
+                    raise EmbeddingBatchError(f"Embedding sub-batch of {len(batch)} texts failed after {attempt + 1} attempts: {e}") from e
+                delay = self.retry_delay * (2 ** attempt)
+                print(f"🔄 Embedding Batcher: Sub-batch of {len(batch)} texts failed ({e}), retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+
+        if on_batch is not None:
+            await on_batch(batch, [embeddings[i] for i in batch])
+
+    async def _request(self, inputs: List[List[int]], owner: str):
+        # Token ids are accepted as input directly, so nothing is re-tokenized server side
+        def send():
+            return asyncio.to_thread(self.client.embeddings.create, model=self.model, input=inputs)
+
+        if self.scheduler is None:
+            return await send()
+        return await self.scheduler.submit(owner, sum(len(tokens) for tokens in inputs), send)
@@ -0,0 +1,92 @@
+"""
+Two-level cache for question embeddings.
+
+Many questions repeat verbatim (canned quick-action questions), and each
+embedding call costs a 150-400 ms round trip to the OpenAI API.
+
+- Level 1: process-local LRU of recent question embeddings
+- Level 2: the query_embeddings MongoDB collection, shared by every worker
+  and expired by a TTL index on created_at
+
+Keys are the sha256 of the normalized question text plus the embedding
+model, so switching models never returns a stale vector. Only texts up to
+QUERY_EMBEDDING_CACHE_MAX_CHARS are cached; chunk embeddings at ingest
+time are long and unique and would only churn the cache.
+"""
+
+import os
+import re
+import time
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query_text(text: str) -> str:
+    """Unicode-normalize, casefold and collapse whitespace so trivially different questions share a key"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip().casefold()
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_entries: int, ttl: int, max_chars: int):
+        self.entries: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_chars = max_chars
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def cacheable(self, text: str) -> bool:
+        return self.max_entries > 0 and 0 < len(text) <= self.max_chars
+
+    @staticmethod
+    def key(text: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\x00{normalize_query_text(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        """Level-1 lookup; level-2 hits and misses are recorded by the caller"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        self.memory_hits += 1
+        return entry[1]
+
+    def put(self, key: str, embedding: List[float]) -> None:
+        self.entries[key] = (time.time(), embedding)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def record_persistent_hits(self, count: int = 1) -> None:
+        self.persistent_hits += count
+
+    def record_misses(self, count: int = 1) -> None:
+        self.misses += count
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.persistent_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "memory_hit_rate": self.memory_hits / lookups if lookups else 0.0,
+            "hit_rate": (self.memory_hits + self.persistent_hits) / lookups if lookups else 0.0
+        }
+
+
+# Global cache instance shared by every AIService in this process
+query_embedding_cache = QueryEmbeddingCache(
+    max_entries=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048")),
+    ttl=int(os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    max_chars=int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_CHARS", "512"))
+)
@@ -0,0 +1,72 @@
+"""
+Compact binary storage format for chunk embeddings in policy_chunks.
+
+Format version 2 stores an embedding as BSON Binary:
+
+    bytes 0-1  magic b"PE"
+    byte  2    format version (2)
+    byte  3    dtype code (1 = float32, 2 = float16)
+    bytes 4-7  dimension, uint32 little-endian
+    bytes 8-   packed little-endian values
+
+Version 1 (legacy) is a plain BSON array of doubles. Reads accept both so
+documents can be migrated in the background.
+"""
+
+import os
+import struct
+from typing import Any, Sequence
+import numpy as np
+from bson.binary import Binary
+
+EMBEDDING_FORMAT_LEGACY = 1
+EMBEDDING_FORMAT_BINARY = 2
+
+_MAGIC = b"PE"
+_HEADER = struct.Struct("<2sBBI")
+_DTYPES = {
+    1: np.dtype("<f4"),
+    2: np.dtype("<f2"),
+}
+_DTYPE_CODES = {"float32": 1, "float16": 2}
+
+
+def storage_dtype() -> str:
+    """Configured on-disk dtype for new embeddings"""
+    dtype = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32").lower()
+    if dtype not in _DTYPE_CODES:
+        raise ValueError(f"Unsupported EMBEDDING_STORAGE_DTYPE '{dtype}', expected one of {list(_DTYPE_CODES)}")
+    return dtype
+
+
+def encode_embedding(embedding: Sequence[float], dtype: str = None) -> Binary:
+    """Pack an embedding into the versioned binary format"""
+    dtype = dtype or storage_dtype()
+    code = _DTYPE_CODES[dtype]
+    values = np.asarray(embedding, dtype=_DTYPES[code]).reshape(-1)
+    header = _HEADER.pack(_MAGIC, EMBEDDING_FORMAT_BINARY, code, values.shape[0])
+    return Binary(header + values.tobytes())
+
+
+def decode_embedding(value: Any) -> np.ndarray:
+    """
+    Decode a stored embedding into a float32 vector.
+
+    Binary values are read with np.frombuffer (no per-element conversion);
+    legacy lists of floats are converted in one np.asarray call.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        buffer = memoryview(value)
+        if len(buffer) < _HEADER.size:
+            raise ValueError("Embedding binary is shorter than its header")
+
+        magic, version, code, dimension = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC or version != EMBEDDING_FORMAT_BINARY:
+            raise ValueError(f"Unknown embedding binary format (magic={magic!r}, version={version})")
+        if code not in _DTYPES:
+            raise ValueError(f"Unknown embedding dtype code {code}")
+
+        values = np.frombuffer(buffer, dtype=_DTYPES[code], count=dimension, offset=_HEADER.size)
+        return values.astype(np.float32, copy=False)
+
+    return np.asarray(value, dtype=np.float32)
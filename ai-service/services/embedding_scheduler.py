@@ -0,0 +1,164 @@
+"""
+Shared scheduler for OpenAI embedding requests
+- At most max_concurrency requests in flight per process
+- Token buckets for requests/minute and tokens/minute, so bursts of
+  uploads stay under the account limits instead of tripping 429s
+- A 429 pauses every caller for the Retry-After the API asked for, then
+  the request is re-sent; the OpenAI client's own retries are disabled for
+  these calls so they cannot bypass the pause
+- Waiting requests are granted slots round-robin by owner (one owner per
+  upload, one for questions), so a large upload cannot starve the others
+
+Limits apply per process; with several workers divide the account limits
+between them.
+"""
+
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+import openai
+
+
+class TokenBucket:
+    """Continuously refilling bucket; a request larger than the bucket runs once it is full and leaves a debt"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float) -> None:
+        # The lock keeps waiters in FIFO order instead of racing for each refill
+        async with self.lock:
+            needed = min(amount, self.capacity)
+            self._refill()
+            while self.level < needed:
+                await asyncio.sleep((needed - self.level) / self.rate)
+                self._refill()
+            self.level -= amount
+
+
+class EmbeddingScheduler:
+    def __init__(
+        self,
+        max_concurrency: int,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_rate_limit_retries: int = 5,
+        default_retry_after: float = 1.0
+    ):
+        self.max_concurrency = max_concurrency
+        # Ten seconds of burst: enough to start a batch immediately, not enough to spike a minute's quota
+        self.request_bucket = TokenBucket(requests_per_minute, capacity=max(1.0, requests_per_minute / 6))
+        self.token_bucket = TokenBucket(tokens_per_minute, capacity=max(1.0, tokens_per_minute / 6))
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.default_retry_after = default_retry_after
+
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._active = 0
+        self._paused_until = 0.0
+
+        self.completed = 0
+        self.rate_limited = 0
+        self.tokens_sent = 0
+
+    async def submit(self, owner: str, tokens: int, request: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run request() once the owner's turn, a concurrency slot and rate budget are available.
+        Rate-limit errors are retried here after the Retry-After pause.
+        """
+        await self._acquire_slot(owner)
+        try:
+            for attempt in range(self.max_rate_limit_retries + 1):
+                await self._wait_for_pause()
+                await self.request_bucket.acquire(1)
+                await self.token_bucket.acquire(tokens)
+                try:
+                    result = await request()
+                    self.completed += 1
+                    self.tokens_sent += tokens
+                    return result
+                except openai.RateLimitError as e:
+                    self.rate_limited += 1
+                    if attempt == self.max_rate_limit_retries:
+                        raise
+                    delay = self._retry_after(e)
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                    print(f"🔄 Embedding Scheduler: Rate limited, pausing all embedding requests for {delay:.1f}s")
+        finally:
+            self._release_slot()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self._active,
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "max_concurrency": self.max_concurrency,
+            "completed": self.completed,
+            "tokens_sent": self.tokens_sent,
+            "rate_limited": self.rate_limited,
+            "paused_for_seconds": max(0.0, self._paused_until - time.monotonic())
+        }
+
+    async def _acquire_slot(self, owner: str) -> None:
+        ticket = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(owner, deque()).append(ticket)
+        self._dispatch()
+        try:
+            await ticket
+        except asyncio.CancelledError:
+            # Granted just as the caller was cancelled: hand the slot on
+            if ticket.done() and not ticket.cancelled():
+                self._release_slot()
+            raise
+
+    def _release_slot(self) -> None:
+        self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiting owners in round-robin order"""
+        while self._active < self.max_concurrency and self._queues:
+            owner, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(owner)
+            else:
+                del self._queues[owner]
+            if ticket.done():
+                continue
+            self._active += 1
+            ticket.set_result(None)
+
+    async def _wait_for_pause(self) -> None:
+        delay = self._paused_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._paused_until - time.monotonic()
+
+    def _retry_after(self, error: openai.RateLimitError) -> float:
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000.0
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except ValueError:
+            pass
+        return self.default_retry_after
+
+
+# Global scheduler shared by every AIService in this process
+embedding_scheduler = EmbeddingScheduler(
+    max_concurrency=int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4")),
+    requests_per_minute=float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "3000")),
+    tokens_per_minute=float(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+)
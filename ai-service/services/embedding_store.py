@@ -0,0 +1,69 @@
+"""
+Content-addressed store of chunk embeddings.
+
+Re-uploaded policies and shared boilerplate (definitions, regulatory
+notices) produce the same chunk text again and again. Embeddings are
+stored in the embedding_store collection under
+
+    _id = sha256(model + "\0" + normalized chunk text)
+
+so ingest looks every chunk up with one $in query and only sends unseen
+texts to the API. Normalization only unifies Unicode forms and whitespace
+(the API input has newlines flattened anyway); case and punctuation are
+kept because they can change the embedding.
+
+The collection is bounded by EMBEDDING_STORE_MAX_MB: once it grows past
+that, the least recently used entries are deleted down to 90% of it.
+"""
+
+import os
+import re
+import hashlib
+import unicodedata
+from typing import Any, Dict
+
+_WHITESPACE = re.compile(r"\s+")
+
+EMBEDDING_STORE_MAX_BYTES = int(float(os.getenv("EMBEDDING_STORE_MAX_MB", "1024")) * 1024 * 1024)
+
+# Evict down to this fraction of the limit so eviction does not run on every upload
+EMBEDDING_STORE_EVICTION_TARGET = 0.9
+
+# Approximate BSON overhead of one entry besides the packed embedding
+ENTRY_OVERHEAD_BYTES = 160
+
+
+def normalize_chunk_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def content_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_chunk_text(text)}".encode("utf-8")).hexdigest()
+
+
+def chunk_text_hash(text: str) -> str:
+    """Model-independent hash identifying a chunk's text within a policy"""
+    return hashlib.sha256(normalize_chunk_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingStoreStats:
+    """Per-process counters of chunk embeddings reused from the store vs newly embedded"""
+
+    def __init__(self):
+        self.reused = 0
+        self.embedded = 0
+        self.evicted = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.reused + self.embedded
+        return {
+            "reused": self.reused,
+            "embedded": self.embedded,
+            "evicted": self.evicted,
+            "reuse_rate": self.reused / total if total else 0.0,
+            "max_bytes": EMBEDDING_STORE_MAX_BYTES
+        }
+
+
+# Global counters shared by every service in this process
+embedding_store_stats = EmbeddingStoreStats()
@@ -0,0 +1,444 @@
+"""
+PDF text extraction in a pool of worker processes
+- pdfplumber/PyPDF2 parsing and OCR are CPU bound and hold the GIL, so
+  running them inside an async handler stalls every other request; the
+  pool runs them in separate processes instead
+- Workers are started and warmed up (imports, Tesseract lookup, one tiny
+  PDF parsed) when the service starts, not on the first upload
+- PDFs over PDF_MAX_PAGES are rejected after counting pages, before any
+  text is extracted
+- Extractions running longer than PDF_EXTRACTION_TIMEOUT_SECONDS are
+  aborted inside the worker (SIGALRM where available); a worker that does
+  not come back at all is killed and replaced on its own. The timeout
+  counts worker time only: waiting for a free worker does not use it up
+- Every worker process has its own single-process executor and is only
+  given a job when idle, so killing one never breaks the jobs of others
+
+Each page is read from its text layer and only pages without a usable
+one are OCR'd (see PDFProcessor.extract_pages). A worker is given the
+path of the PDF (or, for small in-memory PDFs, its bytes) and only page
+texts (plus page counters for /stats) come back; parsed pages and
+rendered images never leave the worker process.
+iter_page_sections streams a PDF PDF_PAGE_WINDOW pages at a time, so a
+worker only ever holds one window of parsed or rendered pages and the
+caller can chunk and embed while later pages are read.
+PDF_EXTRACTION_WORKERS=0 runs extraction in a thread instead (without
+the timeout, since a thread cannot be interrupted).
+"""
+
+import io
+import os
+import time
+import signal
+import asyncio
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import PyPDF2
+
+from services.ocr_cache import ocr_cache
+from services.pdf_processor import ExtractionResult, PDFProcessor, PDFSource, pdf_input
+
+
+class PDFExtractionError(Exception):
+    """Extraction could not complete; the message is safe to show to the client"""
+
+
+class PDFPageLimitError(PDFExtractionError):
+    """The PDF has more pages than PDF_MAX_PAGES"""
+
+
+class PDFExtractionTimeout(PDFExtractionError):
+    """Extraction ran longer than PDF_EXTRACTION_TIMEOUT_SECONDS"""
+
+
+# ----- Worker process side -----
+
+_processor: Optional[PDFProcessor] = None
+
+
+def _init_worker() -> None:
+    global _processor
+    _processor = PDFProcessor()
+
+
+class _Deadline(BaseException):
+    """Raised by the alarm; a BaseException so the extractors' per-page `except Exception` cannot swallow it"""
+
+
+def _alarm(signum, frame):
+    raise _Deadline()
+
+
+@contextmanager
+def _time_limit(timeout: float):
+    """Abort the block with PDFExtractionTimeout after timeout seconds (no limit without SIGALRM or for timeout <= 0)"""
+    use_alarm = timeout > 0 and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        yield
+    except _Deadline:
+        if not use_alarm:
+            # An enclosing limit's alarm
+            raise
+        raise PDFExtractionTimeout(f"PDF extraction took longer than {timeout:.0f}s")
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _count_pages(source: PDFSource) -> int:
+    return len(PyPDF2.PdfReader(pdf_input(source)).pages)
+
+
+def _ocr_counters(processor: PDFProcessor) -> Dict[str, float]:
+    engine = processor.ocr_engine
+    cache = {f"cache_{name}": value for name, value in ocr_cache.counters().items()}
+    if engine is None:
+        return {"pages": 0, "cached_pages": 0, "skipped_pages": 0, "failed_pages": 0, "page_seconds": 0.0, "wall_seconds": 0.0, **cache}
+    return {
+        "pages": engine.pages,
+        "cached_pages": engine.cached_pages,
+        "skipped_pages": engine.skipped_pages,
+        "failed_pages": engine.failed_pages,
+        "page_seconds": engine.page_seconds,
+        "wall_seconds": engine.wall_seconds,
+        **cache
+    }
+
+
+def _page_count(source: PDFSource, max_pages: int, timeout: float) -> int:
+    """Page count, or 0 if PyPDF2 cannot read the PDF; over max_pages raises PDFPageLimitError"""
+    with _time_limit(timeout):
+        try:
+            page_count = _count_pages(source)
+        except Exception:
+            return 0
+    if max_pages > 0 and page_count > max_pages:
+        raise PDFPageLimitError(f"PDF has {page_count} pages; the limit is {max_pages}")
+    return page_count
+
+
+def _extract(source: PDFSource, max_pages: int, timeout: float) -> Tuple[ExtractionResult, Dict[str, float]]:
+    """Pages of the PDF plus the OCR work this extraction did"""
+    processor = _processor or PDFProcessor()
+    before = _ocr_counters(processor)
+    with _time_limit(timeout):
+        # Unreadable for PyPDF2 counts as 0 pages; let the extractors (and OCR) try anyway
+        _page_count(source, max_pages, 0)
+        result = processor.extract_pages(source)
+    after = _ocr_counters(processor)
+    return result, {name: after[name] - before[name] for name in after}
+
+
+def _extract_window(
+    source: PDFSource,
+    first_page: int,
+    last_page: int,
+    timeout: float
+) -> Tuple[ExtractionResult, Dict[str, float]]:
+    """Pages first_page..last_page, plus the OCR work done"""
+    processor = _processor or PDFProcessor()
+    before = _ocr_counters(processor)
+    with _time_limit(timeout):
+        result = processor.extract_pages(source, first_page, last_page)
+    after = _ocr_counters(processor)
+    return result, {name: after[name] - before[name] for name in after}
+
+
+def _warmup() -> int:
+    """Parse a one-page blank PDF so lazily imported parser modules are loaded"""
+    writer = PyPDF2.PdfWriter()
+    writer.add_blank_page(width=72, height=72)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    (_processor or PDFProcessor()).extract_pages(buffer.getvalue())
+    return os.getpid()
+
+
+# ----- Service side -----
+
+class _Worker:
+    """One worker process in an executor of its own, so it can be killed without touching the others"""
+
+    def __init__(self):
+        self.executor = ProcessPoolExecutor(max_workers=1, initializer=_init_worker)
+        self.warmup = self.executor.submit(_warmup)
+
+    def kill(self) -> None:
+        for process in list((getattr(self.executor, "_processes", None) or {}).values()):
+            process.terminate()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _ExtractionBudget:
+    """
+    Time one extraction may still take, counted only while at least one of
+    its jobs runs in a worker (unlimited for seconds <= 0)
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.spent = 0.0
+        self.running = 0
+        self.since = 0.0
+
+    def remaining(self) -> float:
+        if self.seconds <= 0:
+            return 0.0
+        spent = self.spent + (time.perf_counter() - self.since if self.running else 0.0)
+        if spent >= self.seconds:
+            raise PDFExtractionTimeout(f"PDF extraction took longer than {self.seconds:.0f}s")
+        return self.seconds - spent
+
+    def job_started(self) -> None:
+        if not self.running:
+            self.since = time.perf_counter()
+        self.running += 1
+
+    def job_ended(self) -> None:
+        self.running -= 1
+        if not self.running:
+            self.spent += time.perf_counter() - self.since
+
+
+class PDFExtractionPool:
+    def __init__(self, workers: int, timeout: float, max_pages: int, page_window: int = 8, window_lookahead: int = 2):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.page_window = page_window
+        self.window_lookahead = window_lookahead
+        self._workers: List[_Worker] = []
+        self._idle: Optional[asyncio.Queue] = None
+
+        self.in_flight = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.restarts = 0  # Workers killed or found dead and replaced
+        self.total_seconds = 0.0
+        self.ocr = {
+            "pages": 0, "cached_pages": 0, "skipped_pages": 0, "failed_pages": 0, "page_seconds": 0.0, "wall_seconds": 0.0,
+            "cache_hits": 0, "cache_misses": 0, "cache_stores": 0, "cache_evictions": 0
+        }
+        self.page_sources = {"text": 0, "ocr": 0, "blank": 0, "empty": 0}
+
+    def start(self) -> None:
+        """Start the worker processes and warm each of them up in the background"""
+        if self.workers <= 0 or self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        for _ in range(self.workers):
+            worker = _Worker()
+            self._workers.append(worker)
+            self._idle.put_nowait(worker)
+        print(f"🚀 PDF extraction pool started with {self.workers} worker processes")
+
+    def shutdown(self) -> None:
+        for worker in self._workers:
+            worker.executor.shutdown(wait=False, cancel_futures=True)
+        self._workers = []
+        self._idle = None
+
+    async def extract_text(self, source: PDFSource) -> str:
+        """
+        Extract text from a PDF (a file path, or bytes) without blocking the event loop.
+        Raises PDFPageLimitError, PDFExtractionTimeout or PDFExtractionError.
+        """
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            result, ocr = await self._call(_extract, source, self.max_pages, budget=_ExtractionBudget(self.timeout))
+            self._add_result(result, ocr)
+            self.completed += 1
+            self.total_seconds += time.perf_counter() - started
+            return result.text
+        except PDFPageLimitError:
+            self.rejected += 1
+            raise
+        except PDFExtractionTimeout:
+            self.timeouts += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def iter_page_sections(
+        self,
+        source: PDFSource,
+        on_pages: Optional[Callable[[int, int], Awaitable[None]]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream a PDF's page sections in page order, window by window.
+        
+        Joined with PAGE_SEPARATOR they give the text extract_text returns.
+        on_pages is awaited with (pages read, page count) after each window.
+        Raises the same errors as extract_text.
+        """
+        self.in_flight += 1
+        started = time.perf_counter()
+        # Shared by all of this PDF's worker calls
+        budget = _ExtractionBudget(self.timeout)
+        try:
+            page_count = await self._call(_page_count, source, self.max_pages, budget=budget)
+            if page_count == 0:
+                # Unreadable page tree; the whole-document extractors may still cope
+                result, ocr = await self._call(_extract, source, 0, budget=budget)
+                self._add_result(result, ocr)
+                for section in result.sections:
+                    yield section
+            else:
+                async for last_page, result in self._iter_windows(source, page_count, budget):
+                    for section in result.sections:
+                        yield section
+                    if on_pages:
+                        await on_pages(last_page, page_count)
+            self.completed += 1
+            self.total_seconds += time.perf_counter() - started
+        except PDFPageLimitError:
+            self.rejected += 1
+            raise
+        except PDFExtractionTimeout:
+            self.timeouts += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def _iter_windows(
+        self,
+        source: PDFSource,
+        page_count: int,
+        budget: _ExtractionBudget
+    ) -> AsyncIterator[Tuple[int, ExtractionResult]]:
+        """(last page, pages) per window, with up to window_lookahead windows extracted ahead"""
+        first_pages = iter(range(1, page_count + 1, self.page_window))
+        running: Deque[Tuple[int, asyncio.Task]] = deque()
+
+        def submit_next() -> None:
+            first_page = next(first_pages, None)
+            if first_page is None:
+                return
+            # Fail before queueing more windows once the budget is used up
+            budget.remaining()
+            last_page = min(first_page + self.page_window - 1, page_count)
+            task = asyncio.ensure_future(
+                self._call(_extract_window, source, first_page, last_page, budget=budget)
+            )
+            running.append((last_page, task))
+
+        try:
+            for _ in range(max(1, self.window_lookahead)):
+                submit_next()
+            while running:
+                last_page, task = running.popleft()
+                result, ocr = await task
+                self._add_result(result, ocr)
+                submit_next()
+                yield last_page, result
+        finally:
+            for _, task in running:
+                task.cancel()
+
+    def _add_result(self, result: ExtractionResult, ocr: Dict[str, float]) -> None:
+        for name, value in ocr.items():
+            self.ocr[name] += value
+        for source, count in result.source_counts().items():
+            self.page_sources[source] += count
+
+    async def _call(self, func: Callable[..., Any], *args: Any, budget: _ExtractionBudget) -> Any:
+        """Run func(*args, timeout) in a worker process, or in a thread when the pool is disabled"""
+        if self.workers <= 0:
+            return await asyncio.to_thread(func, *args, 0)
+        self.start()
+        return await self._run_in_pool(func, *args, budget=budget)
+
+    async def _run_in_pool(self, func: Callable[..., Any], *args: Any, budget: _ExtractionBudget) -> Any:
+        idle = self._idle
+        worker = await idle.get()
+        job = None
+        try:
+            if not worker.warmup.done():
+                await asyncio.wait({asyncio.wrap_future(worker.warmup)})
+            # The worker is free, so the job starts now; time spent queued above is not counted
+            timeout = budget.remaining()
+            budget.job_started()
+            # The worker enforces the timeout itself; this only catches a worker that is stuck for good
+            backstop = timeout + 10 if timeout > 0 else None
+            try:
+                job = worker.executor.submit(func, *args, timeout)
+                return await asyncio.wait_for(asyncio.wrap_future(job), timeout=backstop)
+            except asyncio.TimeoutError:
+                print(f"⚠️ PDF extraction pool: Worker did not return after {backstop:.0f}s, replacing it")
+                worker, job = self._replace(worker), None
+                raise PDFExtractionTimeout("PDF extraction timed out")
+            except BrokenProcessPool:
+                print("⚠️ PDF extraction pool: A worker process died, replacing it")
+                worker, job = self._replace(worker), None
+                raise PDFExtractionError("PDF extraction failed: the worker process died (the PDF may be too large)")
+            finally:
+                budget.job_ended()
+        finally:
+            if idle is self._idle:
+                if job is not None and not job.done():
+                    # Cancelled while the worker runs the job; it is free again once the job ends
+                    loop = asyncio.get_running_loop()
+                    job.add_done_callback(lambda _: loop.call_soon_threadsafe(idle.put_nowait, worker))
+                else:
+                    idle.put_nowait(worker)
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        """Kill a stuck or dead worker and start a new one in its place; the other workers keep running"""
+        worker.kill()
+        if worker not in self._workers:
+            # The pool was shut down meanwhile
+            return worker
+        replacement = _Worker()
+        self._workers[self._workers.index(worker)] = replacement
+        self.restarts += 1
+        return replacement
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.ocr["cache_hits"] + self.ocr["cache_misses"]
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "rejected_page_limit": self.rejected,
+            "restarts": self.restarts,
+            "max_pages": self.max_pages,
+            "timeout_seconds": self.timeout,
+            "avg_seconds": self.total_seconds / self.completed if self.completed else 0.0,
+            "pages_text_layer": self.page_sources["text"],
+            "pages_ocr": self.page_sources["ocr"],
+            "pages_blank": self.page_sources["blank"],
+            "pages_empty": self.page_sources["empty"],
+            "ocr_pages": self.ocr["pages"],
+            "ocr_cached_pages": self.ocr["cached_pages"],
+            "ocr_failed_pages": self.ocr["failed_pages"],
+            "ocr_pages_per_second": self.ocr["pages"] / self.ocr["wall_seconds"] if self.ocr["wall_seconds"] else 0.0,
+            "ocr_avg_page_seconds": self.ocr["page_seconds"] / self.ocr["pages"] if self.ocr["pages"] else 0.0,
+            "ocr_cache": {
+                "hits": self.ocr["cache_hits"],
+                "misses": self.ocr["cache_misses"],
+                "stores": self.ocr["cache_stores"],
+                "evictions": self.ocr["cache_evictions"],
+                "hit_rate": self.ocr["cache_hits"] / lookups if lookups else 0.0,
+                "max_bytes": ocr_cache.max_bytes,
+                "directory": ocr_cache.directory
+            }
+        }
+
+
+# Global pool shared by every request in this process
+pdf_extraction_pool = PDFExtractionPool(
+    workers=int(os.getenv("PDF_EXTRACTION_WORKERS", "2")),
+    timeout=float(os.getenv("PDF_EXTRACTION_TIMEOUT_SECONDS", "300")),
+    max_pages=int(os.getenv("PDF_MAX_PAGES", "500")),
+    page_window=int(os.getenv("PDF_PAGE_WINDOW", "8"))
+)
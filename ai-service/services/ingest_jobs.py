@@ -0,0 +1,215 @@
+"""
+Background ingestion jobs for uploaded policy PDFs
+- POST /ingest-jobs stores the PDF in GridFS and a job document in the
+  ingest_jobs collection, then returns at once
+- IngestJobWorker claims queued jobs with a lease it keeps renewing while
+  the job runs; a job whose worker died is picked up again once its lease
+  expires, so jobs survive restarts
+- Progress (stage and percent) is written to the job document as the
+  pipeline advances
+
+Retried jobs resume from checkpoints: the extracted text is kept in
+GridFS once extraction is done, and every completed embedding request is
+written to the content-addressed embedding store, so a retry only embeds
+what is still missing.
+"""
+
+import os
+import uuid
+import socket
+import asyncio
+import tempfile
+from typing import Any, Awaitable, Callable, Dict, Set
+
+from services.extraction_pool import PDFExtractionError
+
+# Awaited with (stage, done, total) by the ingest pipeline
+IngestProgress = Callable[[str, int, int], Awaitable[None]]
+
+# Share of the overall percentage covered by each pipeline stage
+INGEST_STAGE_RANGES = {
+    "queued": (0, 0),
+    "extracting": (0, 40),
+    "embedding": (40, 90),
+    "storing": (90, 99),
+    "completed": (100, 100)
+}
+
+
+def stage_percent(stage: str, done: int, total: int) -> int:
+    low, high = INGEST_STAGE_RANGES.get(stage, (0, 0))
+    fraction = done / total if total else 1.0
+    return int(low + (high - low) * min(1.0, max(0.0, fraction)))
+
+
+class IngestJobError(Exception):
+    """A job failed in a way retrying cannot fix (e.g. a PDF without extractable text)"""
+
+
+class IngestJobWorker:
+    def __init__(
+        self,
+        db_service: Any,
+        ai_service: Any,
+        extraction_pool: Any,
+        concurrency: int = int(os.getenv("INGEST_WORKER_CONCURRENCY", "2")),
+        lease_seconds: float = float(os.getenv("INGEST_JOB_LEASE_SECONDS", "120")),
+        poll_interval: float = float(os.getenv("INGEST_POLL_INTERVAL_SECONDS", "2")),
+        max_attempts: int = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3")),
+        retry_delay: float = 30.0
+    ):
+        self.db_service = db_service
+        self.ai_service = ai_service
+        self.extraction_pool = extraction_pool
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._tasks: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    def notify(self) -> None:
+        """Check for jobs now instead of at the next poll"""
+        self._wakeup.set()
+
+    async def run(self) -> None:
+        """Claim and run jobs until stop() is called"""
+        print(f"🚀 Ingest worker {self.worker_id} started (concurrency {self.concurrency})")
+        while not self._stopping:
+            job = None
+            if len(self._tasks) < self.concurrency:
+                try:
+                    job = await self.db_service.claim_ingest_job(self.worker_id, self.lease_seconds)
+                except Exception as e:
+                    print(f"❌ Ingest worker: Could not claim a job: {e}")
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._run_job(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._job_done)
+
+    async def stop(self) -> None:
+        """Stop claiming jobs and hand running ones back to the queue"""
+        self._stopping = True
+        self._wakeup.set()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _job_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        # A slot is free again
+        self._wakeup.set()
+
+    async def _run_job(self, job: Dict[str, Any]) -> None:
+        job_id = job["_id"]
+        print(f"🔍 Ingest worker: Running job {job_id} for policy {job['policy_id']} (attempt {job['attempts']})")
+
+        if job["attempts"] > self.max_attempts:
+            # Its workers kept dying before they could record a result
+            await self.db_service.fail_ingest_job(job_id, self.worker_id, f"Gave up after {self.max_attempts} attempts")
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, asyncio.current_task()))
+        try:
+            await self._process(job)
+            print(f"✅ Ingest worker: Job {job_id} completed")
+        except asyncio.CancelledError:
+            # Shutdown or a lost lease; the job is run again from its checkpoints
+            await asyncio.shield(self.db_service.release_ingest_job(job_id, self.worker_id))
+            raise
+        except IngestJobError as e:
+            print(f"❌ Ingest worker: Job {job_id} failed: {e}")
+            await self.db_service.fail_ingest_job(job_id, self.worker_id, str(e))
+        except Exception as e:
+            if job["attempts"] >= self.max_attempts:
+                print(f"❌ Ingest worker: Job {job_id} failed after {job['attempts']} attempts: {e}")
+                await self.db_service.fail_ingest_job(job_id, self.worker_id, str(e))
+            else:
+                delay = self.retry_delay * (2 ** (job["attempts"] - 1))
+                print(f"🔄 Ingest worker: Job {job_id} failed ({e}), retrying in {delay:.0f}s...")
+                await self.db_service.fail_ingest_job(job_id, self.worker_id, str(e), retry_in_seconds=delay)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: Any, job_task: asyncio.Task) -> None:
+        """Renew the lease while the job runs; stop the job if another worker has taken it over"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                renewed = await self.db_service.renew_ingest_job_lease(job_id, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                print(f"⚠️ Ingest worker: Could not renew lease of job {job_id}: {e}")
+                continue
+            if not renewed:
+                print(f"⚠️ Ingest worker: Lost the lease of job {job_id}, stopping it")
+                job_task.cancel()
+                return
+
+    async def _process(self, job: Dict[str, Any]) -> None:
+        job_id = job["_id"]
+        last_percent = -1
+
+        async def progress(stage: str, done: int, total: int) -> None:
+            nonlocal last_percent
+            percent = stage_percent(stage, done, total)
+            # Only write when the visible progress changes
+            if percent != last_percent:
+                last_percent = percent
+                await self.db_service.update_ingest_job_progress(job_id, self.worker_id, stage, percent)
+
+        if job.get("text_file_id"):
+            # Extraction finished in an earlier attempt
+            text = (await self.db_service.read_ingest_file(job["text_file_id"])).decode("utf-8")
+            await progress("extracting", 1, 1)
+            await self.ai_service.process_and_store_document(
+                text=text,
+                filename=job["filename"],
+                user_id=job["user_id"],
+                policy_id=job["policy_id"],
+                progress=progress
+            )
+        else:
+            await progress("extracting", 0, 1)
+            # The stored PDF is copied to a temporary file; workers read it by path
+            descriptor, path = tempfile.mkstemp(suffix=".pdf", prefix="ingest-")
+            os.close(descriptor)
+
+            async def pages_read(done: int, total: int) -> None:
+                await progress("extracting", done, total)
+
+            async def checkpoint_text(extracted: str) -> None:
+                await self.db_service.store_ingest_text(job_id, self.worker_id, job["filename"], extracted)
+
+            # Pages are chunked and embedded while later pages are still being extracted
+            try:
+                await self.db_service.download_ingest_file(job["file_id"], path)
+                text = await self.ai_service.process_and_store_sections(
+                    self.extraction_pool.iter_page_sections(path, on_pages=pages_read),
+                    filename=job["filename"],
+                    user_id=job["user_id"],
+                    policy_id=job["policy_id"],
+                    progress=progress,
+                    on_text=checkpoint_text
+                )
+            except PDFExtractionError as e:
+                # Page limit and timeouts would fail the same way again
+                raise IngestJobError(str(e)) from e
+            finally:
+                os.remove(path)
+            if not text.strip():
+                raise IngestJobError("No text could be extracted from PDF")
+
+        await self.db_service.complete_ingest_job(job_id, self.worker_id, job["policy_id"], len(text))
@@ -0,0 +1,204 @@
+"""
+Per-policy BM25 inverted index for exact-term retrieval.
+
+Dense similarity is weak on exact terms such as policy numbers, amounts
+and clause names, and every dense search needs an embedding API call.
+The lexical index is built from the chunk texts at ingest time and stored
+in policy_lexical_indexes next to the chunks:
+
+- terms: vocabulary, sorted; a term's postings are rows[offsets[t]:offsets[t + 1]]
+- rows / tfs: chunk row (position in chunk_ids) and term frequency of each posting
+- doc_lengths: token count of every chunk, for BM25 length normalization
+
+Postings are packed little-endian arrays in BSON Binary, so even large
+policies stay well below the 16 MB document limit.
+"""
+
+import os
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from bson.binary import Binary
+
+from services.matrix_cache import EmbeddingMatrixCache
+from services.vector_index import top_k_indices
+
+LEXICAL_INDEX_VERSION = 1
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal rank fusion constant: larger values flatten the rank curve
+RRF_K = 60
+
+# Lexical-only matches have no cosine similarity, so they count for at
+# most this much towards answer confidence
+LEXICAL_SCORE_WEIGHT = 0.75
+
+# Words, numbers, and compounds like "HX-2024-001", "4.2" or "24/7"
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+_COMPOUND_SEPARATORS = re.compile(r"[-./]")
+
+_STOPWORDS = frozenset("""
+a an and are as at be been but by can do does for from had has have how i if in into is it its
+me my no not of on or our so such that the their then there these they this to was we were what
+when where which who will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compounds are indexed whole and as their parts"""
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if token not in _STOPWORDS:
+            tokens.append(token)
+        if _COMPOUND_SEPARATORS.search(token):
+            tokens.extend(part for part in _COMPOUND_SEPARATORS.split(token) if part and part not in _STOPWORDS)
+    return tokens
+
+
+@dataclass
+class LexicalIndex:
+    """BM25 postings for the chunks of one policy"""
+    terms: List[str]
+    offsets: np.ndarray
+    rows: np.ndarray
+    tfs: np.ndarray
+    doc_lengths: np.ndarray
+    chunk_ids: List[Any] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+
+    def __post_init__(self):
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.avg_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+
+    @property
+    def size(self) -> int:
+        return int(self.doc_lengths.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        # Rough per-term overhead for the vocabulary list and lookup dict
+        arrays = self.offsets.nbytes + self.rows.nbytes + self.tfs.nbytes + self.doc_lengths.nbytes
+        return int(arrays) + 96 * len(self.terms) + 64 * len(self.chunk_ids)
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25-score every chunk against the query terms.
+
+        Returns:
+            (rows, scores) for up to k chunks with a non-zero score, best first
+        """
+        if self.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = np.zeros(self.size, dtype=np.float32)
+        norms = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doc_lengths / max(self.avg_length, 1.0))
+
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows = self.rows[start:end]
+            tfs = self.tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = np.log(1.0 + (self.size - df + 0.5) / (df + 0.5))
+            # Each row appears once per term, so plain fancy-index addition is safe
+            scores[rows] += idf * tfs * (BM25_K1 + 1.0) / (tfs + norms[rows])
+
+        matched = np.flatnonzero(scores)
+        best = matched[top_k_indices(scores[matched], k)]
+        return best, scores[best]
+
+    def to_document(self) -> Dict[str, Any]:
+        """Serialize for policy_lexical_indexes"""
+        return {
+            "version": LEXICAL_INDEX_VERSION,
+            "terms": self.terms,
+            "offsets": Binary(self.offsets.astype("<u4").tobytes()),
+            "rows": Binary(self.rows.astype("<u4").tobytes()),
+            "tfs": Binary(self.tfs.astype("<u2").tobytes()),
+            "doc_lengths": Binary(self.doc_lengths.astype("<u4").tobytes()),
+            "chunk_ids": list(self.chunk_ids)
+        }
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> Optional["LexicalIndex"]:
+        """Deserialize a stored index, or None if it was written in another format version"""
+        if document.get("version") != LEXICAL_INDEX_VERSION:
+            return None
+        return cls(
+            terms=list(document["terms"]),
+            offsets=np.frombuffer(document["offsets"], dtype="<u4").astype(np.int64),
+            rows=np.frombuffer(document["rows"], dtype="<u4").astype(np.int64),
+            tfs=np.frombuffer(document["tfs"], dtype="<u2"),
+            doc_lengths=np.frombuffer(document["doc_lengths"], dtype="<u4").astype(np.float32),
+            chunk_ids=list(document.get("chunk_ids", []))
+        )
+
+
+def build_lexical_index(texts: Sequence[str], chunk_ids: Optional[List[Any]] = None) -> LexicalIndex:
+    """Build a BM25 index over chunk texts; row i of the index is texts[i]"""
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    doc_lengths = np.zeros(len(texts), dtype=np.float32)
+
+    for row, text in enumerate(texts):
+        counts = Counter(tokenize(text or ""))
+        doc_lengths[row] = sum(counts.values())
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((row, tf))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    rows: List[int] = []
+    tfs: List[int] = []
+    for i, term in enumerate(terms):
+        for row, tf in postings[term]:
+            rows.append(row)
+            tfs.append(min(tf, 65535))
+        offsets[i + 1] = len(rows)
+
+    return LexicalIndex(
+        terms=terms,
+        offsets=offsets,
+        rows=np.asarray(rows, dtype=np.int64),
+        tfs=np.asarray(tfs, dtype=np.uint16),
+        doc_lengths=doc_lengths,
+        chunk_ids=list(chunk_ids or [])
+    )
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[Dict[str, Any]]], limit: int, k: int = RRF_K) -> List[Dict[str, Any]]:
+    """
+    Merge ranked chunk lists by reciprocal rank fusion, keyed by chunk _id.
+
+    When a chunk appears in several lists the fields of the earlier list win,
+    so pass the vector results first to keep their cosine similarity_score.
+    """
+    fused: Dict[Any, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, chunk in enumerate(results):
+            key = chunk.get("_id")
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = dict(chunk)
+                entry["fusion_score"] = 0.0
+            else:
+                for name, value in chunk.items():
+                    entry.setdefault(name, value)
+            entry["fusion_score"] += 1.0 / (k + rank + 1)
+
+    return sorted(fused.values(), key=lambda chunk: chunk["fusion_score"], reverse=True)[:limit]
+
+
+# Global cache of loaded indexes shared by every DatabaseService in this process
+lexical_index_cache = EmbeddingMatrixCache(
+    max_bytes=int(float(os.getenv("LEXICAL_INDEX_CACHE_MAX_MB", "64")) * 1024 * 1024),
+    ttl=int(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "3600"))
+)
@@ -0,0 +1,114 @@
+"""
+Process-local cache of per-policy embedding matrices for vector search.
+Entries are keyed by (user_id, document_id), bounded by total bytes and
+evicted least-recently-used first.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+from services.quantization import QuantizedMatrix
+
+
+@dataclass
+class EmbeddingMatrix:
+    """Normalized float32 embeddings of one policy plus the chunk ids of each row"""
+    matrix: np.ndarray
+    chunk_ids: List[Any]
+    quantized: Optional[QuantizedMatrix] = None  # Sign-bit codes for large policies
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def nbytes(self) -> int:
+        # Rough per-id overhead for the ObjectId list kept next to the matrix
+        quantized_bytes = self.quantized.nbytes if self.quantized is not None else 0
+        return int(self.matrix.nbytes) + quantized_bytes + 64 * len(self.chunk_ids)
+
+
+class EmbeddingMatrixCache:
+    def __init__(self, max_bytes: int, ttl: Optional[int] = None):
+        self.entries: "OrderedDict[Tuple[str, str], EmbeddingMatrix]" = OrderedDict()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: str, document_id: str) -> Optional[EmbeddingMatrix]:
+        """Return the cached matrix for a policy and mark it most recently used"""
+        key = (user_id, document_id)
+        entry = self.entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        # Entries expire so workers that missed an invalidation eventually reload
+        if self.ttl and time.time() - entry.created_at > self.ttl:
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, user_id: str, document_id: str, entry: EmbeddingMatrix) -> None:
+        """Insert a matrix, evicting least recently used entries to stay under the byte limit"""
+        key = (user_id, document_id)
+        if key in self.entries:
+            self._remove(key)
+
+        if entry.nbytes > self.max_bytes:
+            # Larger than the whole budget - not worth evicting everything else for
+            return
+
+        while self.entries and self.current_bytes + entry.nbytes > self.max_bytes:
+            oldest_key = next(iter(self.entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+        self.entries[key] = entry
+        self.current_bytes += entry.nbytes
+
+    def invalidate(self, user_id: str, document_id: str) -> None:
+        """Drop the cached matrix for one user's policy"""
+        self._remove((user_id, document_id))
+
+    def invalidate_document(self, document_id: str) -> None:
+        """Drop a policy's cached matrix for every user"""
+        for key in [key for key in self.entries if key[1] == document_id]:
+            self._remove(key)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry.nbytes
+
+
+# Global cache instance shared by every DatabaseService in this process
+embedding_matrix_cache = EmbeddingMatrixCache(
+    max_bytes=int(float(os.getenv("EMBEDDING_CACHE_MAX_MB", "256")) * 1024 * 1024),
+    ttl=int(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "3600"))
+)
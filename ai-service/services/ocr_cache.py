@@ -0,0 +1,151 @@
+"""
+Persistent cache of OCR results for rendered pages
+- Scanned policies are re-uploaded, and scanned forms share identical
+  pages (terms and conditions appendices, boilerplate back pages); a
+  cached page skips Tesseract entirely
+- Keys are the sha256 of the rendered page (its pixels, render DPI and
+  preprocessing) plus the Tesseract language and config, so changing any
+  of them never returns stale text
+- Entries are small text files under OCR_CACHE_DIR, written atomically,
+  so every extraction worker process shares them and they survive
+  restarts
+- The directory is kept under OCR_CACHE_MAX_MB by deleting the least
+  recently used entries (a hit refreshes an entry's mtime);
+  OCR_CACHE_MAX_MB=0 disables the cache
+
+Hits, misses, stores and evictions are counted per process; the PDF
+extraction pool sums its workers' counts for /stats.
+"""
+
+import os
+import uuid
+import hashlib
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def file_digest(path: str, *extra: Any) -> str:
+    """sha256 of a file's bytes plus extra values (e.g. the DPI it was rendered at)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    for value in extra:
+        digest.update(f"\x00{value}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class OCRCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        # Bytes this process wrote since it last measured the directory
+        self._unchecked_bytes: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(page_digest: str, **params: Any) -> str:
+        parts = [page_digest] + [f"{name}={params[name]}" for name in sorted(params)]
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        # Two-character fan-out keeps directories small
+        return os.path.join(self.directory, key[:2], f"{key}.txt")
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                text = file.read()
+            # Most recently used for eviction
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        if not self.enabled:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written under a unique name and renamed, so readers never see a partial entry
+            temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(temporary, "w", encoding="utf-8") as file:
+                file.write(text)
+            os.replace(temporary, path)
+        except OSError as e:
+            print(f"⚠️ OCR cache: Could not store an entry: {e}")
+            return
+        self.stores += 1
+
+        # Measuring the whole directory is only worth it every tenth of the budget written
+        if self._unchecked_bytes is None or self._unchecked_bytes > self.max_bytes // 10:
+            self._evict()
+        else:
+            self._unchecked_bytes += len(text.encode("utf-8"))
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until the cache is under 90% of max_bytes"""
+        entries: List[Tuple[float, int, str]] = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as buckets:
+                for bucket in buckets:
+                    if not bucket.is_dir():
+                        continue
+                    with os.scandir(bucket.path) as files:
+                        for entry in files:
+                            try:
+                                stat = entry.stat()
+                            except OSError:
+                                continue
+                            entries.append((stat.st_mtime, stat.st_size, entry.path))
+                            total += stat.st_size
+        except OSError:
+            return
+
+        if total > self.max_bytes:
+            entries.sort()
+            target = int(self.max_bytes * 0.9)
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Another worker evicted it first
+                    continue
+                total -= size
+                self.evictions += 1
+        self._unchecked_bytes = 0
+
+    def counters(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores, "evictions": self.evictions}
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            **self.counters(),
+            "directory": self.directory,
+            "max_bytes": self.max_bytes,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+# Global cache shared by the OCR engine of this process
+ocr_cache = OCRCache(
+    directory=os.getenv("OCR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "policypal-ocr-cache")),
+    max_bytes=int(float(os.getenv("OCR_CACHE_MAX_MB", "256")) * 1024 * 1024)
+)
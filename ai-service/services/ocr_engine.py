@@ -0,0 +1,171 @@
+"""
+Page-parallel OCR
+- Pages are preprocessed and recognized concurrently, OCR_PAGE_WORKERS at
+  a time; results are returned in page order
+- Each pytesseract call runs the tesseract binary in its own process, so
+  a thread pool is enough to keep several cores busy without copying
+  page images between Python processes
+- Tesseract's own OpenMP threads are capped with OMP_THREAD_LIMIT
+  (OCR_TESSERACT_THREADS, default 1), so page workers times Tesseract
+  threads does not oversubscribe the cores
+- Pages whose OCR result is in the OCR cache (see ocr_cache.py) skip
+  Tesseract; the caller says how to identify a page image
+- preprocess can raise SkipPage for pages not worth recognizing (e.g.
+  blank pages); they are returned with the reason instead of text
+- Pages recognized, OCR time and pages per second are counted per process
+"""
+
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+logger = logging.getLogger(__name__)
+
+
+def default_page_workers() -> int:
+    # Share the cores with the other PDF extraction worker processes
+    extraction_workers = max(1, int(os.getenv("PDF_EXTRACTION_WORKERS", "2")))
+    return max(1, (os.cpu_count() or 1) // extraction_workers)
+
+
+class SkipPage(Exception):
+    """Raised by preprocess to leave a page out of OCR; the message is the reason (e.g. "blank")"""
+
+
+@dataclass
+class OCRPageResult:
+    page_number: int  # 1-based
+    text: str
+    seconds: float
+    error: Optional[str] = None
+    cached: bool = False
+    skipped: Optional[str] = None  # Why the page was not recognized
+
+
+class ParallelOCREngine:
+    def __init__(
+        self,
+        page_workers: Optional[int] = None,
+        tesseract_threads: int = int(os.getenv("OCR_TESSERACT_THREADS", "1")),
+        lang: str = "eng",
+        config: str = "--psm 6",
+        cache: Optional[Any] = None
+    ):
+        self.page_workers = page_workers or int(os.getenv("OCR_PAGE_WORKERS", "0")) or default_page_workers()
+        self.tesseract_threads = tesseract_threads
+        self.lang = lang
+        self.config = config
+        self.cache = cache
+
+        # Inherited by every tesseract process pytesseract starts
+        os.environ["OMP_THREAD_LIMIT"] = str(tesseract_threads)
+
+        self.documents = 0
+        self.pages = 0
+        self.cached_pages = 0
+        self.skipped_pages = 0
+        self.failed_pages = 0
+        self.page_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    def recognize_pages(
+        self,
+        images: List[Any],
+        preprocess: Optional[Callable[[Any], Any]] = None,
+        first_page_number: int = 1,
+        page_numbers: Optional[List[int]] = None,
+        page_digest: Optional[Callable[[Any], str]] = None
+    ) -> List[OCRPageResult]:
+        """
+        OCR page images concurrently; results are in the order of images.
+        Images are pages first_page_number, first_page_number + 1, ... unless
+        page_numbers gives the page number of each image. An entry of images
+        may be anything preprocess turns into an image (e.g. a file path).
+        
+        Each page is released as soon as it is recognized: its entry in
+        images is cleared and the image closed, so at most page_workers
+        pages are held in memory beyond what the caller keeps.
+        
+        With page_digest (a digest of an images entry that identifies the
+        page image Tesseract would see: pixels, DPI and preprocessing), the
+        cache is checked before a page is loaded and new results are stored.
+        """
+        if not images:
+            return []
+
+        def recognize(position: int) -> OCRPageResult:
+            page_number = page_numbers[position] if page_numbers else first_page_number + position
+            started = time.perf_counter()
+            page = images[position]
+            image = None
+            try:
+                key = None
+                if self.cache is not None and self.cache.enabled and page_digest is not None:
+                    key = self.cache.key(page_digest(page), lang=self.lang, config=self.config)
+                    text = self.cache.get(key)
+                    if text is not None:
+                        return OCRPageResult(page_number, text, time.perf_counter() - started, cached=True)
+                
+                image = preprocess(page) if preprocess is not None else page
+                text = pytesseract.image_to_string(image, lang=self.lang, config=self.config).strip()
+                if key is not None:
+                    self.cache.put(key, text)
+                return OCRPageResult(page_number, text, time.perf_counter() - started)
+            except SkipPage as e:
+                return OCRPageResult(page_number, "", time.perf_counter() - started, skipped=str(e))
+            except Exception as e:
+                logger.warning(f"Error processing page {page_number} with OCR: {str(e)}")
+                return OCRPageResult(page_number, "", time.perf_counter() - started, error=str(e))
+            finally:
+                images[position] = None
+                for obj in (page, image):
+                    close = getattr(obj, "close", None)
+                    if close is not None:
+                        close()
+
+        started = time.perf_counter()
+        workers = min(self.page_workers, len(images))
+        if workers == 1:
+            results = [recognize(position) for position in range(len(images))]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr") as executor:
+                # map yields in submission order, so page order is kept
+                results = list(executor.map(recognize, range(len(images))))
+        wall = time.perf_counter() - started
+
+        recognized = [result for result in results if not result.cached and not result.skipped]
+        cached = sum(1 for result in results if result.cached)
+        skipped = sum(1 for result in results if result.skipped)
+        self.documents += 1
+        self.pages += len(recognized)
+        self.cached_pages += cached
+        self.skipped_pages += skipped
+        self.failed_pages += sum(1 for result in results if result.error)
+        self.page_seconds += sum(result.seconds for result in recognized)
+        self.wall_seconds += wall
+        logger.info(
+            f"OCR of {len(results)} pages ({cached} cached, {skipped} skipped) with {workers} workers "
+            f"took {wall:.1f}s ({len(results) / wall if wall else 0.0:.2f} pages/s)"
+        )
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "page_workers": self.page_workers,
+            "tesseract_threads": self.tesseract_threads,
+            "documents": self.documents,
+            "pages": self.pages,
+            "cached_pages": self.cached_pages,
+            "skipped_pages": self.skipped_pages,
+            "failed_pages": self.failed_pages,
+            "pages_per_second": self.pages / self.wall_seconds if self.wall_seconds else 0.0,
+            "avg_page_seconds": self.page_seconds / self.pages if self.pages else 0.0
+        }
@@ -1,16 +1,19 @@
 import logging
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Union
+from dataclasses import dataclass, field
 import PyPDF2
 import pdfplumber
 from pathlib import Path
 import io
+import re
+import math
 import tempfile
 import os
 
 # OCR imports
 try:
     import pytesseract
-    from pdf2image import convert_from_bytes, convert_from_path
+    from pdf2image import convert_from_bytes, convert_from_path, pdfinfo_from_bytes, pdfinfo_from_path
     from PIL import Image
     from PIL import ImageEnhance
     OCR_AVAILABLE = True
@@ -18,8 +21,147 @@ except ImportError:
     OCR_AVAILABLE = False
     print("⚠️ OCR libraries not available. Install pytesseract, pdf2image, and Pillow for OCR support.")
 
+from services.ocr_engine import OCRPageResult, ParallelOCREngine, SkipPage
+from services.ocr_cache import file_digest, ocr_cache
+
 logger = logging.getLogger(__name__)
 
+# Extracted text is the page sections joined by PAGE_SEPARATOR
+PAGE_SEPARATOR = "\n\n"
+
+# PDF content, or the path of a PDF file
+PDFSource = Union[bytes, str]
+
+# A page's text layer is used when it has at least this many characters...
+PAGE_TEXT_MIN_CHARS = int(os.getenv("PDF_PAGE_TEXT_MIN_CHARS", "50"))
+# ...and this share of them are not (cid:N) codes or control characters
+PAGE_TEXT_MIN_QUALITY = 0.8
+
+# What pdfplumber prints for glyphs its font has no unicode mapping for
+CID_CODE = re.compile(r"\(cid:\d+\)")
+
+# OCR rendering. Pages are rendered in grayscale into a temporary folder,
+# OCR_RENDER_WINDOW pages at a time, and a page is only loaded into memory
+# while an OCR worker reads it. Pages are rendered at OCR_DPI, or lower
+# when that would exceed OCR_MAX_PAGE_MEGAPIXELS (an 8-bit grayscale page
+# takes one byte per pixel), so memory per extraction stays below about
+# OCR_PAGE_WORKERS x (3 x OCR_MAX_PAGE_MEGAPIXELS MB + one Tesseract process)
+# whatever the page count or page size.
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_MAX_PAGE_MEGAPIXELS = float(os.getenv("OCR_MAX_PAGE_MEGAPIXELS", "12"))
+OCR_RENDER_WINDOW = int(os.getenv("OCR_RENDER_WINDOW", "8"))
+
+# Part of every OCR cache key; change it whenever _preprocess_image_for_ocr changes
+OCR_PREPROCESSING = "gray-contrast2-sharpness2"
+
+# Rendered pages with at most this share of ink pixels are blank and not OCR'd
+OCR_BLANK_PAGE_MAX_INK = float(os.getenv("OCR_BLANK_PAGE_MAX_INK", "0.001"))
+# Ink is anything this much darker than the page's background level
+INK_CONTRAST = 48
+
+
+def page_section(page_number: int, text: str) -> str:
+    return f"--- Page {page_number} ---\n{text}"
+
+
+def text_layer_quality(text: str) -> float:
+    """Share of readable characters in a page's text layer (1.0 for a clean layer, 0.0 for none)"""
+    text = CID_CODE.sub("\ufffd", text.strip())
+    if not text:
+        return 0.0
+    unreadable = sum(1 for ch in text if ch == "\ufffd" or not (ch.isprintable() or ch.isspace()))
+    return 1.0 - unreadable / len(text)
+
+
+def page_needs_ocr(text: str, has_images: bool) -> bool:
+    """
+    Whether a page's content has to be read from its rendered image.
+    
+    A garbled text layer (broken font encoding) is always OCR'd; the
+    glyphs still render correctly. A page with little or no text is OCR'd
+    only if it contains images, so blank and near-empty typed pages are
+    not rendered at all.
+    """
+    stripped = text.strip()
+    if stripped and text_layer_quality(stripped) < PAGE_TEXT_MIN_QUALITY:
+        return True
+    if len(stripped) >= PAGE_TEXT_MIN_CHARS:
+        return False
+    return has_images
+
+
+def ocr_dpi(page_size: Optional[Tuple[float, float]]) -> int:
+    """Render DPI for a page of (width, height) points: OCR_DPI, lowered for pages over OCR_MAX_PAGE_MEGAPIXELS"""
+    if not page_size or page_size[0] <= 0 or page_size[1] <= 0:
+        return OCR_DPI
+    square_inches = (page_size[0] / 72) * (page_size[1] / 72)
+    fitting = int(math.sqrt(OCR_MAX_PAGE_MEGAPIXELS * 1_000_000 / square_inches))
+    return max(1, min(OCR_DPI, fitting))
+
+
+def ink_density(image: Any) -> float:
+    """
+    Share of ink pixels on a page image, measured on a thumbnail (about
+    400 pixels on the short side) so it costs a few milliseconds.
+    
+    The background level is the thumbnail's median brightness, so gray
+    scanner paper and dark separator sheets both count as background, and
+    downscaling averages isolated scanner specks away.
+    """
+    gray = image if image.mode == "L" else image.convert("L")
+    thumbnail = gray.reduce(max(1, min(gray.size) // 400))
+    histogram = thumbnail.histogram()
+    total = sum(histogram)
+    if not total:
+        return 0.0
+    
+    seen = 0
+    background = 0
+    for level, count in enumerate(histogram):
+        seen += count
+        if seen * 2 >= total:
+            background = level
+            break
+    return sum(histogram[:max(0, background - INK_CONTRAST)]) / total
+
+
+def pdf_input(source: PDFSource) -> Any:
+    """What pdfplumber.open and PyPDF2.PdfReader accept for a PDFSource"""
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+
+@dataclass
+class TextLayer:
+    text: str
+    has_images: bool
+    size: Optional[Tuple[float, float]] = None  # (width, height) in points
+
+
+@dataclass
+class PageText:
+    page_number: int  # 1-based
+    text: str
+    source: str  # "text" (the PDF's text layer), "ocr", "blank" (rendered, too little ink to OCR) or "empty"
+
+
+@dataclass
+class ExtractionResult:
+    pages: List[PageText] = field(default_factory=list)
+    
+    @property
+    def sections(self) -> List[str]:
+        return [page_section(page.page_number, page.text) for page in self.pages if page.text]
+    
+    @property
+    def text(self) -> str:
+        return PAGE_SEPARATOR.join(self.sections)
+    
+    def source_counts(self) -> Dict[str, int]:
+        counts = {"text": 0, "ocr": 0, "blank": 0, "empty": 0}
+        for page in self.pages:
+            counts[page.source] += 1
+        return counts
+
 class PDFProcessor:
     """Process PDF documents and extract text content."""
     
@@ -30,6 +172,9 @@ class PDFProcessor:
         # Configure Tesseract path for Windows if needed
         if self.ocr_available:
             self._configure_tesseract()
+        
+        # Recognizes the pages of a scanned PDF concurrently
+        self.ocr_engine = ParallelOCREngine(cache=ocr_cache) if self.ocr_available else None
     
     def _configure_tesseract(self):
         """Configure Tesseract path for different operating systems"""
@@ -61,7 +206,7 @@ class PDFProcessor:
     
     def extract_text(self, file_path: str) -> str:
         """
-        Extract text from PDF file using multiple methods for better coverage.
+        Extract text from a PDF file, OCR'ing only the pages that need it.
         
         Args:
             file_path: Path to the PDF file
@@ -70,71 +215,11 @@ class PDFProcessor:
             Extracted text content
         """
         try:
-            # Try pdfplumber first (better for complex layouts)
-            text = self._extract_with_pdfplumber(file_path)
-            if text and len(text.strip()) > 100:  # Ensure we got meaningful content
-                return text
-            
-            # Fallback to PyPDF2
-            text = self._extract_with_pypdf2(file_path)
-            if text and len(text.strip()) > 100:
-                return text
-            
-            # Final fallback to OCR for scanned documents
-            if self.ocr_available:
-                logger.info(f"Text extraction failed, trying OCR for {file_path}")
-                text = self._extract_with_ocr(file_path)
-                if text and len(text.strip()) > 50:  # Lower threshold for OCR
-                    return text
-            
-            # If all methods fail, return empty string
-            logger.warning(f"Failed to extract meaningful text from {file_path}")
-            return ""
-            
+            return self._extracted_text(self.extract_pages(file_path), file_path)
         except Exception as e:
             logger.error(f"Error extracting text from {file_path}: {str(e)}")
             return ""
     
-    def _extract_with_pdfplumber(self, file_path: str) -> str:
-        """Extract text using pdfplumber (better for complex layouts)."""
-        try:
-            text_parts = []
-            with pdfplumber.open(file_path) as pdf:
-                for page_num, page in enumerate(pdf.pages):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text_parts.append(f"--- Page {page_num + 1} ---\n{page_text}")
-                    except Exception as e:
-                        logger.warning(f"Error extracting text from page {page_num + 1}: {str(e)}")
-                        continue
-            
-            return "\n\n".join(text_parts)
-        except Exception as e:
-            logger.warning(f"pdfplumber extraction failed: {str(e)}")
-            return ""
-    
-    def _extract_with_pypdf2(self, file_path: str) -> str:
-        """Extract text using PyPDF2 (fallback method)."""
-        try:
-            text_parts = []
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page_num, page in enumerate(pdf_reader.pages):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text_parts.append(f"--- Page {page_num + 1} ---\n{page_text}")
-                    except Exception as e:
-                        logger.warning(f"Error extracting text from page {page_num + 1}: {str(e)}")
-                        continue
-            
-            return "\n\n".join(text_parts)
-        except Exception as e:
-            logger.warning(f"PyPDF2 extraction failed: {str(e)}")
-            return ""
-    
     def chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
         """
         Split text into overlapping chunks for better context preservation.
@@ -176,48 +261,9 @@ class PDFProcessor:
         
         return chunks
 
-    def _extract_with_pdfplumber_bytes(self, file_content: bytes) -> str:
-        """Extract text using pdfplumber from bytes content."""
-        try:
-            text_parts = []
-            with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-                for page_num, page in enumerate(pdf.pages):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text_parts.append(f"--- Page {page_num + 1} ---\n{page_text}")
-                    except Exception as e:
-                        logger.warning(f"Error extracting text from page {page_num + 1}: {str(e)}")
-                        continue
-            
-            return "\n\n".join(text_parts)
-        except Exception as e:
-            logger.warning(f"pdfplumber bytes extraction failed: {str(e)}")
-            return ""
-
-    def _extract_with_pypdf2_bytes(self, file_content: bytes) -> str:
-        """Extract text using PyPDF2 from bytes content."""
-        try:
-            text_parts = []
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-            
-            for page_num, page in enumerate(pdf_reader.pages):
-                try:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_parts.append(f"--- Page {page_num + 1} ---\n{page_text}")
-                except Exception as e:
-                    logger.warning(f"PyPDF2 bytes extraction failed: {str(e)}")
-                    continue
-            
-            return "\n\n".join(text_parts)
-        except Exception as e:
-            logger.warning(f"PyPDF2 bytes extraction failed: {str(e)}")
-            return ""
-
     def extract_text_from_bytes(self, file_content: bytes) -> str:
         """
-        Extract text from PDF bytes content using multiple methods for better coverage.
+        Extract text from PDF bytes content, OCR'ing only the pages that need it.
         
         Args:
             file_content: PDF file content as bytes
@@ -226,31 +272,122 @@ class PDFProcessor:
             Extracted text content
         """
         try:
-            # Try pdfplumber first (better for complex layouts)
-            text = self._extract_with_pdfplumber_bytes(file_content)
-            if text and len(text.strip()) > 100:  # Ensure we got meaningful content
-                return text
-            
-            # Fallback to PyPDF2
-            text = self._extract_with_pypdf2_bytes(file_content)
-            if text and len(text.strip()) > 100:
-                return text
-            
-            # Final fallback to OCR for scanned documents
-            if self.ocr_available:
-                logger.info("Text extraction failed, trying OCR for bytes content")
-                text = self._extract_with_ocr_bytes(file_content)
-                if text and len(text.strip()) > 50:  # Lower threshold for OCR
-                    return text
-            
-            # If all methods fail, return empty string
-            logger.warning(f"Failed to extract meaningful text from bytes content")
-            return ""
-            
+            return self._extracted_text(self.extract_pages(file_content), "bytes content")
         except Exception as e:
             logger.error(f"Error extracting text from bytes content: {str(e)}")
             return ""
 
+    def _extracted_text(self, result: ExtractionResult, name: str) -> str:
+        counts = result.source_counts()
+        logger.info(
+            f"Extracted {len(result.pages)} pages from {name}: {counts['text']} from the text layer, "
+            f"{counts['ocr']} with OCR, {counts['blank']} blank (OCR skipped), {counts['empty']} without text"
+        )
+        text = result.text
+        if not text.strip():
+            logger.warning(f"Failed to extract meaningful text from {name}")
+            return ""
+        return text
+
+    def extract_pages(self, source: PDFSource, first_page: int = 1, last_page: Optional[int] = None) -> ExtractionResult:
+        """
+        Extract pages first_page..last_page (1-based, inclusive) of a PDF.
+        
+        The PDF is parsed once: each page's text layer is read with
+        pdfplumber and classified with page_needs_ocr, and only the pages
+        without a usable text layer are rendered and OCR'd. A mixed PDF
+        (typed pages plus scanned signature pages) keeps both kinds.
+        Joining the sections of consecutive windows with PAGE_SEPARATOR
+        gives the same text as extracting the whole PDF.
+        """
+        layers = self._read_text_layers(source, first_page, last_page)
+        if not layers:
+            # Neither parser could read the PDF; rendering it may still work
+            ocr_results = self._ocr_pages(source, None, first_page, last_page) if self.ocr_available else {}
+            return ExtractionResult([
+                PageText(page_number, page.text, "ocr" if page.text else "blank" if page.skipped else "empty")
+                for page_number, page in ocr_results.items()
+            ])
+        
+        ocr_sizes = {
+            page_number: layer.size
+            for page_number, layer in layers.items()
+            if page_needs_ocr(layer.text, layer.has_images)
+        }
+        ocr_results = self._ocr_pages(source, ocr_sizes) if ocr_sizes and self.ocr_available else {}
+        
+        result = ExtractionResult()
+        for page_number, layer in layers.items():
+            text = layer.text
+            ocr_page = ocr_results.get(page_number)
+            ocr_text = ocr_page.text if ocr_page else ""
+            # A short but clean text layer is kept if OCR read even less
+            if ocr_text and (text_layer_quality(text) < PAGE_TEXT_MIN_QUALITY or len(ocr_text) >= len(text.strip())):
+                result.pages.append(PageText(page_number, ocr_text, "ocr"))
+            elif text.strip():
+                result.pages.append(PageText(page_number, text, "text"))
+            elif ocr_page is not None and ocr_page.skipped:
+                result.pages.append(PageText(page_number, "", "blank"))
+            else:
+                result.pages.append(PageText(page_number, "", "empty"))
+        return result
+
+    def _read_text_layers(self, source: PDFSource, first_page: int = 1, last_page: Optional[int] = None) -> Dict[int, TextLayer]:
+        """Page number -> the page's text layer, in page order"""
+        try:
+            layers: Dict[int, TextLayer] = {}
+            unreadable = []
+            # Only the window's pages are loaded
+            window = list(range(first_page, last_page + 1)) if last_page else None
+            with pdfplumber.open(pdf_input(source), pages=window) as pdf:
+                for page in pdf.pages:
+                    if page.page_number < first_page:
+                        continue
+                    size = (float(page.width), float(page.height))
+                    try:
+                        layers[page.page_number] = TextLayer(page.extract_text() or "", bool(page.images), size)
+                    except Exception as e:
+                        logger.warning(f"Error extracting text from page {page.page_number}: {str(e)}")
+                        layers[page.page_number] = TextLayer("", True, size)
+                        unreadable.append(page.page_number)
+                    finally:
+                        # Drop the page's parsed layout objects
+                        page.close()
+            
+        except Exception as e:
+            logger.warning(f"pdfplumber extraction failed: {str(e)}")
+        else:
+            if unreadable:
+                # Only the pages pdfplumber failed on are read again
+                try:
+                    layers.update(self._pypdf2_text_layers(source, unreadable))
+                except Exception as e:
+                    logger.warning(f"PyPDF2 extraction failed: {str(e)}")
+            return layers
+        
+        try:
+            reader = PyPDF2.PdfReader(pdf_input(source))
+            last_page = min(last_page or len(reader.pages), len(reader.pages))
+            return self._pypdf2_text_layers(reader, list(range(first_page, last_page + 1)))
+        except Exception as e:
+            logger.warning(f"PyPDF2 extraction failed: {str(e)}")
+            return {}
+
+    def _pypdf2_text_layers(self, source: Any, page_numbers: List[int]) -> Dict[int, TextLayer]:
+        reader = source if isinstance(source, PyPDF2.PdfReader) else PyPDF2.PdfReader(pdf_input(source))
+        layers = {}
+        for page_number in page_numbers:
+            text, size = "", None
+            try:
+                page = reader.pages[page_number - 1]
+                size = (float(page.mediabox.width), float(page.mediabox.height))
+                text = page.extract_text() or ""
+            except Exception as e:
+                logger.warning(f"PyPDF2 could not extract page {page_number}: {str(e)}")
+            # Images are not inspected here; a page without text is OCR'd
+            layers[page_number] = TextLayer(text, True, size)
+        return layers
+
     def split_into_chunks(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[Dict[str, Any]]:
         """
         Split text into overlapping chunks with metadata for vector search.
@@ -266,39 +403,8 @@ class PDFProcessor:
         if not text:
             return []
         
-        chunks = []
-        start = 0
-        chunk_index = 0
-        
-        while start < len(text):
-            end = start + chunk_size
-            
-            # If this isn't the last chunk, try to break at a sentence boundary
-            if end < len(text):
-                # Look for sentence endings within the last 100 characters
-                search_start = max(start, end - 100)
-                for i in range(search_start, end):
-                    if text[i] in '.!?':
-                        end = i + 1
-                        break
-            
-            chunk_text = text[start:end].strip()
-            if chunk_text:
-                chunks.append({
-                    "text": chunk_text,
-                    "chunk_index": chunk_index,
-                    "start_char": start,
-                    "end_char": end,
-                    "length": len(chunk_text)
-                })
-                chunk_index += 1
-            
-            # Move start position, accounting for overlap
-            start = end - overlap
-            if start >= len(text):
-                break
-        
-        return chunks
+        chunker = IncrementalChunker(chunk_size, overlap)
+        return chunker.feed(text) + chunker.finish()
     
     def get_document_info(self, file_path: str) -> dict:
         """
@@ -356,49 +462,7 @@ class PDFProcessor:
         Returns:
             Extracted text content from OCR
         """
-        if not self.ocr_available:
-            logger.warning("OCR not available")
-            return ""
-        
-        try:
-            logger.info(f"Starting OCR extraction for {file_path}")
-            
-            # Convert PDF pages to images
-            images = convert_from_path(file_path, dpi=300)  # Higher DPI for better OCR
-            logger.info(f"Converted PDF to {len(images)} images")
-            
-            text_parts = []
-            for page_num, image in enumerate(images):
-                try:
-                    logger.info(f"Processing page {page_num + 1} with OCR")
-                    
-                    # Preprocess image for better OCR
-                    processed_image = self._preprocess_image_for_ocr(image)
-                    
-                    # Extract text using Tesseract
-                    page_text = pytesseract.image_to_string(
-                        processed_image,
-                        lang='eng',  # English language
-                        config='--psm 6'  # Assume uniform block of text
-                    )
-                    
-                    if page_text.strip():
-                        text_parts.append(f"--- Page {page_num + 1} ---\n{page_text.strip()}")
-                        logger.info(f"Extracted {len(page_text)} characters from page {page_num + 1}")
-                    else:
-                        logger.warning(f"No text extracted from page {page_num + 1}")
-                        
-                except Exception as e:
-                    logger.warning(f"Error processing page {page_num + 1} with OCR: {str(e)}")
-                    continue
-            
-            result = "\n\n".join(text_parts)
-            logger.info(f"OCR extraction completed. Total text length: {len(result)}")
-            return result
-            
-        except Exception as e:
-            logger.error(f"OCR extraction failed for {file_path}: {str(e)}")
-            return ""
+        return self._extract_all_with_ocr(file_path, file_path)
     
     def _extract_with_ocr_bytes(self, file_content: bytes) -> str:
         """
@@ -410,49 +474,146 @@ class PDFProcessor:
         Returns:
             Extracted text content from OCR
         """
+        return self._extract_all_with_ocr(file_content, "bytes content")
+    
+    def _extract_all_with_ocr(self, source: PDFSource, name: str) -> str:
+        """OCR every page, ignoring any text layer"""
         if not self.ocr_available:
             logger.warning("OCR not available")
             return ""
         
+        logger.info(f"Starting OCR extraction for {name}")
+        pages = self._ocr_pages(source, None)
+        result = PAGE_SEPARATOR.join(page_section(page_number, page.text) for page_number, page in pages.items() if page.text)
+        logger.info(f"OCR extraction completed. Total text length: {len(result)}")
+        return result
+    
+    def _ocr_pages(
+        self,
+        source: PDFSource,
+        page_sizes: Optional[Dict[int, Optional[Tuple[float, float]]]],
+        first_page: int = 1,
+        last_page: Optional[int] = None
+    ) -> Dict[int, OCRPageResult]:
+        """
+        Render and OCR the pages in page_sizes (page number -> size in
+        points, None if unknown), or all of first_page..last_page when
+        page_sizes is None; page number -> result, in page order.
+        Blank pages are skipped (see ink_density).
+        
+        Pages are rendered and recognized OCR_RENDER_WINDOW at a time,
+        consecutive pages with the same DPI in one pdf2image call.
+        """
+        if page_sizes is None:
+            page_sizes = self._page_sizes(source, first_page, last_page)
+        if page_sizes is None:
+            # Unknown page count; render whatever pdf2image finds in one go
+            windows = [[(first_page, last_page, OCR_DPI)]]
+        else:
+            windows = self._render_windows(page_sizes)
+        
+        results: Dict[int, OCRPageResult] = {}
+        for runs in windows:
+            with tempfile.TemporaryDirectory(prefix="ocr-") as folder:
+                paths: List[str] = []
+                numbers: List[int] = []
+                dpis: Dict[str, int] = {}
+                for run_first, run_last, dpi in runs:
+                    try:
+                        rendered = self._render_pages(source, run_first, run_last, dpi, folder)
+                    except Exception as e:
+                        logger.error(f"Rendering pages {run_first}-{run_last or 'end'} for OCR failed: {str(e)}")
+                        continue
+                    paths.extend(rendered)
+                    numbers.extend(range(run_first, run_first + len(rendered)))
+                    dpis.update((path, dpi) for path in rendered)
+                logger.info(f"Rendered {len(paths)} PDF pages for OCR")
+                
+                def page_digest(path: str) -> str:
+                    return file_digest(path, dpis[path], OCR_PREPROCESSING)
+                
+                # Each page image is loaded by the worker that recognizes it and released right after;
+                # pages already in the OCR cache are never loaded
+                pages = self.ocr_engine.recognize_pages(
+                    paths,
+                    preprocess=self._load_page_for_ocr,
+                    page_numbers=numbers,
+                    page_digest=page_digest
+                )
+            
+            for page in pages:
+                results[page.page_number] = page
+                if page.text:
+                    logger.info(f"Extracted {len(page.text)} characters from page {page.page_number}")
+                elif page.skipped:
+                    logger.info(f"Skipped page {page.page_number} ({page.skipped})")
+                elif not page.error:
+                    logger.warning(f"No text extracted from page {page.page_number}")
+        return results
+    
+    def _render_windows(self, page_sizes: Dict[int, Optional[Tuple[float, float]]]) -> List[List[Tuple[int, int, int]]]:
+        """Pages split into windows of OCR_RENDER_WINDOW, each a list of (first page, last page, dpi) runs"""
+        numbers = sorted(page_sizes)
+        windows = []
+        for start in range(0, len(numbers), max(1, OCR_RENDER_WINDOW)):
+            runs: List[Tuple[int, int, int]] = []
+            for page_number in numbers[start:start + max(1, OCR_RENDER_WINDOW)]:
+                dpi = ocr_dpi(page_sizes[page_number])
+                if runs and runs[-1][1] == page_number - 1 and runs[-1][2] == dpi:
+                    runs[-1] = (runs[-1][0], page_number, dpi)
+                else:
+                    runs.append((page_number, page_number, dpi))
+            windows.append(runs)
+        return windows
+    
+    def _page_sizes(self, source: PDFSource, first_page: int, last_page: Optional[int]) -> Optional[Dict[int, Optional[Tuple[float, float]]]]:
+        """Sizes of pages first_page..last_page from PyPDF2, or from pdfinfo (page count only) if PyPDF2 cannot read the PDF"""
         try:
-            logger.info("Starting OCR extraction for bytes content")
-            
-            # Convert PDF pages to images
-            images = convert_from_bytes(file_content, dpi=300)  # Higher DPI for better OCR
-            logger.info(f"Converted PDF to {len(images)} images")
-            
-            text_parts = []
-            for page_num, image in enumerate(images):
-                try:
-                    logger.info(f"Processing page {page_num + 1} with OCR")
-                    
-                    # Preprocess image for better OCR
-                    processed_image = self._preprocess_image_for_ocr(image)
-                    
-                    # Extract text using Tesseract
-                    page_text = pytesseract.image_to_string(
-                        processed_image,
-                        lang='eng',  # English language
-                        config='--psm 6'  # Assume uniform block of text
-                    )
-                    
-                    if page_text.strip():
-                        text_parts.append(f"--- Page {page_num + 1} ---\n{page_text.strip()}")
-                        logger.info(f"Extracted {len(page_text)} characters from page {page_num + 1}")
-                    else:
-                        logger.warning(f"No text extracted from page {page_num + 1}")
-                        
-                except Exception as e:
-                    logger.warning(f"Error processing page {page_num + 1} with OCR: {str(e)}")
-                    continue
-            
-            result = "\n\n".join(text_parts)
-            logger.info(f"OCR extraction completed. Total text length: {len(result)}")
-            return result
-            
+            reader = PyPDF2.PdfReader(pdf_input(source))
+            last_page = min(last_page or len(reader.pages), len(reader.pages))
+            return self._pypdf2_page_sizes(reader, first_page, last_page)
+        except Exception:
+            pass
+        try:
+            info = pdfinfo_from_bytes(source) if isinstance(source, bytes) else pdfinfo_from_path(source)
+            last_page = min(last_page or int(info["Pages"]), int(info["Pages"]))
+            return {page_number: None for page_number in range(first_page, last_page + 1)}
         except Exception as e:
-            logger.error(f"OCR extraction failed for bytes content: {str(e)}")
-            return ""
+            logger.warning(f"Could not read the page count for OCR: {str(e)}")
+            return None
+    
+    def _pypdf2_page_sizes(self, reader: Any, first_page: int, last_page: int) -> Dict[int, Optional[Tuple[float, float]]]:
+        sizes: Dict[int, Optional[Tuple[float, float]]] = {}
+        for page_number in range(first_page, last_page + 1):
+            try:
+                mediabox = reader.pages[page_number - 1].mediabox
+                sizes[page_number] = (float(mediabox.width), float(mediabox.height))
+            except Exception:
+                sizes[page_number] = None
+        return sizes
+    
+    def _render_pages(self, source: PDFSource, first_page: int, last_page: Optional[int], dpi: int, folder: str) -> List[str]:
+        """Render pages to grayscale image files in folder; returns their paths in page order"""
+        options = dict(
+            dpi=dpi,
+            first_page=first_page,
+            last_page=last_page,
+            grayscale=True,
+            output_folder=folder,
+            paths_only=True,
+            thread_count=self.ocr_engine.page_workers
+        )
+        if isinstance(source, bytes):
+            return convert_from_bytes(source, **options)
+        return convert_from_path(source, **options)
+    
+    def _load_page_for_ocr(self, path: str):
+        image = Image.open(path)
+        # Reads the pixels and closes the file
+        image.load()
+        if ink_density(image) <= OCR_BLANK_PAGE_MAX_INK:
+            raise SkipPage("blank")
+        return self._preprocess_image_for_ocr(image)
     
     def _preprocess_image_for_ocr(self, image):
         """
@@ -490,4 +651,81 @@ class PDFProcessor:
         Returns:
             True if OCR is available, False otherwise
         """
-        return self.ocr_available
\ No newline at end of file
+        return self.ocr_available
+
+
+class IncrementalChunker:
+    """
+    split_into_chunks for text that arrives in pieces (e.g. page by page).
+    
+    A chunk is emitted as soon as the text after it is known, and only the
+    text from the next chunk's start on is kept, so memory stays bounded by
+    roughly one chunk plus the latest piece. Feeding a text in any number
+    of pieces yields exactly the chunks split_into_chunks gives for the
+    whole text, offsets included.
+    """
+    
+    def __init__(self, chunk_size: int = 1000, overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.buffer = ""  # Text from absolute position self.offset on
+        self.offset = 0
+        self.start = 0  # Absolute start of the next chunk
+        self.chunk_index = 0
+        self.finished = False
+    
+    def feed(self, piece: str) -> List[Dict[str, Any]]:
+        """Add text; returns the chunks that are now complete"""
+        self.buffer += piece
+        return self._emit(final=False)
+    
+    def finish(self) -> List[Dict[str, Any]]:
+        """No more text; returns the remaining chunks"""
+        return self._emit(final=True)
+    
+    def _emit(self, final: bool) -> List[Dict[str, Any]]:
+        chunks = []
+        buffer, offset = self.buffer, self.offset
+        text_length = offset + len(buffer)
+        
+        while not self.finished and self.start < text_length:
+            start = self.start
+            end = start + self.chunk_size
+            
+            # If this isn't the last chunk, try to break at a sentence boundary
+            if end < text_length:
+                # Look for sentence endings within the last 100 characters
+                search_start = max(start, end - 100)
+                for i in range(search_start, end):
+                    if buffer[i - offset] in '.!?':
+                        end = i + 1
+                        break
+            elif not final:
+                # More text may still extend this chunk
+                break
+            
+            chunk_text = buffer[start - offset:end - offset].strip()
+            if chunk_text:
+                # Offsets of the stripped text, so overlapping chunks can be merged exactly
+                chunk_start = offset + buffer.index(chunk_text, start - offset)
+                chunks.append({
+                    "text": chunk_text,
+                    "chunk_index": self.chunk_index,
+                    "start_char": chunk_start,
+                    "end_char": chunk_start + len(chunk_text),
+                    "length": len(chunk_text)
+                })
+                self.chunk_index += 1
+            
+            # Move start position, accounting for overlap
+            self.start = end - self.overlap
+            if self.start >= text_length:
+                self.finished = final
+                break
+        
+        # Text before the next chunk's start is never looked at again
+        keep_from = min(self.start, text_length)
+        if keep_from > offset:
+            self.buffer = buffer[keep_from - offset:]
+            self.offset = keep_from
+        return chunks
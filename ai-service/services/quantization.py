@@ -0,0 +1,102 @@
+"""
+Binary (1-bit scalar) quantization of chunk embeddings with exact re-ranking.
+
+For policies with many chunks the exact float32 scan is memory-bound.
+Each embedding is reduced to the signs of its mean-centered components,
+packed 64 per word: 1536 dimensions become 192 bytes instead of 6 KB.
+A first pass ranks rows by Hamming distance to the query's bits using
+popcount. The best few hundred candidates are then re-scored exactly
+against the float32 rows, which keeps recall@k close to the exact path.
+
+NumPy has no BLAS kernel for int8 dot products, so int8 codes measured
+slower than the float32 scan. Bit codes with popcount do not have that
+problem.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Sequence, Tuple
+import numpy as np
+
+from services.vector_index import normalize_vector, score_top_k, top_k_indices
+
+QUANTIZED_SEARCH_MIN_ROWS = int(os.getenv("QUANTIZED_SEARCH_MIN_ROWS", "2000"))
+QUANTIZED_RERANK_CANDIDATES = int(os.getenv("QUANTIZED_RERANK_CANDIDATES", "200"))
+
+# Popcount of every byte value, for NumPy versions without np.bitwise_count
+_POPCOUNT_TABLE = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+@dataclass
+class QuantizedMatrix:
+    """Sign bits of mean-centered rows, packed into uint64 words"""
+    codes: np.ndarray
+    center: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.center.nbytes)
+
+
+def _pack_signs(vectors: np.ndarray) -> np.ndarray:
+    """Pack the sign bits of each row into uint64 words (rows padded to 64 bits)"""
+    vectors = np.atleast_2d(vectors)
+    padding = (-vectors.shape[1]) % 64
+    bits = vectors > 0
+    if padding:
+        bits = np.pad(bits, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(np.packbits(bits, axis=1)).view(np.uint64)
+
+
+def quantize_matrix(matrix: np.ndarray) -> QuantizedMatrix:
+    """Quantize a normalized float32 matrix to packed sign bits around its mean"""
+    center = np.asarray(matrix.mean(axis=0), dtype=np.float32)
+    # Blocks bound the centered float32 temporary to a few MB
+    blocks = [_pack_signs(matrix[start:start + 4096] - center) for start in range(0, matrix.shape[0], 4096)]
+    return QuantizedMatrix(codes=np.vstack(blocks), center=center)
+
+
+def hamming_distances(quantized: QuantizedMatrix, query: np.ndarray) -> np.ndarray:
+    """Hamming distance between a query's sign bits and every quantized row"""
+    query_code = _pack_signs(query - quantized.center)[0]
+    difference = np.bitwise_xor(quantized.codes, query_code)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(difference).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT_TABLE[difference.view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+
+def score_top_k_quantized(
+    matrix: np.ndarray,
+    quantized: QuantizedMatrix,
+    query_embedding: Sequence[float],
+    k: int,
+    rerank_candidates: int = QUANTIZED_RERANK_CANDIDATES
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k rows via a Hamming candidate pass followed by exact cosine re-ranking.
+
+    Returns:
+        (indices, scores) for the k best rows, best first, with exact scores
+    """
+    query = normalize_vector(query_embedding)
+    if query.shape[0] != matrix.shape[1]:
+        raise ValueError(f"Query dimension {query.shape[0]} does not match embedding dimension {matrix.shape[1]}")
+
+    distances = hamming_distances(quantized, query)
+    candidate_count = min(max(k, rerank_candidates), distances.shape[0])
+    if candidate_count < distances.shape[0]:
+        candidates = np.argpartition(distances, candidate_count - 1)[:candidate_count]
+    else:
+        candidates = np.arange(distances.shape[0])
+    candidates.sort()  # Ascending row order keeps the float32 gather sequential
+
+    exact = np.asarray(matrix[candidates]) @ query
+    best = top_k_indices(exact, k)
+    return candidates[best], exact[best]
+
+
+def score_embeddings(embeddings, query_embedding: Sequence[float], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Score an EmbeddingMatrix, using its quantized codes when it has them"""
+    if embeddings.quantized is not None:
+        return score_top_k_quantized(embeddings.matrix, embeddings.quantized, query_embedding, k)
+    return score_top_k(embeddings.matrix, query_embedding, k)
@@ -0,0 +1,196 @@
+"""
+Chunking sized in embedding tokens
+- Chunks hold at most CHUNK_TOKENS tokens of the embedding model's tiktoken
+  encoding and overlap by CHUNK_OVERLAP_TOKENS, so every chunk costs about
+  the same to embed and none is cut off by the model
+- Sentence boundaries are found with one regex pass over the text; each
+  chunk ends at the last boundary in its final quarter (found with bisect),
+  or at the token limit when there is none
+- Chunks have the same fields as IncrementalChunker's (text, chunk_index,
+  start_char, end_char, length) plus token_count, and are fed the same way
+  (feed pieces, then finish), so the streaming ingest path can use either
+- Tokens are carried over between pieces rather than re-encoded from a
+  chunk's start, so feeding a text page by page gives the same tokens, and
+  chunks, as feeding it whole
+
+The character chunker (PDFProcessor.split_into_chunks / IncrementalChunker)
+is still used with CHUNKER=characters.
+"""
+
+import os
+import re
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Any, Dict, List
+import numpy as np
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "48"))
+
+# A chunk ends at a sentence boundary if one falls in this last share of it
+CHUNK_BOUNDARY_WINDOW = 0.25
+
+# Sentence ends (with closing quotes or brackets) followed by whitespace, and paragraph breaks;
+# a boundary is the position right after the match
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*(?=\s)|\n[ \t]*\n")
+
+# Whitespace before the last word; tokens from here on may still merge with text fed later
+LAST_WORD = re.compile(r"\s\S*\s*\Z")
+
+# A single space between two words; tiktoken's pre-tokenizer always splits right before it,
+# so the text on either side can be encoded on its own
+ENCODE_CUT = re.compile(r"(?<=\S) (?=\S)")
+
+
+def token_starts(encoding: Any, text: str, tokens: List[int]) -> List[int]:
+    """
+    Character position where each token of text starts (a token that
+    begins inside a multi-byte character gets that character's position,
+    as with Encoding.decode_with_offsets, which is several times slower)
+    """
+    byte_starts = list(accumulate((len(token) for token in encoding.decode_tokens_bytes(tokens)), initial=0))[:-1]
+    if text.isascii():
+        return byte_starts
+    data = np.frombuffer(text.encode("utf-8", "surrogatepass"), dtype=np.uint8)
+    # Index of the character each byte belongs to; continuation bytes are 10xxxxxx
+    char_at_byte = np.cumsum((data & 0xC0) != 0x80) - 1
+    return char_at_byte[byte_starts].tolist()
+
+
+class TokenChunker:
+    """
+    Splits text into chunks of at most chunk_tokens tokens.
+
+    Only the text from the next chunk's start on is kept, so memory stays
+    bounded by roughly one chunk plus the latest piece. Its tokens up to the
+    last ENCODE_CUT before the final word are kept as tokens; only the text
+    after them is encoded again when a piece arrives. Re-encoding from a
+    chunk's start instead could split differently (a chunk may start inside
+    a word, or inside a multi-byte character). A chunk is cut only once the
+    text after its end is known well enough that later pieces cannot change
+    its tokens.
+    """
+
+    def __init__(self, encoding: Any, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+        if not 0 <= overlap_tokens < chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        self.encoding = encoding
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.boundary_window = max(1, int(chunk_tokens * CHUNK_BOUNDARY_WINDOW))
+        self.buffer = ""  # Text from absolute position self.offset on, starting with the next chunk
+        self.offset = 0
+        # Tokens of the buffer up to self.settled_chars (which later pieces cannot change) and their
+        # positions in the buffer; the text after them is encoded again on every piece
+        self.tokens: List[int] = []
+        self.starts: List[int] = []
+        self.settled_chars = 0
+        self.next_start = 0  # Index in self.tokens of the next chunk's first token
+        self.chunk_index = 0
+        self.finished = False
+
+    def feed(self, piece: str) -> List[Dict[str, Any]]:
+        """Add text; returns the chunks that are now complete"""
+        self.buffer += piece
+        return self._emit(final=False)
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """No more text; returns the remaining chunks"""
+        return self._emit(final=True)
+
+    def _emit(self, final: bool) -> List[Dict[str, Any]]:
+        chunks: List[Dict[str, Any]] = []
+        buffer = self.buffer
+        if self.finished or not buffer:
+            return chunks
+
+        tail = buffer[self.settled_chars:]
+        tail_tokens = self.encoding.encode(tail, disallowed_special=())
+        tokens = self.tokens + tail_tokens
+        starts = self.starts + [self.settled_chars + start for start in token_starts(self.encoding, tail, tail_tokens)]
+        token_count = len(tokens)
+        # Character position of every token edge, including the end of the text
+        edges = starts + [len(buffer)]
+        boundaries = [match.end() for match in SENTENCE_END.finditer(buffer)]
+
+        settled = len(self.tokens)
+        if final:
+            usable = token_count
+        else:
+            last_word = LAST_WORD.search(buffer)
+            stable_chars = last_word.start() if last_word else 0
+            # A chunk edge needs a settled token on both sides of it
+            usable = bisect_right(starts, stable_chars) - 2
+            # Tokens before the last cut in the settled text are kept; a token always starts at a cut
+            # (looked for only shortly before stable_chars; without one nothing more is settled this time)
+            cut = None
+            for cut in ENCODE_CUT.finditer(buffer, max(self.settled_chars, stable_chars - 256), stable_chars):
+                pass
+            if cut is not None:
+                position = bisect_right(starts, cut.start()) - 1
+                if starts[position] == cut.start():
+                    settled = position
+
+        start = self.next_start
+        while start < token_count:
+            end = start + self.chunk_tokens
+            if end >= token_count:
+                if not final:
+                    # More text may still extend this chunk
+                    break
+                end = token_count
+            else:
+                if end > usable:
+                    break
+                # Last sentence boundary in the chunk's final window, moved back onto a token edge
+                window_start = edges[max(start + 1, end - self.boundary_window)]
+                position = bisect_right(boundaries, edges[end]) - 1
+                if position >= 0 and boundaries[position] >= window_start:
+                    # (tokens inside one multi-byte character share an edge, so never past end)
+                    end = max(start + 1, min(end, bisect_right(edges, boundaries[position]) - 1))
+
+            raw = buffer[edges[start]:edges[end]]
+            chunk_text = raw.strip()
+            if chunk_text:
+                # Offsets of the stripped text, so overlapping chunks can be merged exactly
+                chunk_start = self.offset + edges[start] + len(raw) - len(raw.lstrip())
+                chunks.append({
+                    "text": chunk_text,
+                    "chunk_index": self.chunk_index,
+                    "start_char": chunk_start,
+                    "end_char": chunk_start + len(chunk_text),
+                    "length": len(chunk_text),
+                    "token_count": end - start
+                })
+                self.chunk_index += 1
+
+            if end >= token_count:
+                self.finished = True
+                start = token_count
+                break
+            # Move start back by the overlap, always moving forward
+            start = max(end - self.overlap_tokens, start + 1)
+
+        # Text and tokens before the next chunk's start are never looked at again
+        carry_from = min(start, settled)
+        keep_from = edges[carry_from]
+        self.tokens = tokens[carry_from:settled]
+        self.starts = [position - keep_from for position in starts[carry_from:settled]]
+        self.settled_chars = edges[settled] - keep_from
+        self.next_start = start - carry_from
+        self.buffer = buffer[keep_from:]
+        self.offset += keep_from
+        return chunks
+
+
+def split_into_token_chunks(
+    text: str,
+    encoding: Any,
+    chunk_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS
+) -> List[Dict[str, Any]]:
+    """Token-sized chunks of a whole text, with metadata for vector search"""
+    if not text:
+        return []
+    chunker = TokenChunker(encoding, chunk_tokens, overlap_tokens)
+    return chunker.feed(text) + chunker.finish()
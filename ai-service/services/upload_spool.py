@@ -0,0 +1,85 @@
+"""
+Spooling uploaded PDFs to temporary files
+- Uploads are copied to a temporary file in fixed-size blocks instead of
+  being read into memory, so memory does not grow with the number of
+  concurrent uploads times the file size
+- The size limit (PDF_MAX_SIZE_MB) is checked against the declared size
+  before anything is copied, and again while copying for bodies that do
+  not declare one
+- Extractors then open the spooled file by path (pdfplumber, PyPDF2 and
+  pdf2image all accept one), so the PDF is never held as bytes and never
+  copied into io.BytesIO per parser
+"""
+
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Optional
+
+# Uploads are copied this many bytes at a time
+SPOOL_BLOCK_SIZE = 1024 * 1024
+
+# Largest accepted PDF; 0 disables the limit
+PDF_MAX_SIZE_BYTES = int(float(os.getenv("PDF_MAX_SIZE_MB", "50")) * 1024 * 1024)
+
+
+class UploadTooLargeError(Exception):
+    """The upload exceeds PDF_MAX_SIZE_MB; the message is safe to show to the client"""
+
+
+def upload_size_error(size: int, max_bytes: int) -> UploadTooLargeError:
+    return UploadTooLargeError(
+        f"File is {size / (1024 * 1024):.1f} MB; the limit is {max_bytes / (1024 * 1024):g} MB"
+    )
+
+
+@dataclass
+class SpooledUpload:
+    path: str
+    size: int
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.remove()
+
+
+async def spool_upload(
+    upload: Any,
+    max_bytes: int = PDF_MAX_SIZE_BYTES,
+    suffix: str = ".pdf",
+    directory: Optional[str] = os.getenv("UPLOAD_SPOOL_DIR") or None
+) -> SpooledUpload:
+    """
+    Copy an UploadFile to a temporary file, SPOOL_BLOCK_SIZE bytes at a
+    time. Raises UploadTooLargeError (leaving no file behind) if the upload
+    is larger than max_bytes. Use the result as a context manager, or call
+    remove(), to delete the file.
+    """
+    declared = getattr(upload, "size", None)
+    if max_bytes > 0 and declared is not None and declared > max_bytes:
+        raise upload_size_error(declared, max_bytes)
+
+    descriptor, path = tempfile.mkstemp(suffix=suffix, prefix="upload-", dir=directory)
+    size = 0
+    try:
+        with os.fdopen(descriptor, "wb") as spool:
+            while True:
+                block = await upload.read(SPOOL_BLOCK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if max_bytes > 0 and size > max_bytes:
+                    raise upload_size_error(size, max_bytes)
+                spool.write(block)
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledUpload(path, size)
@@ -0,0 +1,99 @@
+"""
+Vectorized similarity scoring for policy chunk embeddings
+- Stacks a document's embeddings into one contiguous float32 matrix
+- Pre-normalizes rows so cosine similarity is a single matrix-vector product
+- Selects top-k with argpartition instead of sorting every score
+"""
+
+from typing import List, Sequence, Tuple
+import numpy as np
+
+
+def normalize_vector(vector: Sequence[float]) -> np.ndarray:
+    """Return a unit-length float32 copy of a single embedding"""
+    array = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(array))
+    if norm == 0.0:
+        return array
+    return array / norm
+
+
+def build_embedding_matrix(embeddings: Sequence[Sequence[float]]) -> np.ndarray:
+    """
+    Stack embeddings into a C-contiguous float32 matrix with unit-length rows.
+
+    Zero vectors are left as zeros so they score 0.0 instead of NaN.
+    """
+    if len(embeddings) == 0:
+        return np.empty((0, 0), dtype=np.float32)
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim != 2:
+        raise ValueError(f"Embeddings must all have the same dimension, got array of shape {matrix.shape}")
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    matrix /= norms
+    return np.ascontiguousarray(matrix)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, ordered best first"""
+    count = scores.shape[0]
+    if count == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= count:
+        return np.argsort(-scores, kind="stable")
+
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def score_top_k(matrix: np.ndarray, query_embedding: Sequence[float], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score every row of a normalized embedding matrix against a query.
+
+    Returns:
+        (indices, scores) for the k best rows, best first
+    """
+    if matrix.shape[0] == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    query = normalize_vector(query_embedding)
+    if query.shape[0] != matrix.shape[1]:
+        raise ValueError(f"Query dimension {query.shape[0]} does not match embedding dimension {matrix.shape[1]}")
+
+    scores = matrix @ query
+    indices = top_k_indices(scores, k)
+    return indices, scores[indices]
+
+
+def score_top_k_batch(matrix: np.ndarray, query_embeddings: Sequence[Sequence[float]], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score several queries against a normalized embedding matrix with one
+    matrix-matrix product.
+
+    Returns:
+        (indices, scores), each of shape (queries, min(k, rows)), best first per query
+    """
+    queries = build_embedding_matrix(query_embeddings)
+    count = matrix.shape[0]
+    if count == 0 or queries.shape[0] == 0:
+        return np.empty((queries.shape[0], 0), dtype=np.int64), np.empty((queries.shape[0], 0), dtype=np.float32)
+    if queries.shape[1] != matrix.shape[1]:
+        raise ValueError(f"Query dimension {queries.shape[1]} does not match embedding dimension {matrix.shape[1]}")
+
+    scores = queries @ np.asarray(matrix).T
+    k = min(k, count)
+    if k < count:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(count), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    indices = np.take_along_axis(candidates, order, axis=1)
+    return indices, np.take_along_axis(scores, indices, axis=1)
+
+
+def valid_embedding_rows(chunks: List[dict]) -> List[int]:
+    """Positions of chunks that actually carry an embedding"""
+    return [i for i, chunk in enumerate(chunks) if chunk.get("embedding") is not None and len(chunk["embedding"]) > 0]
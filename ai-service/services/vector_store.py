@@ -0,0 +1,274 @@
+"""
+Optional on-disk vector store shared by every uvicorn worker on a node.
+
+Each policy's normalized float32 embedding matrix is written to a segment
+file and opened with np.memmap, so all worker processes read the same
+pages through the OS page cache instead of each holding its own copy.
+
+Layout under VECTOR_STORE_DIR:
+
+    <user_id>/<document_id>.<generation>.f32   raw row-major float32 rows
+    <user_id>/<document_id>.<generation>.bits  packed sign-bit codes (large policies only)
+    <user_id>/<document_id>.json               manifest: segment file, rows,
+                                               dimension, the chunk id
+                                               stored at each row offset and
+                                               the policy's chunk sync version
+
+MongoDB stays the source of truth: segments are (re)built from
+policy_chunks on a miss and deleted whenever a policy's chunks change.
+Files are written to a temporary name and renamed into place, so readers
+never see a partial segment or manifest. A manifest records the policy's
+chunk sync version (chunk_sync_versions) its rows were read at; one older
+than the current version is treated as missing, so a segment built from
+chunks read just before another worker's write never hides that write.
+Segments of a policy that the final manifest does not name (left by a
+writer that lost the rename to a concurrent one) are removed by whoever
+renames a manifest last.
+
+Every open segment holds a mapping and a file descriptor (two with sign-bit
+codes), so at most VECTOR_STORE_MAX_OPEN_SEGMENTS are kept open per process,
+least recently used closed first.
+"""
+
+import os
+import json
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from bson import ObjectId
+
+from services.matrix_cache import EmbeddingMatrix
+from services.quantization import QuantizedMatrix
+
+
+class MmapVectorStore:
+    def __init__(self, root_dir: str, max_open: int = 256):
+        self.root_dir = root_dir
+        self.max_open = max_open
+        # (manifest path) -> (manifest mtime, chunk sync version, EmbeddingMatrix backed by np.memmap),
+        # least recently used first
+        self._open: "OrderedDict[str, Tuple[float, int, EmbeddingMatrix]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def load_document(self, user_id: str, document_id: str, version: int = 0) -> Optional[EmbeddingMatrix]:
+        """
+        Memory-map a policy's segment, or None if it has not been built yet
+        or was built before chunk sync version `version`
+        """
+        manifest_path = self._manifest_path(user_id, document_id)
+
+        try:
+            mtime = os.stat(manifest_path).st_mtime
+        except FileNotFoundError:
+            self._open.pop(manifest_path, None)
+            self.misses += 1
+            return None
+
+        opened = self._open.get(manifest_path)
+        if opened is not None and opened[0] == mtime:
+            if opened[1] < version:
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._open.move_to_end(manifest_path)
+            self.hits += 1
+            return opened[2]
+
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version", 0) < version:
+                # Built from chunks read before the policy's latest write; the caller rebuilds it
+                self._open.pop(manifest_path, None)
+                self.stale += 1
+                self.misses += 1
+                return None
+
+            user_dir = os.path.dirname(manifest_path)
+            shape = (manifest["rows"], manifest["dim"])
+            matrix = np.memmap(os.path.join(user_dir, manifest["file"]), dtype=np.float32, mode="r", shape=shape)
+            
+            quantized = None
+            if manifest.get("codes_file"):
+                quantized = QuantizedMatrix(
+                    codes=np.memmap(
+                        os.path.join(user_dir, manifest["codes_file"]),
+                        dtype=np.uint64,
+                        mode="r",
+                        shape=(manifest["rows"], manifest["code_words"])
+                    ),
+                    center=np.asarray(manifest["center"], dtype=np.float32)
+                )
+        except (FileNotFoundError, ValueError, KeyError) as e:
+            # Segment replaced or removed by another worker between reads
+            print(f"⚠️ Vector Store: Could not open segment for policy {document_id}: {e}")
+            self._open.pop(manifest_path, None)
+            self.misses += 1
+            return None
+
+        embeddings = EmbeddingMatrix(
+            matrix=matrix,
+            chunk_ids=[self._parse_id(chunk_id) for chunk_id in manifest["chunk_ids"]],
+            quantized=quantized
+        )
+        self._open[manifest_path] = (mtime, manifest.get("version", 0), embeddings)
+        self._open.move_to_end(manifest_path)
+        while len(self._open) > self.max_open:
+            self._open.popitem(last=False)
+            self.evictions += 1
+        self.hits += 1
+        return embeddings
+
+    def write_document(
+        self,
+        user_id: str,
+        document_id: str,
+        matrix: np.ndarray,
+        chunk_ids: List[Any],
+        quantized: Optional[QuantizedMatrix] = None,
+        version: int = 0
+    ) -> None:
+        """
+        Persist a policy's normalized matrix as a new segment and point its
+        manifest at it; version is the chunk sync version the rows were read at
+        """
+        user_dir = self._user_dir(user_id)
+        os.makedirs(user_dir, exist_ok=True)
+
+        manifest_path = self._manifest_path(user_id, document_id)
+        previous_files = self._read_segment_names(manifest_path)
+
+        segment_base = f"{self._safe_name(document_id)}.{uuid.uuid4().hex[:12]}"
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        manifest = {
+            "document_id": document_id,
+            "file": self._write_segment(user_dir, f"{segment_base}.f32", matrix),
+            "rows": int(matrix.shape[0]),
+            "dim": int(matrix.shape[1]),
+            "chunk_ids": [str(chunk_id) for chunk_id in chunk_ids],
+            "version": version
+        }
+        if quantized is not None:
+            manifest["codes_file"] = self._write_segment(user_dir, f"{segment_base}.bits", np.ascontiguousarray(quantized.codes))
+            manifest["code_words"] = int(quantized.codes.shape[1])
+            manifest["center"] = [float(value) for value in quantized.center]
+
+        tmp_manifest = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_manifest, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_manifest, manifest_path)
+
+        for previous_file in previous_files:
+            self._remove_quietly(os.path.join(user_dir, previous_file))
+        self._remove_orphaned_segments(user_dir, document_id, manifest_path)
+
+    def delete_document(self, user_id: str, document_id: str) -> None:
+        """Remove a policy's manifest and segments so the next read rebuilds from MongoDB"""
+        manifest_path = self._manifest_path(user_id, document_id)
+        segment_names = self._read_segment_names(manifest_path)
+        self._remove_quietly(manifest_path)
+        for segment_name in segment_names:
+            self._remove_quietly(os.path.join(self._user_dir(user_id), segment_name))
+        self._open.pop(manifest_path, None)
+
+    def delete_document_for_all_users(self, document_id: str) -> None:
+        if not os.path.isdir(self.root_dir):
+            return
+        for user_dir in os.listdir(self.root_dir):
+            if os.path.exists(self._manifest_path(user_dir, document_id)):
+                self.delete_document(user_dir, document_id)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "mmap",
+            "root_dir": self.root_dir,
+            "open_segments": len(self._open),
+            "max_open_segments": self.max_open,
+            "evictions": self.evictions,
+            "stale": self.stale,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def _user_dir(self, user_id: str) -> str:
+        return os.path.join(self.root_dir, self._safe_name(user_id))
+
+    def _manifest_path(self, user_id: str, document_id: str) -> str:
+        return os.path.join(self._user_dir(user_id), f"{self._safe_name(document_id)}.json")
+
+    def _remove_orphaned_segments(self, user_dir: str, document_id: str, manifest_path: str) -> None:
+        """
+        Delete the policy's segments the current manifest does not name.
+        Segments newer than the manifest are kept: they belong to a writer
+        that has not renamed its manifest yet (and cleans up after itself).
+        """
+        try:
+            manifest_mtime = os.stat(manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        current = set(self._read_segment_names(manifest_path))
+        prefix = f"{self._safe_name(document_id)}."
+        for name in os.listdir(user_dir):
+            if not name.startswith(prefix) or not name.endswith((".f32", ".bits")) or name in current:
+                continue
+            path = os.path.join(user_dir, name)
+            try:
+                if os.stat(path).st_mtime_ns < manifest_mtime:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _read_segment_names(self, manifest_path: str) -> List[str]:
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            return [name for name in (manifest.get("file"), manifest.get("codes_file")) if name]
+        except (FileNotFoundError, ValueError):
+            return []
+
+    @staticmethod
+    def _write_segment(user_dir: str, segment_name: str, array: np.ndarray) -> str:
+        segment_path = os.path.join(user_dir, segment_name)
+        tmp_segment = f"{segment_path}.{os.getpid()}.tmp"
+        with open(tmp_segment, "wb") as f:
+            f.write(memoryview(array).cast("B"))
+        os.replace(tmp_segment, segment_path)
+        return segment_name
+
+    @staticmethod
+    def _remove_quietly(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _safe_name(value: str) -> str:
+        return "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in str(value))
+
+    @staticmethod
+    def _parse_id(value: str) -> Any:
+        return ObjectId(value) if ObjectId.is_valid(value) else value
+
+
+def create_vector_store() -> Optional[MmapVectorStore]:
+    """Build the configured vector store backend (None keeps matrices in process memory)"""
+    backend = os.getenv("VECTOR_STORE_BACKEND", "memory").lower()
+    if backend == "mmap":
+        root_dir = os.getenv("VECTOR_STORE_DIR", os.path.join(os.getcwd(), "vector_store"))
+        print(f"🔍 Vector Store: Using memory-mapped segments in {root_dir}")
+        return MmapVectorStore(root_dir, max_open=int(os.getenv("VECTOR_STORE_MAX_OPEN_SEGMENTS", "256")))
+    if backend != "memory":
+        print(f"⚠️ Unknown VECTOR_STORE_BACKEND '{backend}', falling back to in-process memory")
+    return None
+
+
+# Global vector store instance (None for the default in-memory backend)
+vector_store = create_vector_store()